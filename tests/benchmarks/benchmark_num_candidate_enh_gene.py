@@ -0,0 +1,60 @@
+"""
+Throughput of determine_num_candidate_enh_gene on a real chr22 ABC run and on a
+synthetic whole-genome-sized input.
+
+Run from the repo root:
+    python tests/benchmarks/benchmark_num_candidate_enh_gene.py \
+        --abc_predictions tests/test_output/generic/K562_chr22/Predictions/EnhancerPredictionsAllPutative.tsv.gz
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import click
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(__file__), "../../workflow/scripts/feature_tables"),
+)
+from gen_new_features import add_midpoint, determine_num_candidate_enh_gene
+from synthetic import make_enhancer_list, make_predictions, read_chr_sizes
+
+
+def time_num_candidate_enh_gene(label, pred_df, n_runs):
+    pred_df = pred_df[pred_df["class"] != "promoter"].copy()
+    add_midpoint(pred_df)
+    timings = []
+    with tempfile.TemporaryDirectory() as results_dir:
+        for _ in range(n_runs):
+            start = time.perf_counter()
+            determine_num_candidate_enh_gene(pred_df, results_dir)
+            timings.append(time.perf_counter() - start)
+    best = min(timings)
+    print(
+        f"{label}: {len(pred_df):,} pairs in {best:.2f}s "
+        f"({len(pred_df) / best:,.0f} pairs/s, best of {n_runs})"
+    )
+
+
+@click.command()
+@click.option("--abc_predictions", help="EnhancerPredictionsAllPutative for chr22")
+@click.option("--n_enhancers", type=int, default=150_000)
+@click.option("--n_genes", type=int, default=20_000)
+@click.option("--window", type=int, default=5_000_000)
+@click.option("--n_runs", type=int, default=3)
+def main(abc_predictions, n_enhancers, n_genes, window, n_runs):
+    if abc_predictions:
+        pred_df = pd.read_csv(abc_predictions, sep="\t")
+        time_num_candidate_enh_gene("chr22", pred_df, n_runs)
+
+    enhancer_list = make_enhancer_list(n_enhancers, read_chr_sizes())
+    pred_df = make_predictions(enhancer_list, n_genes, window=window)
+    time_num_candidate_enh_gene("synthetic genome", pred_df, n_runs)
+
+
+if __name__ == "__main__":
+    main()
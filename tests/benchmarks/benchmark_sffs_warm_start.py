@@ -0,0 +1,91 @@
+"""
+Forward sequential feature selection with and without warm-started candidate fits,
+on the DNase/ATAC feature sets in resources/feature_tables. Uses a synthetic
+CRISPR training table unless --crispr_features_file is given.
+
+Run from the repo root:
+    python tests/benchmarks/benchmark_sffs_warm_start.py
+"""
+
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(__file__), "../../workflow/scripts/model_training"),
+)
+from forward_sequential_feature_selection import SFFS
+from synthetic import make_training_dataset
+from training_functions import ChromosomeFolds, training_features
+
+FEATURE_TABLES = os.path.join(
+    os.path.dirname(__file__), "../../resources/feature_tables/final_feature_set_*.tsv"
+)
+# config/config_training.yaml default_params
+PARAMS = {
+    "solver": "lbfgs",
+    "fit_intercept": True,
+    "penalty": None,
+    "max_iter": 100_000_000,
+    "class_weight": None,
+    "tol": 1e-4,
+    "random_state": 0,
+}
+
+
+def time_sffs(df_dataset, feature_table, polynomial, warm_start, n_runs):
+    timings = []
+    for _ in range(n_runs):
+        start = time.perf_counter()
+        X, feature_list = training_features(df_dataset, feature_table, 0.01, polynomial)
+        Y = df_dataset["Regulated"].values.astype(np.int64)
+        folds = ChromosomeFolds.from_dataset(df_dataset, X, Y)
+        with contextlib.redirect_stdout(io.StringIO()):
+            selected = SFFS(
+                folds, feature_list, "ENCODE-rE2G", PARAMS, warm_start=warm_start
+            )
+        timings.append(time.perf_counter() - start)
+    return min(timings), selected
+
+
+@click.command()
+@click.option(
+    "--crispr_features_file", help="for_training ... features_NAfilled.tsv.gz"
+)
+@click.option("--n_pairs", type=int, default=10_000)
+@click.option("--polynomial", type=bool, default=False)
+@click.option("--n_runs", type=int, default=3)
+def main(crispr_features_file, n_pairs, polynomial, n_runs):
+    if crispr_features_file:
+        crispr_df = pd.read_csv(crispr_features_file, sep="\t")
+    for feature_table_file in sorted(glob.glob(FEATURE_TABLES)):
+        feature_table = pd.read_csv(feature_table_file, sep="\t")
+        if crispr_features_file:
+            df_dataset = crispr_df
+        else:
+            df_dataset = make_training_dataset(feature_table["feature"], n_pairs)
+
+        cold, cold_selected = time_sffs(
+            df_dataset, feature_table, polynomial, False, n_runs
+        )
+        warm, warm_selected = time_sffs(
+            df_dataset, feature_table, polynomial, True, n_runs
+        )
+        name = os.path.basename(feature_table_file)
+        print(
+            f"{name}: cold {cold:.2f}s, warm {warm:.2f}s ({cold / warm:.2f}x, best of {n_runs}), "
+            f"same selection order: {np.array_equal(cold_selected, warm_selected)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Synthetic ABC outputs (EnhancerList / EnhancerPredictionsAllPutative) and CRISPR
+training datasets for benchmarks and tests. Sizes are configurable so the same
+generator covers chr22-sized and whole-genome-sized inputs.
+"""
+
+import numpy as np
+import pandas as pd
+
+CHR_SIZES_FILE = "reference/GRCh38_EBV.no_alt.chrom.sizes.tsv"
+MAIN_CHROMOSOMES = ["chr" + str(x) for x in range(1, 23)] + ["chrX"]
+
+
+def read_chr_sizes(chr_sizes_file=CHR_SIZES_FILE, chromosomes=MAIN_CHROMOSOMES):
+    sizes = pd.read_csv(chr_sizes_file, sep="\t", names=["chr", "size"])
+    sizes = sizes[sizes["chr"].isin(chromosomes)]
+    return dict(zip(sizes["chr"], sizes["size"]))
+
+
+def make_enhancer_list(n_enhancers, chr_sizes, seed=0):
+    rng = np.random.default_rng(seed)
+    chroms = np.array(list(chr_sizes.keys()))
+    lengths = np.array(list(chr_sizes.values()), dtype=np.float64)
+    chrom_idx = np.sort(
+        rng.choice(len(chroms), size=n_enhancers, p=lengths / lengths.sum())
+    )
+    start = (rng.random(n_enhancers) * (lengths[chrom_idx] - 5000)).astype(np.int64)
+    end = start + rng.integers(150, 2500, size=n_enhancers)
+    df = pd.DataFrame({"chr": chroms[chrom_idx], "start": start, "end": end})
+    df = df.sort_values(["chr", "start"]).reset_index(drop=True)
+    df["class"] = np.where(rng.random(len(df)) < 0.05, "promoter", "distal")
+    df["name"] = (
+        df["class"]
+        + "|"
+        + df["chr"]
+        + ":"
+        + df["start"].astype(str)
+        + "-"
+        + df["end"].astype(str)
+    )
+    df["activity_base"] = rng.gamma(1.5, 2.0, size=len(df))
+    return df
+
+
+def make_predictions(enhancer_list, n_genes, window=5_000_000, seed=0):
+    """
+    Pair every enhancer with all genes whose TSS lies within window of the enhancer
+    midpoint, mirroring how ABC builds EnhancerPredictionsAllPutative.
+    """
+    rng = np.random.default_rng(seed)
+    midpoint = ((enhancer_list["start"] + enhancer_list["end"]) // 2).to_numpy()
+    gene_chr_idx = rng.choice(len(enhancer_list), size=n_genes)
+    genes = pd.DataFrame(
+        {
+            "chr": enhancer_list["chr"].to_numpy()[gene_chr_idx],
+            "TargetGeneTSS": midpoint[gene_chr_idx]
+            + rng.integers(-200_000, 200_000, size=n_genes),
+        }
+    )
+    genes["TargetGeneTSS"] = genes["TargetGeneTSS"].clip(lower=1)
+    genes["TargetGene"] = ["GENE" + str(i) for i in range(n_genes)]
+    genes["TargetGeneIsExpressed"] = rng.random(n_genes) < 0.6
+
+    pairs = []
+    for chrom, enh in enhancer_list.groupby("chr", sort=False):
+        enh_mid = ((enh["start"] + enh["end"]) // 2).to_numpy()
+        chr_genes = genes[genes["chr"] == chrom]
+        tss = chr_genes["TargetGeneTSS"].to_numpy()
+        lo = np.searchsorted(enh_mid, tss - window)
+        hi = np.searchsorted(enh_mid, tss + window)
+        n_per_gene = hi - lo
+        gene_idx = np.repeat(np.arange(len(chr_genes)), n_per_gene)
+        enh_idx = np.repeat(lo - np.cumsum(n_per_gene) + n_per_gene, n_per_gene)
+        enh_idx += np.arange(n_per_gene.sum())
+        chr_pairs = enh.iloc[enh_idx].reset_index(drop=True)
+        chr_pairs = pd.concat(
+            [chr_pairs, chr_genes.iloc[gene_idx, 1:].reset_index(drop=True)], axis=1
+        )
+        pairs.append(chr_pairs)
+    pred = pd.concat(pairs, ignore_index=True)
+
+    pred_mid = (pred["start"] + pred["end"]) // 2
+    pred["distance"] = (pred_mid - pred["TargetGeneTSS"]).abs()
+    pred["distanceToTSS"] = pred["distance"]
+    pred["isSelfPromoter"] = (pred["class"] == "promoter") & (pred["distance"] < 500)
+    pred["ABC.Score"] = rng.beta(0.5, 20, size=len(pred))
+    pred["ENCODE-rE2G.Score"] = rng.beta(0.5, 10, size=len(pred))
+    return pred
+
+
+def make_training_dataset(feature_list, n_pairs=2000, n_chromosomes=8, seed=0):
+    """
+    CRISPR-style training table: chr, Regulated and one non-negative column per
+    feature, where Regulated depends on the first features through a logistic model
+    so feature selection has signal to find.
+    """
+    rng = np.random.default_rng(seed)
+    X = rng.gamma(0.8, 2.0, size=(n_pairs, len(feature_list)))
+    X[rng.random(X.shape) < 0.05] = 0
+    weights = np.zeros(len(feature_list))
+    weights[: min(3, len(feature_list))] = [1.2, -0.8, 0.5][: len(feature_list)]
+    logit = np.log(X + 0.01) @ weights - 2.5
+    df = pd.DataFrame(X, columns=list(feature_list))
+    df.insert(0, "chr", rng.choice(MAIN_CHROMOSOMES[:n_chromosomes], size=n_pairs))
+    df["Regulated"] = rng.random(n_pairs) < 1 / (1 + np.exp(-logit))
+    return df
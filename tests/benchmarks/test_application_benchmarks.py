@@ -0,0 +1,222 @@
+"""
+pytest-benchmark suite for the model application hot paths (new features, scoring,
+thresholding, BEDPE and stats) on synthetic EnhancerList /
+EnhancerPredictionsAllPutative inputs. Every benchmark records its input rows,
+throughput (rows/s, best round) and peak RSS during one call in extra_info, so
+saved runs can be compared for regressions. pytest-benchmark disables itself under
+pytest-xdist (-n), so run the suite on its own, as CI does; with benchmarking
+disabled each function just runs once.
+
+Scale with environment variables:
+    E2G_BENCHMARK_ENHANCERS  enhancers in the EnhancerList (default 20,000)
+    E2G_BENCHMARK_GENES      genes paired with them (default 2,000)
+    E2G_BENCHMARK_ROUNDS     timed rounds per benchmark (default 3)
+
+Run from the repo root:
+    python -m pytest tests/benchmarks
+    python -m pytest tests/benchmarks --benchmark-autosave
+    python -m pytest tests/benchmarks --benchmark-compare
+"""
+
+import os
+import resource
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+sys.path.insert(0, os.path.dirname(__file__))
+for scripts_dir in ["feature_tables", "model_application"]:
+    sys.path.insert(
+        0,
+        os.path.join(os.path.dirname(__file__), "../../workflow/scripts", scripts_dir),
+    )
+import get_stats
+from gen_new_features import (
+    add_midpoint,
+    determine_num_candidate_enh_gene,
+    determine_num_tss_enh_gene,
+    generate_num_sum_enhancers,
+)
+from process_model_output import write_connections_bedpe_format
+from run_e2g import make_e2g_predictions, read_feature_list
+from synthetic import make_enhancer_list, make_predictions, read_chr_sizes
+from threshold_e2g_predictions import threshold_predictions
+
+REPO_DIR = os.path.join(os.path.dirname(__file__), "../..")
+CHR_SIZES_FILE = os.path.join(REPO_DIR, "reference/GRCh38_EBV.no_alt.chrom.sizes.tsv")
+GENE_TSS_FILE = os.path.join(
+    REPO_DIR, "reference/RefSeqCurated.170308.bed.CollapsedGeneBounds.hg38.TSS500bp.bed"
+)
+MODEL_DIR = os.path.join(REPO_DIR, "models/dhs_megamap")
+N_ENHANCERS = int(os.environ.get("E2G_BENCHMARK_ENHANCERS", 20_000))
+N_GENES = int(os.environ.get("E2G_BENCHMARK_GENES", 2_000))
+ROUNDS = int(os.environ.get("E2G_BENCHMARK_ROUNDS", 3))
+SCORE_COLUMN = "ENCODE-rE2G.Score"
+# get_num_reads is left out: it runs samtools on the accessibility bams
+STATS_FUNCTIONS = [
+    get_stats.get_num_enh,
+    get_stats.get_num_genes,
+    get_stats.get_num_enh_gene_links,
+    get_stats.get_num_genes_with_1_enh_min,
+    get_stats.get_mean_num_genes_per_enh,
+    get_stats.get_mean_num_enh_per_gene,
+    get_stats.get_mean_num_enh_per_gene_no_prom,
+    get_stats.get_mean_log_dist_to_tss,
+    get_stats.get_mean_enh_region_size,
+]
+
+
+def peak_rss_mb(func):
+    """Peak resident memory (MB) of this process while func runs"""
+    try:
+        # resets the peak (VmHWM) to the current RSS
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        # no /proc: ru_maxrss is the peak over the whole process (kB, bytes on macOS)
+        func()
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / (1024**2 if sys.platform == "darwin" else 1024)
+    func()
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+
+def run_benchmark(benchmark, n_rows, func, *args):
+    result = benchmark.pedantic(func, args=args, rounds=ROUNDS, iterations=1)
+    if benchmark.disabled:
+        return result
+    benchmark.extra_info["n_rows"] = n_rows
+    benchmark.extra_info["rows_per_s"] = n_rows / benchmark.stats.stats.min
+    benchmark.extra_info["peak_rss_mb"] = peak_rss_mb(lambda: func(*args))
+    return result
+
+
+@pytest.fixture(scope="module")
+def enhancer_list():
+    return make_enhancer_list(N_ENHANCERS, read_chr_sizes(CHR_SIZES_FILE))
+
+
+@pytest.fixture(scope="module")
+def predictions(enhancer_list):
+    pred = make_predictions(enhancer_list, N_GENES)
+    pred["TargetGeneIsExpressed"] = pred["TargetGeneIsExpressed"].astype(bool)
+    return pred
+
+
+@pytest.fixture(scope="module")
+def input_files(tmp_path_factory, enhancer_list, predictions):
+    tmp_dir = tmp_path_factory.mktemp("abc")
+    enhancer_list_file = tmp_dir / "EnhancerList.txt"
+    predictions_file = tmp_dir / "EnhancerPredictionsAllPutative.tsv"
+    enhancer_list.to_csv(enhancer_list_file, sep="\t", index=False)
+    predictions.to_csv(predictions_file, sep="\t", index=False)
+    return str(enhancer_list_file), str(predictions_file)
+
+
+@pytest.fixture(scope="module")
+def enhancer_pred(predictions):
+    # as gen_new_features.main passes it on
+    pred_df = predictions[predictions["class"] != "promoter"].copy()
+    add_midpoint(pred_df)
+    return pred_df
+
+
+def test_determine_num_candidate_enh_gene(benchmark, enhancer_pred, tmp_path):
+    run_benchmark(
+        benchmark,
+        len(enhancer_pred),
+        determine_num_candidate_enh_gene,
+        enhancer_pred,
+        str(tmp_path),
+    )
+    assert (tmp_path / "NumCandidateEnhGene.tsv").exists()
+
+
+def test_determine_num_tss_enh_gene(benchmark, enhancer_pred, tmp_path):
+    run_benchmark(
+        benchmark,
+        len(enhancer_pred),
+        determine_num_tss_enh_gene,
+        enhancer_pred,
+        GENE_TSS_FILE,
+        str(tmp_path),
+    )
+    assert (tmp_path / "NumTSSEnhGene.tsv").exists()
+
+
+def test_generate_num_sum_enhancers(benchmark, predictions, input_files, tmp_path):
+    enhancer_list_file, predictions_file = input_files
+    run_benchmark(
+        benchmark,
+        len(predictions),
+        generate_num_sum_enhancers,
+        predictions_file,
+        enhancer_list_file,
+        CHR_SIZES_FILE,
+        str(tmp_path),
+    )
+    assert (tmp_path / "NumEnhancersEG5kb.txt").exists()
+
+
+def test_make_e2g_predictions(benchmark, predictions):
+    feature_list = read_feature_list(os.path.join(MODEL_DIR, "feature_table.tsv"))
+    rng = np.random.default_rng(0)
+    df_enhancers = predictions.copy()
+    for feature in feature_list:
+        df_enhancers[feature] = rng.gamma(0.5, 3.0, size=len(df_enhancers))
+    scored = run_benchmark(
+        benchmark,
+        len(df_enhancers),
+        make_e2g_predictions,
+        df_enhancers,
+        feature_list,
+        os.path.join(MODEL_DIR, "model.pkl"),
+        0.01,
+    )
+    assert scored[SCORE_COLUMN].between(0, 1).all()
+
+
+@pytest.mark.parametrize("include_self_promoter", [True, False])
+def test_threshold_predictions(benchmark, predictions, include_self_promoter):
+    filtered = run_benchmark(
+        benchmark,
+        len(predictions),
+        threshold_predictions,
+        predictions,
+        0.1,
+        SCORE_COLUMN,
+        include_self_promoter,
+    )
+    assert (filtered[SCORE_COLUMN] >= 0.1).all()
+
+
+def test_write_connections_bedpe_format(benchmark, predictions, tmp_path):
+    thresholded = predictions[predictions[SCORE_COLUMN] >= 0.05]
+    bedpe_file = str(tmp_path / "predictions.bedpe")
+    run_benchmark(
+        benchmark,
+        len(thresholded),
+        write_connections_bedpe_format,
+        thresholded,
+        bedpe_file,
+        SCORE_COLUMN,
+    )
+    assert os.path.getsize(bedpe_file) > 0
+
+
+@pytest.mark.parametrize(
+    "stats_function", STATS_FUNCTIONS, ids=lambda func: func.__name__
+)
+def test_get_stats(benchmark, predictions, stats_function):
+    thresholded = predictions.loc[
+        predictions[SCORE_COLUMN] >= 0.05, get_stats.STATS_COLUMNS
+    ]
+    value = run_benchmark(benchmark, len(thresholded), stats_function, thresholded)
+    assert np.isfinite(value)
@@ -0,0 +1,155 @@
+import gzip
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(__file__), "../workflow/scripts/model_application"),
+)
+from postprocess_e2g_predictions import threshold_predictions_file
+from run_e2g import load_model, read_feature_list, write_e2g_predictions
+from table_io import iter_table
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), "../models/dhs_megamap")
+EPSILON = 0.01
+CHUNKSIZE = 100
+
+
+def read_text(path):
+    with gzip.open(path, "rt") as f:
+        return f.read()
+
+
+class TestChunkedTables(unittest.TestCase):
+    def feature_table(self, feature_list, n_rows=1000):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame(
+            {
+                "chr": "chr1",
+                "start": np.arange(n_rows) * 1000,
+                "end": np.arange(n_rows) * 1000 + 500,
+                "TargetGene": [f"GENE{i % 37}" for i in range(n_rows)],
+                # integer columns that have missing values in only some chunks
+                "numNearbyEnhancers": rng.integers(0, 20, n_rows).astype(float),
+                "TargetGeneTSS": rng.integers(0, 10**6, n_rows).astype(float),
+                "TargetGeneIsExpressed": rng.random(n_rows) < 0.5,
+            }
+        )
+        for feature in feature_list:
+            df[feature] = rng.integers(0, 50, n_rows).astype(float)
+        df.loc[250:260, "numNearbyEnhancers"] = np.nan
+        df.loc[720, "TargetGeneTSS"] = np.nan
+        df["TargetGeneIsExpressed"] = df["TargetGeneIsExpressed"].astype(object)
+        df.loc[480, "TargetGeneIsExpressed"] = np.nan
+        df.loc[[130, 555], feature_list[0]] = np.nan
+        df.loc[910, feature_list[1]] = np.inf
+        return df
+
+    def test_chunked_matches_unchunked(self) -> None:
+        feature_list = list(
+            read_feature_list(os.path.join(MODEL_DIR, "feature_table.tsv"))
+        )
+        models = [(feature_list, load_model(os.path.join(MODEL_DIR, "model.pkl")))]
+        df = self.feature_table(feature_list)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for ext in ["tsv.gz", "parquet"]:
+                with self.subTest(format=ext):
+                    features_file = os.path.join(tmp_dir, f"features.{ext}")
+                    if ext == "parquet":
+                        # nullable so integer columns with missing values stay integer;
+                        # booleans with missing values stay object, as pandas reads them
+                        df.convert_dtypes(convert_boolean=False).to_parquet(
+                            features_file, index=False
+                        )
+                    else:
+                        df.to_csv(features_file, sep="\t", index=False, na_rep="NA")
+                    whole_file = os.path.join(tmp_dir, f"whole.{ext}.tsv.gz")
+                    chunked_file = os.path.join(tmp_dir, f"chunked.{ext}.tsv.gz")
+                    write_e2g_predictions(features_file, models, EPSILON, [whole_file])
+                    write_e2g_predictions(
+                        features_file, models, EPSILON, [chunked_file], CHUNKSIZE
+                    )
+                    self.assertEqual(read_text(chunked_file), read_text(whole_file))
+
+                    # every column is filled, not only the features
+                    scored = pd.read_csv(whole_file, sep="\t", dtype=str)
+                    self.assertFalse(scored.isna().any().any())
+                    self.assertEqual(scored.loc[480, "TargetGeneIsExpressed"], "0")
+                    self.assertEqual(float(scored.loc[255, "numNearbyEnhancers"]), 0)
+
+    def test_chunks_are_conformed_to_the_first_chunk(self) -> None:
+        n_rows = 1000
+        df = pd.DataFrame(
+            {
+                "start": np.arange(n_rows),
+                "count": pd.array(np.arange(n_rows) % 7, dtype="Int64"),
+                # written without decimals after the first chunk, as R writes them
+                "score": [str(i / 4) if i < 50 else str(i) for i in range(n_rows)],
+                "name": [f"n{i}" for i in range(n_rows)],
+            }
+        )
+        df.loc[870, "count"] = pd.NA
+        df.loc[300:399, "name"] = None
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "table.tsv.gz")
+            df.to_csv(path, sep="\t", index=False)
+            whole = pd.read_csv(path, sep="\t")
+            chunks = list(iter_table(path, CHUNKSIZE))
+            for chunk in chunks:
+                self.assertEqual(chunk["score"].dtype, np.float64)
+                self.assertEqual(chunk["name"].dtype, whole["name"].dtype)
+            # the chunk with a missing count keeps it as a nullable integer
+            self.assertEqual(chunks[8]["count"].dtype, "Int64")
+            self.assertNotIn(".", chunks[8].to_csv(columns=["count"], index=False))
+            pd.testing.assert_frame_equal(
+                pd.concat(chunks, ignore_index=True),
+                whole,
+                check_dtype=False,
+            )
+
+    def test_chunked_thresholding_matches_unchunked(self) -> None:
+        rng = np.random.default_rng(1)
+        n_rows = 1000
+        df = pd.DataFrame(
+            {
+                "chr": "chr1",
+                "start": np.arange(n_rows) * 1000,
+                "end": np.arange(n_rows) * 1000 + 500,
+                "TargetGene": [f"GENE{i % 37}" for i in range(n_rows)],
+                "class": rng.choice(["promoter", "distal", "intergenic"], n_rows),
+                "isSelfPromoter": rng.random(n_rows) < 0.1,
+                "TargetGeneTSS": rng.integers(0, 10**6, n_rows).astype(float),
+                "ENCODE-rE2G.Score": rng.random(n_rows),
+            }
+        )
+        df.loc[720, "TargetGeneTSS"] = np.nan
+        keep_columns = ["chr", "start", "TargetGeneTSS", "ENCODE-rE2G.Score"]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            predictions_file = os.path.join(tmp_dir, "predictions.tsv.gz")
+            df.to_csv(predictions_file, sep="\t", index=False)
+            outputs = {}
+            for chunksize in [0, CHUNKSIZE]:
+                thresholded_file = os.path.join(
+                    tmp_dir, f"thresholded{chunksize}.tsv.gz"
+                )
+                kept = threshold_predictions_file(
+                    predictions_file,
+                    0.5,
+                    "ENCODE-rE2G.Score",
+                    True,
+                    thresholded_file,
+                    keep_columns,
+                    chunksize,
+                )
+                outputs[chunksize] = (read_text(thresholded_file), kept)
+            self.assertEqual(outputs[CHUNKSIZE][0], outputs[0][0])
+            pd.testing.assert_frame_equal(outputs[CHUNKSIZE][1], outputs[0][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
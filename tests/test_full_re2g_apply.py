@@ -13,8 +13,7 @@ from utils import get_biosample_names, get_filtered_dataframe, run_cmd
 logging.basicConfig(level=logging.INFO)
 
 CONFIG_FILE = "tests/config/generic_config.yml"
-with open(CONFIG_FILE, "r") as file:
-    CONFIG = yaml.safe_load(file)
+SHARDED_CONFIG_FILE = "tests/config/sharded_config.yml"
 COLUMNS_TO_COMPARE: Dict[str, type] = {
     "chr": str,
     "start": np.int64,
@@ -25,30 +24,43 @@ COLUMNS_TO_COMPARE: Dict[str, type] = {
     "ABC.Score": np.float64,
     "ENCODE-rE2G.Score": np.float64,
 }
-TEST_OUTPUT_DIR = CONFIG["results_dir"]
-EXPECTED_OUTPUT_DIR = f"tests/expected_output/{CONFIG['TEST_CONFIG_NAME']}"
 ALL_PUTATIVE_PRED_FILE = "dhs_intact_hic/encode_e2g_predictions.tsv.gz"
 THRESHOLDED_PRED_FILE_PATTERN = (
     "dhs_intact_hic/encode_e2g_predictions_threshold*[0-9].tsv.gz"
 )
 
 
+def expected_output_dir(config: Dict) -> str:
+    return f"tests/expected_output/{config['TEST_CONFIG_NAME']}"
+
+
+def load_config(config_file: str) -> Dict:
+    with open(config_file, "r") as file:
+        return yaml.safe_load(file)
+
+
 class TestFullrE2GRun(unittest.TestCase):
-    def compare_all_prediction_file(self, biosample: str, pred_file) -> None:
-        test_file = os.path.join(TEST_OUTPUT_DIR, biosample, pred_file)
-        expected_file = os.path.join(EXPECTED_OUTPUT_DIR, biosample, pred_file)
+    def compare_all_prediction_file(
+        self, config: Dict, biosample: str, pred_file
+    ) -> None:
+        test_file = os.path.join(config["results_dir"], biosample, pred_file)
+        expected_file = os.path.join(expected_output_dir(config), biosample, pred_file)
         print(f"Comparing biosample: {biosample} for pred_file: {pred_file}")
         pd.testing.assert_frame_equal(
             get_filtered_dataframe(test_file, COLUMNS_TO_COMPARE),
             get_filtered_dataframe(expected_file, COLUMNS_TO_COMPARE),
         )
 
-    def compare_thresholded_prediction_file(self, biosample: str) -> None:
+    def compare_thresholded_prediction_file(self, config: Dict, biosample: str) -> None:
         test_files = glob.glob(
-            os.path.join(TEST_OUTPUT_DIR, biosample, THRESHOLDED_PRED_FILE_PATTERN)
+            os.path.join(
+                config["results_dir"], biosample, THRESHOLDED_PRED_FILE_PATTERN
+            )
         )
         expected_files = glob.glob(
-            os.path.join(EXPECTED_OUTPUT_DIR, biosample, THRESHOLDED_PRED_FILE_PATTERN)
+            os.path.join(
+                expected_output_dir(config), biosample, THRESHOLDED_PRED_FILE_PATTERN
+            )
         )
         if len(test_files) != 1:
             raise Exception(
@@ -69,15 +81,16 @@ class TestFullrE2GRun(unittest.TestCase):
         )
 
     def run_test(self, config_file: str) -> None:
+        config = load_config(config_file)
         start = time.time()
         cmd = f"snakemake -j4 -F --configfile {config_file} --use-conda"
         run_cmd(cmd)
         time_taken = time.time() - start
 
-        biosample_names = get_biosample_names(CONFIG["ABC_BIOSAMPLES"])
+        biosample_names = get_biosample_names(config["ABC_BIOSAMPLES"])
         for biosample in biosample_names:
-            self.compare_all_prediction_file(biosample, ALL_PUTATIVE_PRED_FILE)
-            self.compare_thresholded_prediction_file(biosample)
+            self.compare_all_prediction_file(config, biosample, ALL_PUTATIVE_PRED_FILE)
+            self.compare_thresholded_prediction_file(config, biosample)
 
         # Make sure the test doesn't take too long
         # May need to adjust as more biosamples are added, but we should keep
@@ -92,6 +105,10 @@ class TestFullrE2GRun(unittest.TestCase):
     def test_full_re2g_run(self) -> None:
         self.run_test(CONFIG_FILE)
 
+    def test_sharded_re2g_run(self) -> None:
+        # the chromosome-sharded workflow must reproduce the unsharded predictions
+        self.run_test(SHARDED_CONFIG_FILE)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,98 @@
+import glob
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(__file__), "../workflow/scripts/model_application"),
+)
+from model_arrays import (
+    model_arrays_file,
+    model_arrays_from_model,
+    model_digest,
+    predict_proba_arrays,
+    read_model_arrays,
+    read_model_arrays_digest,
+    write_model_arrays,
+)
+from run_e2g import load_model_arrays
+
+MODEL_DIRS = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "../models/*/")))
+EPSILON = 0.01
+
+
+class TestModelArrays(unittest.TestCase):
+    def random_features(self, feature_list, n_rows=5000):
+        rng = np.random.default_rng(0)
+        X = rng.gamma(0.5, 3.0, size=(n_rows, len(feature_list)))
+        X[rng.random(X.shape) < 0.1] = 0
+        return pd.DataFrame(X, columns=feature_list)
+
+    def test_parity_with_predict_proba(self) -> None:
+        self.assertGreater(len(MODEL_DIRS), 0)
+        for model_dir in MODEL_DIRS:
+            with self.subTest(model=os.path.basename(os.path.normpath(model_dir))):
+                trained_model = os.path.join(model_dir, "model.pkl")
+                with open(trained_model, "rb") as f:
+                    model = pickle.load(f)
+                arrays = read_model_arrays(model_arrays_file(trained_model))
+                feature_list = pd.read_csv(
+                    os.path.join(model_dir, "feature_table.tsv"), sep="\t"
+                )["feature"]
+                self.assertEqual(arrays.features, list(feature_list))
+                self.assertEqual(arrays.epsilon, EPSILON)
+
+                # exported arrays are up to date with the pickle
+                self.assertEqual(
+                    read_model_arrays_digest(model_arrays_file(trained_model)),
+                    model_digest(trained_model),
+                )
+                exported = model_arrays_from_model(model, feature_list, EPSILON)
+                np.testing.assert_array_equal(arrays.coef, exported.coef)
+                self.assertEqual(arrays.intercept, exported.intercept)
+
+                X = self.random_features(feature_list)
+                expected = model.predict_proba(np.log(np.abs(X) + EPSILON))[:, 1]
+                np.testing.assert_allclose(
+                    predict_proba_arrays(X, arrays), expected, rtol=1e-12, atol=0
+                )
+                np.testing.assert_allclose(
+                    predict_proba_arrays(X, arrays, dtype=np.float32),
+                    expected,
+                    rtol=1e-4,
+                    atol=1e-6,
+                )
+
+    def test_stale_arrays_are_not_used(self) -> None:
+        model_dir = MODEL_DIRS[0]
+        feature_list = pd.read_csv(
+            os.path.join(model_dir, "feature_table.tsv"), sep="\t"
+        )["feature"]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            trained_model = os.path.join(tmp_dir, "model.pkl")
+            shutil.copy(os.path.join(model_dir, "model.pkl"), trained_model)
+            with open(trained_model, "rb") as f:
+                model = pickle.load(f)
+            arrays = model_arrays_from_model(model, feature_list, EPSILON)
+            stale = arrays._replace(coef=arrays.coef * 2)
+            write_model_arrays(stale, model_arrays_file(trained_model), "0" * 64)
+
+            loaded = load_model_arrays(trained_model, feature_list, EPSILON)
+            np.testing.assert_array_equal(loaded.coef, arrays.coef)
+
+            write_model_arrays(
+                stale, model_arrays_file(trained_model), model_digest(trained_model)
+            )
+            loaded = load_model_arrays(trained_model, feature_list, EPSILON)
+            np.testing.assert_array_equal(loaded.coef, stale.coef)
+
+
+if __name__ == "__main__":
+    unittest.main()
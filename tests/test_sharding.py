@@ -0,0 +1,119 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+for scripts_dir in ["feature_tables", "model_application"]:
+    sys.path.insert(
+        0,
+        os.path.join(os.path.dirname(__file__), "../workflow/scripts", scripts_dir),
+    )
+from gather_shards import gather_shards
+from run_e2g import load_model, read_feature_list, write_e2g_predictions
+from split_by_chromosome import (
+    ENHANCER_LIST_FILE,
+    PREDICTIONS_FILE,
+    split_by_chromosome,
+)
+
+MODEL_DIR = os.path.join(os.path.dirname(__file__), "../models/dhs_megamap")
+EPSILON = 0.01
+# not in sorted order, as in the ABC predictions
+CHROMOSOMES = ["chr2", "chr10", "chr1", "chrX", "chr22"]
+SORT_COLUMNS = ["chr", "start", "end", "TargetGene"]
+SCORE_COLUMN = "ENCODE-rE2G.Score"
+
+
+class TestSharding(unittest.TestCase):
+    def abc_predictions(self, feature_list, n_rows=200):
+        rng = np.random.default_rng(0)
+        dfs = []
+        for chrom in CHROMOSOMES:
+            start = rng.integers(0, 10**6, n_rows)
+            df = pd.DataFrame(
+                {
+                    "chr": chrom,
+                    "start": start,
+                    "end": start + 500,
+                    "name": [f"{chrom}:{s}-{s + 500}" for s in start],
+                    "class": rng.choice(["promoter", "genic", "intergenic"], n_rows),
+                    "TargetGene": [f"GENE{i}" for i in rng.integers(0, 30, n_rows)],
+                    "numNearbyEnhancers": pd.array(
+                        rng.integers(0, 20, n_rows), dtype="Int64"
+                    ),
+                }
+            )
+            for feature in feature_list:
+                df[feature] = rng.gamma(0.5, 3.0, n_rows)
+            dfs.append(df)
+        df = pd.concat(dfs, ignore_index=True)
+        # an integer column with missing values on one chromosome only
+        df.loc[df["chr"] == "chr10", "numNearbyEnhancers"] = pd.NA
+        df.loc[df.index[:5], "numNearbyEnhancers"] = pd.NA
+        return df
+
+    def feature_table(self, abc_file, features_file):
+        # stands in for the feature R scripts, which sort by position
+        # (merge_external_features.R) and infer dtypes per input file
+        df = pd.read_csv(abc_file, sep="\t")
+        df = df.sort_values(SORT_COLUMNS, kind="stable")
+        df.to_csv(features_file, sep="\t", index=False)
+
+    def test_gathered_shards_match_unsharded(self) -> None:
+        feature_list = list(
+            read_feature_list(os.path.join(MODEL_DIR, "feature_table.tsv"))
+        )
+        models = [(feature_list, load_model(os.path.join(MODEL_DIR, "model.pkl")))]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            abc_file = os.path.join(tmp_dir, PREDICTIONS_FILE)
+            enhancer_list_file = os.path.join(tmp_dir, ENHANCER_LIST_FILE)
+            abc = self.abc_predictions(feature_list)
+            abc.to_csv(abc_file, sep="\t", index=False)
+            abc[["chr", "start", "end", "name", "class"]].to_csv(
+                enhancer_list_file, sep="\t", index=False
+            )
+
+            features_file = os.path.join(tmp_dir, "features.tsv.gz")
+            unsharded_file = os.path.join(tmp_dir, "predictions.tsv.gz")
+            self.feature_table(abc_file, features_file)
+            write_e2g_predictions(features_file, models, EPSILON, [unsharded_file])
+
+            split_dir = os.path.join(tmp_dir, "split")
+            chromosomes = split_by_chromosome(abc_file, enhancer_list_file, split_dir)
+            self.assertEqual(chromosomes, sorted(CHROMOSOMES))
+            shard_files = []
+            for chrom in chromosomes:
+                shard_dir = os.path.join(split_dir, chrom)
+                shard_features_file = os.path.join(shard_dir, "features.tsv.gz")
+                shard_file = os.path.join(shard_dir, "predictions.tsv.gz")
+                self.feature_table(
+                    os.path.join(shard_dir, PREDICTIONS_FILE), shard_features_file
+                )
+                write_e2g_predictions(
+                    shard_features_file, models, EPSILON, [shard_file]
+                )
+                shard_files.append(shard_file)
+            gathered_file = os.path.join(tmp_dir, "gathered.tsv.gz")
+            gather_shards(shard_files, gathered_file, chunksize=300)
+
+            unsharded = pd.read_csv(unsharded_file, sep="\t")
+            gathered = pd.read_csv(gathered_file, sep="\t")
+            # scores can differ in the last bits as sklearn scores the shards in
+            # separate matrix products. an integer column with missing values
+            # in some shards is written without decimals in the gathered file,
+            # so values rather than text or dtypes are compared
+            pd.testing.assert_frame_equal(
+                gathered.drop(columns=SCORE_COLUMN),
+                unsharded.drop(columns=SCORE_COLUMN),
+                check_dtype=False,
+            )
+            np.testing.assert_allclose(
+                gathered[SCORE_COLUMN], unsharded[SCORE_COLUMN], rtol=1e-12
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,483 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import scipy
+from sklearn.metrics import precision_recall_curve
+from sklearn.preprocessing import PolynomialFeatures
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "../workflow/scripts/model_training")
+)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "benchmarks"))
+from synthetic import make_training_dataset
+import training_functions
+from training_functions import (
+    CandidateResult,
+    CheckpointJournal,
+    ChromosomeFolds,
+    PRCurve,
+    PolynomialFeatureProvider,
+    ScoreStore,
+    WeightedPRCurve,
+    bootstrap_delta_aupr,
+    bootstrap_precision_at_threshold,
+    evaluate_candidates,
+    permuted_scores,
+    precision_recall_curve_modified,
+    run_journaled,
+    extend_coefs,
+    fit_fold_models,
+    fit_folds,
+    fit_model,
+    select_best_candidate,
+    successive_halving,
+    statistic_aupr,
+    statistic_delta_aupr,
+    statistic_precision_at_threshold,
+    threshold_70_pct_recall,
+    train_and_predict_once,
+)
+from joblib import delayed
+
+FEATURE_TABLE = os.path.join(
+    os.path.dirname(__file__),
+    "../resources/feature_tables/final_feature_set_DNase_hic.tsv",
+)
+PARAMS = {"solver": "lbfgs", "class_weight": None, "penalty": "l2", "max_iter": 1000}
+
+
+class TestTrainAndPredictOnce(unittest.TestCase):
+    def setUp(self):
+        self.feature_list = list(pd.read_csv(FEATURE_TABLE, sep="\t")["feature"])
+        self.df_dataset = make_training_dataset(self.feature_list)
+        self.X = np.log(np.abs(self.df_dataset.loc[:, self.feature_list]) + 0.01)
+        self.Y = self.df_dataset["Regulated"].values.astype(np.int64)
+
+    def scores(self, n_workers):
+        df = train_and_predict_once(
+            self.df_dataset.copy(),
+            self.X,
+            self.Y,
+            self.feature_list,
+            "test",
+            PARAMS,
+            n_workers=n_workers,
+        )
+        return df["test.Score"].to_numpy()
+
+    def test_parallel_folds_match_serial(self):
+        serial = self.scores(n_workers=1)
+        self.assertFalse(np.isnan(serial).any())
+        np.testing.assert_array_equal(self.scores(n_workers=3), serial)
+
+    def test_cached_folds_match_uncached(self):
+        folds = ChromosomeFolds.from_dataset(self.df_dataset, self.X, self.Y)
+        features = self.feature_list[:3]
+        df = train_and_predict_once(
+            self.df_dataset.copy(), self.X, self.Y, features, "test", PARAMS
+        )
+        df_cached = train_and_predict_once(
+            self.df_dataset.copy(),
+            self.X,
+            self.Y,
+            features,
+            "test",
+            PARAMS,
+            folds=folds,
+        )
+        np.testing.assert_allclose(
+            df_cached["test.Score"], df["test.Score"], rtol=1e-10
+        )
+
+    def test_warm_start_converges_to_cold_fit(self):
+        features = self.feature_list[:3]
+        df, fold_coefs = train_and_predict_once(
+            self.df_dataset.copy(),
+            self.X,
+            self.Y,
+            features[:2],
+            "test",
+            PARAMS,
+            return_coefs=True,
+        )
+        init_coefs = extend_coefs(fold_coefs)
+        self.assertEqual(len(init_coefs[0][0]), 3)
+        self.assertEqual(init_coefs[0][0][2], 0)
+
+        cold = train_and_predict_once(
+            self.df_dataset.copy(), self.X, self.Y, features, "test", PARAMS
+        )
+        warm = train_and_predict_once(
+            self.df_dataset.copy(),
+            self.X,
+            self.Y,
+            features,
+            "test",
+            PARAMS,
+            init_coefs=init_coefs,
+        )
+        np.testing.assert_allclose(warm["test.Score"], cold["test.Score"], atol=1e-3)
+
+    def test_parallel_candidates_match_serial(self):
+        folds = ChromosomeFolds.from_dataset(self.df_dataset, self.X, self.Y)
+        candidates = [
+            self.feature_list[:1],
+            self.feature_list[:2],
+            self.feature_list[2:5],
+        ]
+        serial = evaluate_candidates(folds, candidates, PARAMS)
+        parallel = evaluate_candidates(folds, candidates, PARAMS, n_workers=3)
+        for features, result, parallel_result in zip(candidates, serial, parallel):
+            df = train_and_predict_once(
+                self.df_dataset.copy(),
+                self.X,
+                self.Y,
+                features,
+                "test",
+                PARAMS,
+                folds=folds,
+            )
+            np.testing.assert_array_equal(result.scores, df["test.Score"])
+            np.testing.assert_array_equal(parallel_result.scores, result.scores)
+            self.assertEqual(parallel_result.aupr, result.aupr)
+
+    def test_journaled_candidates_are_not_refit(self):
+        folds = ChromosomeFolds.from_dataset(self.df_dataset, self.X, self.Y)
+        candidates = [self.feature_list[:1], self.feature_list[:2]]
+        keys = ["a", "b"]
+        journal = CheckpointJournal(None)
+        results = evaluate_candidates(
+            folds, candidates, PARAMS, journal=journal, keys=keys
+        )
+        expected = evaluate_candidates(folds, candidates, PARAMS)
+        for result, expected_result in zip(results, expected):
+            self.assertIsNone(result.scores)
+            self.assertEqual(result.aupr, expected_result.aupr)
+            self.assertEqual(result.precision, expected_result.precision)
+
+        # a recorded key is read back instead of refitting its candidate
+        journal.record([("a", CandidateResult(None, -1.0, -1.0, []))])
+        results = evaluate_candidates(
+            folds, candidates, PARAMS, journal=journal, keys=keys
+        )
+        self.assertEqual(results[0].aupr, -1.0)
+        self.assertEqual(results[1].aupr, expected[1].aupr)
+
+    def test_select_best_candidate_ties_go_to_last(self):
+        results = [
+            CandidateResult(None, aupr, None, None) for aupr in [0.2, 0.5, 0.1, 0.5]
+        ]
+        self.assertEqual(select_best_candidate(results), 3)
+
+
+class TestChromosomeFolds(unittest.TestCase):
+    def setUp(self):
+        self.df_dataset = make_training_dataset(["a", "b", "c"], n_pairs=200)
+        self.X = self.df_dataset.loc[:, ["a", "b", "c"]]
+        self.Y = self.df_dataset["Regulated"].values
+        self.folds = ChromosomeFolds.from_dataset(self.df_dataset, self.X, self.Y)
+
+    def test_folds_hold_out_each_chromosome(self):
+        self.assertEqual(len(self.folds), self.df_dataset["chr"].nunique())
+        for i, chr in enumerate(self.folds.chr_list):
+            is_test = (self.df_dataset["chr"] == chr).to_numpy()
+            np.testing.assert_array_equal(
+                self.folds.idx_test[i], np.flatnonzero(is_test)
+            )
+            np.testing.assert_array_equal(
+                self.folds.idx_train[i], np.flatnonzero(~is_test)
+            )
+            X_train, Y_train, X_test = self.folds.fold(i, ["c", "a"])
+            np.testing.assert_array_equal(
+                X_train, self.X.loc[~is_test, ["c", "a"]].to_numpy()
+            )
+            np.testing.assert_array_equal(Y_train, self.Y[~is_test])
+            np.testing.assert_array_equal(
+                X_test, self.X.loc[is_test, ["c", "a"]].to_numpy()
+            )
+
+    def test_permuted_scores_leave_folds_untouched(self):
+        X_train_0 = self.folds.X_train[0].copy()
+        scores, _, fitted = fit_folds(
+            self.folds, ["a", "b", "c"], PARAMS, return_models=True
+        )
+        models = fit_fold_models(self.folds, PARAMS)
+        for model, fitted_model in zip(models, fitted):
+            np.testing.assert_array_equal(model.coef_, fitted_model.coef_)
+        unpermuted = self.folds.X[:, 1].copy()
+        for fold_models in [None, models, fitted]:
+            np.testing.assert_allclose(
+                permuted_scores(self.folds, PARAMS, "b", unpermuted, fold_models),
+                scores,
+                rtol=1e-12,
+            )
+            permuted = permuted_scores(
+                self.folds, PARAMS, "b", unpermuted[::-1], fold_models
+            )
+            self.assertFalse(np.allclose(permuted, scores))
+        np.testing.assert_array_equal(self.folds.X_train[0], X_train_0)
+
+
+class TestModelBackends(unittest.TestCase):
+    def setUp(self):
+        self.feature_list = list(pd.read_csv(FEATURE_TABLE, sep="\t")["feature"])
+        df_dataset = make_training_dataset(self.feature_list, n_pairs=2000)
+        X = np.log(np.abs(df_dataset.loc[:, self.feature_list]) + 0.01)
+        self.Y = df_dataset["Regulated"].values.astype(np.int64)
+        self.folds = ChromosomeFolds.from_dataset(df_dataset, X, self.Y)
+
+    def test_backends_fit_and_score_folds(self):
+        for params, linear in [
+            (PARAMS, True),
+            (
+                {"model_backend": "sgd_logistic", "batch_size": 256, "random_state": 0},
+                True,
+            ),
+            ({"model_backend": "hist_gradient_boosting", "max_iter": 20}, False),
+        ]:
+            scores, fold_coefs = fit_folds(self.folds, self.feature_list, params)
+            self.assertTrue(((scores >= 0) & (scores <= 1)).all())
+            self.assertGreater(statistic_aupr(self.Y, scores), self.Y.mean())
+            self.assertEqual(fold_coefs[0] is not None, linear)
+            # warm starts only apply to backends with coefficients
+            warm_scores, _ = fit_folds(
+                self.folds, self.feature_list, params, extend_coefs(fold_coefs, 0)
+            )
+            self.assertEqual(len(warm_scores), len(self.Y))
+            model = fit_model(self.folds.X, self.Y, params)
+            self.assertTrue(type(model).__module__.startswith("sklearn."))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            fit_model(self.folds.X, self.Y, {"model_backend": "svm"})
+
+
+class TestSuccessiveHalving(unittest.TestCase):
+    def test_survivors_get_full_cv(self):
+        feature_list = list(pd.read_csv(FEATURE_TABLE, sep="\t")["feature"])
+        df_dataset = make_training_dataset(feature_list, n_pairs=2000, n_chromosomes=9)
+        X = np.log(np.abs(df_dataset.loc[:, feature_list]) + 0.01)
+        Y = df_dataset["Regulated"].values.astype(np.int64)
+        folds = ChromosomeFolds.from_dataset(df_dataset, X, Y)
+        configs = [dict(PARAMS, C=C) for C in [1e-6, 1e-4, 1e-2, 1, 100]]
+
+        with mock.patch(
+            "training_functions.held_out_scores",
+            wraps=training_functions.held_out_scores,
+        ) as held_out_scores:
+            results = successive_halving(folds, configs, eta=2, min_folds=2)
+        # 5 configs on 2 folds -> best 3 on 4 -> best 2 on 8 -> best 1 on all 9
+        self.assertEqual(sorted(r.n_folds for r in results), [2, 2, 4, 8, 9])
+        # each rung only fits the folds it adds: 5 * 2 + 3 * 2 + 2 * 4 + 1 * 1
+        self.assertEqual(held_out_scores.call_count, 25)
+        best = [k for k, r in enumerate(results) if r.n_folds == len(folds)][0]
+        self.assertNotEqual(best, 0)
+        scores, _ = fit_folds(folds, feature_list, configs[best])
+        self.assertAlmostEqual(results[best].aupr, statistic_aupr(Y, scores))
+
+
+class TestScoreStore(unittest.TestCase):
+    def test_grows_and_materializes_in_order(self):
+        store = ScoreStore(3, capacity=1)
+        store["a.Score"] = [0.1, 0.2, 0.3]
+        store.column("b.Score")[[0, 2]] = [0.5, 0.6]
+        store["c.Score"] = 1
+        self.assertEqual(len(store), 3)
+        self.assertIn("b.Score", store)
+        np.testing.assert_array_equal(store["a.Score"], [0.1, 0.2, 0.3])
+        df = store.to_frame(index=[10, 11, 12])
+        self.assertEqual(list(df.columns), ["a.Score", "b.Score", "c.Score"])
+        self.assertEqual(list(df.index), [10, 11, 12])
+        np.testing.assert_array_equal(df["b.Score"], [0.5, np.nan, 0.6])
+        np.testing.assert_array_equal(df["c.Score"], 1)
+
+
+class TestPolynomialFeatureProvider(unittest.TestCase):
+    def test_matches_sklearn_polynomial_features(self):
+        df_dataset = make_training_dataset(["a", "b", "c"], n_pairs=100)
+        provider = PolynomialFeatureProvider(df_dataset, ["a", "b", "c"], 0.01)
+        poly = PolynomialFeatures(degree=2)
+        X_poly = poly.fit_transform(df_dataset.loc[:, ["a", "b", "c"]])
+        self.assertEqual(provider.names, list(poly.get_feature_names_out()))
+
+        X = provider.frame(["b c", "a^2", "1"])
+        self.assertEqual(len(provider._columns), 3)  # only the requested terms
+        expected = np.log(np.abs(X_poly[:, [8, 4, 0]]) + 0.01)
+        np.testing.assert_array_equal(X.to_numpy(), expected)
+        X_32 = PolynomialFeatureProvider(
+            df_dataset, ["a", "b", "c"], 0.01, dtype=np.float32
+        ).frame()
+        self.assertEqual(X_32.to_numpy().dtype, np.float32)
+
+    def test_lazy_folds_match_eager_folds(self):
+        df_dataset = make_training_dataset(["a", "b", "c"], n_pairs=200)
+        Y = df_dataset["Regulated"].values
+        provider = PolynomialFeatureProvider(df_dataset, ["a", "b", "c"], 0.01)
+        lazy = ChromosomeFolds.from_dataset(df_dataset, provider, Y)
+        eager = ChromosomeFolds.from_dataset(
+            df_dataset,
+            PolynomialFeatureProvider(df_dataset, ["a", "b", "c"], 0.01).frame(),
+            Y,
+        )
+        self.assertEqual(provider._columns, {})
+        feature_list = ["b c", "a", "1"]
+        for i in range(len(eager)):
+            for lazy_block, eager_block in zip(
+                lazy.fold(i, feature_list), eager.fold(i, feature_list)
+            ):
+                np.testing.assert_array_equal(lazy_block, eager_block)
+        self.assertEqual(set(provider._columns), set(feature_list))
+        np.testing.assert_array_equal(
+            fit_folds(lazy, feature_list, PARAMS)[0],
+            fit_folds(eager, feature_list, PARAMS)[0],
+        )
+        np.testing.assert_array_equal(lazy.column("a^2"), eager.column("a^2"))
+
+
+class TestPRCurve(unittest.TestCase):
+    def test_matches_sklearn_curve(self):
+        rng = np.random.default_rng(0)
+        y_true = (rng.random(300) < 0.3).astype(np.int64)
+        for y_pred in [rng.random(300), np.round(rng.random(300), 1)]:
+            expected = precision_recall_curve(y_true, y_pred)
+            curve = precision_recall_curve_modified(y_true, y_pred)
+            for values, expected_values in zip(
+                curve, (expected[0][1:], expected[1][1:], expected[2])
+            ):
+                np.testing.assert_allclose(values, expected_values, atol=1e-15)
+
+    def test_lookups(self):
+        y_true = np.array([1, 0, 1, 0, 0, 1, 0, 0, 1, 0])
+        y_pred = np.array([0.9, 0.8, 0.7, 0.6, 0.5, 0.4, 0.3, 0.2, 0.15, 0.1])
+        curve = PRCurve(y_true, y_pred)
+        # recall is 0.75 at thresholds 0.2, 0.3 and 0.4; the lowest of these is used
+        self.assertEqual(curve.recall[curve.nearest_recall_idx(0.7)], 0.75)
+        self.assertEqual(curve.nearest_recall_idx(0.7), 1)
+        self.assertEqual(curve.threshold_at_recall(0.7), 0.2)
+        self.assertEqual(curve.precision_at_recall(0.7), 3 / 8)
+        self.assertIsNone(curve.threshold_at_recall(1.0))
+        # thresholds closest to 0.25 are 0.2 and 0.3; the lower one is used
+        self.assertEqual(curve.precision_at_threshold(0.25), curve.precision[1])
+        self.assertEqual(curve.precision_at_threshold(0.2), 3 / 8)
+        self.assertEqual(curve.precision_at_threshold(None), 0)
+
+
+class TestBatchedBootstrap(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.y_true = (rng.random(500) < 0.2).astype(np.int64)
+        self.y_pred = rng.random(500) + 0.5 * self.y_true
+        self.y_pred_new = rng.random(500) + 0.8 * self.y_true
+
+    def test_weighted_curve_matches_resampled_statistics(self):
+        rng = np.random.default_rng(1)
+        # rounded scores have ties, the threshold is one of the scores
+        y_pred = np.round(self.y_pred, 2)
+        threshold = threshold_70_pct_recall(self.y_true, y_pred)
+        curve = WeightedPRCurve(self.y_true, y_pred)
+        indices = rng.integers(0, len(y_pred), size=(20, len(y_pred)))
+        W = np.array([np.bincount(idx, minlength=len(y_pred)) for idx in indices])
+        aupr = curve.aupr(W)
+        precision = curve.precision_at_threshold(W, threshold)
+        for i, idx in enumerate(indices):
+            self.assertAlmostEqual(
+                aupr[i], statistic_aupr(self.y_true[idx], y_pred[idx])
+            )
+            self.assertAlmostEqual(
+                precision[i],
+                statistic_precision_at_threshold(
+                    self.y_true[idx], y_pred[idx], threshold
+                ),
+            )
+
+    def test_matches_scipy_bootstrap(self):
+        data = (self.y_true, self.y_pred, self.y_pred_new)
+        expected = scipy.stats.bootstrap(
+            data,
+            statistic_delta_aupr,
+            n_resamples=200,
+            paired=True,
+            confidence_level=0.95,
+            method="BCa",
+            rng=np.random.default_rng(5),
+        )
+        res = bootstrap_delta_aupr(*data, n_resamples=200, random_state=5)
+        np.testing.assert_allclose(
+            res.bootstrap_distribution, expected.bootstrap_distribution, atol=1e-12
+        )
+        np.testing.assert_allclose(
+            res.confidence_interval, expected.confidence_interval, atol=1e-12
+        )
+
+    def test_no_threshold_gives_zero_precision(self):
+        res = bootstrap_precision_at_threshold(
+            self.y_true, self.y_pred, None, n_resamples=50, method="percentile"
+        )
+        np.testing.assert_array_equal(res.bootstrap_distribution, 0)
+
+
+class TestCheckpointJournal(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, "checkpoint.jsonl")
+
+    def test_resumes_completed_keys(self):
+        config = {"n_boot": 10}
+        journal = CheckpointJournal(self.path, config)
+        run_journaled(
+            [("a", delayed(np.float64)(1)), ("b", delayed(len)([1, 2]))], journal
+        )
+        journal.close()
+        with open(self.path, "a") as f:
+            f.write('{"key": "c", "val')  # killed mid-write
+
+        journal = CheckpointJournal(self.path, config)
+        self.assertEqual(len(journal), 2)
+        # completed keys are not recomputed
+        results = run_journaled(
+            [("a", delayed(float)("nan")), ("c", delayed(abs)(-3))], journal
+        )
+        self.assertEqual(results, {"a": 1.0, "c": 3})
+        journal.close()
+        journal = CheckpointJournal(self.path, config)
+        self.assertEqual(len(journal), 3)
+        journal.close()
+
+        journal = CheckpointJournal(self.path, {"n_boot": 20})
+        self.assertEqual(len(journal), 0)
+        journal.close()
+
+    def test_keep_gets_unrecorded_results(self):
+        journal = CheckpointJournal(self.path)
+        journal.record([("a", 1)])
+        kept = {}
+        results = run_journaled(
+            [("a", delayed(divmod)(7, 2)), ("b", delayed(divmod)(9, 4))],
+            journal,
+            keep=lambda key, result, extra: kept.update({key: extra}),
+        )
+        self.assertEqual(results, {"a": 1, "b": 2})
+        self.assertEqual(kept, {"b": 1})
+        journal.close()
+
+    def test_compact_drops_stale_keys(self):
+        journal = CheckpointJournal(self.path, {"n_boot": 10})
+        journal.record([("a", 1), ("b", 2), ("c", 3)])
+        journal.compact(["c", "a"])
+        journal.record([("d", 4)])
+        journal.close()
+        journal = CheckpointJournal(self.path, {"n_boot": 10})
+        self.assertEqual(len(journal), 3)
+        self.assertNotIn("b", journal)
+        self.assertEqual(journal["d"], 4)
+        journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,7 +9,10 @@ rule gather_model_performances:
 		scripts_dir = SCRIPTS_DIR,
 		out_dir = RESULTS_DIR,
 		model_config_file = config["model_config"],
-		crispr_dataset = config["crispr_dataset"]
+		crispr_dataset = config["crispr_dataset"],
+		# kept across runs with the current models only, so only new or retrained models are evaluated again
+		cache_file = os.path.join(RESULTS_DIR, "performance_across_models.cache.jsonl")
+	threads: config.get("cv_workers", 1)
 	conda:
 		"../envs/encode_re2g.yml" 
 	resources:
@@ -20,7 +23,9 @@ rule gather_model_performances:
 			--model_config_file {params.model_config_file} \
 			--output_file {output.comp_table}  \
 			--crispr_data {params.crispr_dataset} \
-			--out_dir {params.out_dir}
+			--out_dir {params.out_dir} \
+			--n_workers {threads} \
+			--cache_file {params.cache_file}
 		"""
 
 rule plot_model_performances:
@@ -31,7 +31,7 @@ rule format_external_features_config:
 # overlap feature table  with K562 CRISPR data
 rule overlap_features_crispr:
 	input:
-		features = os.path.join(RESULTS_DIR, "{dataset}", "genomewide_features.tsv.gz"),
+		features = os.path.join(RESULTS_DIR, "{dataset}", f"genomewide_features.{INTERMEDIATE_EXT}"),
 		crispr = config['crispr_dataset'],
 		feature_table_file = os.path.join(RESULTS_DIR, "{dataset}", "feature_table.tsv"),
 		tss = config['gene_TSS500']
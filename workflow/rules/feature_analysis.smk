@@ -7,23 +7,29 @@ rule calculate_forward_feature_selection:
 	params:
 		epsilon = config["epsilon"],
 		scripts_dir = SCRIPTS_DIR,
+		warm_start = config.get("sffs_warm_start", False),
 		polynomial = lambda wildcards: model_config.loc[wildcards.model, 'polynomial'],
-		out_dir = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis")
+		out_dir = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis"),
+		checkpoint_file = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis", "forward_feature_selection.checkpoint.jsonl")
 	output:
 		results = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis", "forward_feature_selection.tsv"),
 	conda:
 		"../envs/encode_re2g.yml" 
+	threads: config.get("cv_workers", 1)
 	resources:
 		mem_mb=determine_mem_mb
 	shell: 
 		""" 
 		python {params.scripts_dir}/model_training/forward_sequential_feature_selection.py \
+			--n_workers {threads} \
 			--crispr_features_file {input.crispr_features_processed} \
 			--feature_table_file {input.feature_table} \
 			--out_dir {params.out_dir} \
 			--polynomial {params.polynomial} \
 			--epsilon {params.epsilon} \
-			--params_file {input.model_params}
+			--warm_start {params.warm_start} \
+			--params_file {input.model_params} \
+			--checkpoint_file {params.checkpoint_file}
 		"""
 
 rule plot_forward_feature_selection:
@@ -52,22 +58,26 @@ rule calculate_backward_feature_selection:
 		epsilon = config["epsilon"],
 		scripts_dir = SCRIPTS_DIR,
 		polynomial = lambda wildcards: model_config.loc[wildcards.model, 'polynomial'],
-		out_dir = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis")
+		out_dir = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis"),
+		checkpoint_file = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis", "backward_feature_selection.checkpoint.jsonl")
 	output:
 		results = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis", "backward_feature_selection.tsv"),
 	conda:
 		"../envs/encode_re2g.yml" 
+	threads: config.get("cv_workers", 1)
 	resources:
 		mem_mb=determine_mem_mb
 	shell: 
 		""" 
 		python {params.scripts_dir}/model_training/backward_sequential_feature_selection.py \
+			--n_workers {threads} \
 			--crispr_features_file {input.crispr_features_processed} \
 			--feature_table_file {input.feature_table} \
 			--out_dir {params.out_dir} \
 			--polynomial {params.polynomial} \
 			--epsilon {params.epsilon} \
-			--params_file {input.model_params}
+			--params_file {input.model_params} \
+			--checkpoint_file {params.checkpoint_file}
 		"""
 
 rule plot_backward_feature_selection:
@@ -95,22 +105,27 @@ rule compare_all_feature_sets:
 	params:
 		epsilon = config["epsilon"],
 		scripts_dir = SCRIPTS_DIR,
-		out_dir = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis")
+		out_dir = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis"),
+		checkpoint_file = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis", "all_feature_sets.checkpoint.jsonl"),
+		prune_margin = "" if config.get("all_feature_sets_prune_margin") is None else f"--prune_margin {config['all_feature_sets_prune_margin']}"
 	output:
 		results = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis", "all_feature_sets.tsv"),
 	conda:
 		"../envs/encode_re2g.yml" 
+	threads: config.get("cv_workers", 1)
 	resources:
 		mem_mb=determine_mem_mb,
 		runtime='24h'
 	shell: 
 		""" 
 		python {params.scripts_dir}/model_training/compare_all_feature_sets.py \
+			--n_workers {threads} \
 			--crispr_features_file {input.crispr_features_processed} \
 			--feature_table_file {input.feature_table} \
 			--out_dir {params.out_dir} \
 			--epsilon {params.epsilon} \
-			--params_file {input.model_params}
+			--params_file {input.model_params} \
+			--checkpoint_file {params.checkpoint_file} {params.prune_margin}
 		"""
 
 # permuation feature importance
@@ -122,25 +137,31 @@ rule calculate_permutation_feature_importance:
 	params:
 		epsilon = config["epsilon"],
 		n_repeats = 20,
+		mode = config.get("pfi_mode", "refit"),
 		scripts_dir = SCRIPTS_DIR,
 		polynomial = lambda wildcards: model_config.loc[wildcards.model, 'polynomial'],
-		out_dir = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis")
+		out_dir = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis"),
+		checkpoint_file = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis", "permutation_feature_importance.checkpoint.jsonl")
 	output:
 		results = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "feature_analysis", "permutation_feature_importance.tsv"),
 	conda:
 		"../envs/encode_re2g.yml" 
+	threads: config.get("cv_workers", 1)
 	resources:
 		mem_mb=determine_mem_mb
 	shell: 
 		""" 
 		python {params.scripts_dir}/model_training/permutation_feature_importance.py \
+			--n_workers {threads} \
 			--crispr_features_file {input.crispr_features_processed} \
 			--feature_table_file {input.feature_table} \
 			--out_dir {params.out_dir} \
 			--polynomial {params.polynomial} \
 			--epsilon {params.epsilon} \
 			--n_repeats {params.n_repeats} \
-			--params_file {input.model_params}
+			--mode {params.mode} \
+			--params_file {input.model_params} \
+			--checkpoint_file {params.checkpoint_file}
 		"""
 
 rule plot_permutation_feature_importance:
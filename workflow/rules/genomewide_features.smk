@@ -1,5 +1,13 @@
 from functools import partial
 
+# intermediate feature tables are written as gzip TSV (default) or Parquet
+INTERMEDIATE_EXT = "parquet" if config.get("intermediate_format", "tsv") == "parquet" else "tsv.gz"
+
+# numNearbyEnhancers/sumNearbyEnhancers are always computed at 5kb; extra radii are written alongside
+NEARBY_RADII = sorted(set([5000] + config.get("nearby_enhancer_radii", [])))
+# file labels of the extra radii, as in gen_new_features.py (2500 -> "2500bp", 10000 -> "10kb")
+EXTRA_NEARBY_LABELS = [f"{radius // 1000}kb" if radius % 1000 == 0 else f"{radius}bp" for radius in NEARBY_RADII if radius != 5000]
+
 rule gen_new_features: 
 	input:
 		abc_predictions = lambda wildcards: os.path.join(ABC_BIOSAMPLES_DIR[wildcards.biosample], "Predictions", "EnhancerPredictionsAllPutative.tsv.gz"),
@@ -7,6 +15,7 @@ rule gen_new_features:
 	params:
 		gene_TSS500 = config['gene_TSS500'],
 		chr_sizes = config['chr_sizes'],
+		nearby_radii = " ".join(f"--nearby_radii {radius}" for radius in NEARBY_RADII),
 		scripts_dir = SCRIPTS_DIR
 	conda:
 		"../envs/encode_re2g.yml"
@@ -17,6 +26,8 @@ rule gen_new_features:
 		NumTSSEnhGene = os.path.join(RESULTS_DIR, "{biosample}", "NumTSSEnhGene.tsv"),
 		NumEnhancersEG5kb = os.path.join(RESULTS_DIR, "{biosample}", "NumEnhancersEG5kb.txt"),
 		SumEnhancersEG5kb = os.path.join(RESULTS_DIR, "{biosample}", "SumEnhancersEG5kb.txt"),
+		NumEnhancersEG_extra = [os.path.join(RESULTS_DIR, "{biosample}", f"NumEnhancersEG{label}.txt") for label in EXTRA_NEARBY_LABELS],
+		SumEnhancersEG_extra = [os.path.join(RESULTS_DIR, "{biosample}", f"SumEnhancersEG{label}.txt") for label in EXTRA_NEARBY_LABELS],
 	shell: 
 		""" 
 		python {params.scripts_dir}/feature_tables/gen_new_features.py \
@@ -24,7 +35,8 @@ rule gen_new_features:
 			--abc_predictions {input.abc_predictions} \
 			--ref_gene_tss {params.gene_TSS500} \
 			--chr_sizes {params.chr_sizes} \
-			--results_dir {RESULTS_DIR}/{wildcards.biosample}
+			--results_dir {RESULTS_DIR}/{wildcards.biosample} \
+			{params.nearby_radii}
 		"""
 		
 # create activity-only feature table
@@ -38,7 +50,7 @@ rule activity_only_features:
 		SumEnhancersEG5kb = os.path.join(RESULTS_DIR, "{biosample}", "SumEnhancersEG5kb.txt"),
 		geneClasses = config["gene_classes"]
 	output: 
-		predictions_extended = os.path.join(RESULTS_DIR, "{biosample}", "ActivityOnly_features.tsv.gz")
+		predictions_extended = os.path.join(RESULTS_DIR, "{biosample}", f"ActivityOnly_features.{INTERMEDIATE_EXT}")
 	conda:
 		"../envs/encode_re2g.yml"
 	resources:
@@ -54,11 +66,11 @@ else:
 
 rule add_external_features:
 	input:
-		predictions_extended = os.path.join(RESULTS_DIR, "{biosample}", "ActivityOnly_features.tsv.gz"),
+		predictions_extended = os.path.join(RESULTS_DIR, "{biosample}", f"ActivityOnly_features.{INTERMEDIATE_EXT}"),
 		feature_table_file = os.path.join(RESULTS_DIR, "{biosample}", "feature_table.tsv"),
 		external_features_config = os.path.join(RESULTS_DIR, "{biosample}", "external_features_config.tsv"),
 	output:
-		plus_external_features = os.path.join(RESULTS_DIR, "{biosample}",  "ActivityOnly_plus_external_features.tsv.gz")
+		plus_external_features = os.path.join(RESULTS_DIR, "{biosample}",  f"ActivityOnly_plus_external_features.{INTERMEDIATE_EXT}")
 	conda:
 		"../envs/encode_re2g.yml"
 	resources:
@@ -69,10 +81,10 @@ rule add_external_features:
 # compute interaction or squared terms, fill NAs, rename features to finals, fill nas
 rule gen_final_features:
 	input:
-		plus_external_features = os.path.join(RESULTS_DIR, "{biosample}", "ActivityOnly_plus_external_features.tsv.gz"),
+		plus_external_features = os.path.join(RESULTS_DIR, "{biosample}", f"ActivityOnly_plus_external_features.{INTERMEDIATE_EXT}"),
 		feature_table_file = os.path.join(RESULTS_DIR, "{biosample}", "feature_table.tsv")
 	output:
-		final_features = os.path.join(RESULTS_DIR, "{biosample}", "genomewide_features.tsv.gz")
+		final_features = os.path.join(RESULTS_DIR, "{biosample}", f"genomewide_features.{INTERMEDIATE_EXT}")
 	conda:
 		"../envs/encode_re2g.yml"
 	resources:
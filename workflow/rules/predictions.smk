@@ -1,4 +1,3 @@
-
 rule make_biosample_feature_table:  # make feature table per biosample
 	input:
 		config["ABC_BIOSAMPLES"]
@@ -30,71 +29,117 @@ rule format_external_features_config:
 	script:
 		"../scripts/feature_tables/format_external_features_config.R"
 
-rule generate_e2g_predictions:
-	input:
-		final_features = os.path.join(RESULTS_DIR, "{biosample}", "genomewide_features.tsv.gz"),
-	params:
-		epsilon = config["epsilon"],
-		feature_table_file = lambda wildcards: get_feature_table_file(wildcards.biosample, wildcards.model_name),
-		trained_model = lambda wildcards: get_trained_model(wildcards.biosample, wildcards.model_name),
-		scripts_dir = SCRIPTS_DIR
-	conda:
-		"../envs/encode_re2g.yml"
-	resources:
-		mem_mb=determine_mem_mb
-	output: 
-		prediction_file = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions.tsv.gz")
-	shell: 
-		""" 
-		python {params.scripts_dir}/model_application/run_e2g.py \
-			--predictions {input.final_features} \
-			--feature_table_file {params.feature_table_file} \
-			--epsilon {params.epsilon} \
-			--trained_model {params.trained_model} \
-			--output_file {output.prediction_file}
-		"""
+# with shard_by_chromosome, predictions are scored per chromosome and gathered (sharding.smk)
+# with multi_model_scoring, biosamples with several model_dirs parse their feature table once for all models
+if config.get("shard_by_chromosome", False):
+	pass
+elif not config.get("multi_model_scoring", False):
+	rule generate_e2g_predictions:
+		input:
+			final_features = os.path.join(RESULTS_DIR, "{biosample}", f"genomewide_features.{INTERMEDIATE_EXT}"),
+		params:
+			epsilon = config["epsilon"],
+			feature_table_file = lambda wildcards: get_feature_table_file(wildcards.biosample, wildcards.model_name),
+			trained_model = lambda wildcards: get_trained_model(wildcards.biosample, wildcards.model_name),
+			chunksize = config.get("scoring_chunksize", 0),
+			scorer = config.get("scorer", "sklearn"),
+			dtype = config.get("scoring_dtype", "float64"),
+			scripts_dir = SCRIPTS_DIR
+		conda:
+			"../envs/encode_re2g.yml"
+		resources:
+			mem_mb=determine_streaming_mem_mb if config.get("scoring_chunksize", 0) else determine_mem_mb
+		output: 
+			prediction_file = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions.tsv.gz")
+		shell: 
+			""" 
+			python {params.scripts_dir}/model_application/run_e2g.py \
+				--predictions {input.final_features} \
+				--feature_table_file {params.feature_table_file} \
+				--epsilon {params.epsilon} \
+				--trained_model {params.trained_model} \
+				--chunksize {params.chunksize} \
+				--scorer {params.scorer} \
+				--dtype {params.dtype} \
+				--output_file {output.prediction_file}
+			"""
 
-rule filter_e2g_predictions:
-	input:
-		prediction_file = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions.tsv.gz")
-	params:
-		threshold = lambda wildcards: get_model_threshold(wildcards.biosample, wildcards.model_name),
-		include_self_promoter = config["include_self_promoter"],
-		score_col = config["final_score_col"],
-		scripts_dir = SCRIPTS_DIR
-	conda:
-		"../envs/encode_re2g.yml"
-	resources:
-		mem_mb=determine_mem_mb
-	output:
-		thresholded = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions_threshold{threshold}.tsv.gz")
-	shell:
-		"""
-		python {params.scripts_dir}/model_application/threshold_e2g_predictions.py \
-			--all_predictions_file {input.prediction_file} \
-			--threshold {params.threshold} \
-			--score_column {params.score_col} \
-			--include_self_promoter {params.include_self_promoter} \
-			--output_file {output.thresholded}
-		"""
+else:
+	# score all models of a biosample in one pass over its feature table
+	for biosample, biosample_models in BIOSAMPLE_DF.groupby("biosample"):
+		rule:
+			name: "generate_e2g_predictions_" + re.sub(r"\W", "_", biosample)
+			input:
+				final_features = os.path.join(RESULTS_DIR, biosample, f"genomewide_features.{INTERMEDIATE_EXT}"),
+			params:
+				epsilon = config["epsilon"],
+				model_dirs = " ".join(f"--model_dir {model_dir}" for model_dir in biosample_models["model_dir"]),
+				output_files = lambda wildcards, output: " ".join(f"--output_file {f}" for f in output),
+				chunksize = config.get("scoring_chunksize", 0),
+				scorer = config.get("scorer", "sklearn"),
+				dtype = config.get("scoring_dtype", "float64"),
+				scripts_dir = SCRIPTS_DIR
+			conda:
+				"../envs/encode_re2g.yml"
+			resources:
+				mem_mb=determine_streaming_mem_mb if config.get("scoring_chunksize", 0) else determine_mem_mb
+			output:
+				[os.path.join(RESULTS_DIR, biosample, model_name, "encode_e2g_predictions.tsv.gz") for model_name in biosample_models["model_dir_base"]]
+			shell:
+				"""
+				python {params.scripts_dir}/model_application/run_e2g.py \
+					--predictions {input.final_features} \
+					{params.model_dirs} \
+					--epsilon {params.epsilon} \
+					--chunksize {params.chunksize} \
+					--scorer {params.scorer} \
+					--dtype {params.dtype} \
+					{params.output_files}
+				"""
 
-rule write_predictions_bedpe:
-	input:
-		thresholded = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions_threshold{threshold}.tsv.gz")
-	params:
-		score_col = config["final_score_col"],
-		scripts_dir = SCRIPTS_DIR
-	output:
-		bedpe = os.path.join(IGV_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions_threshold{threshold}.bedpe")
-	conda:
-		"../envs/encode_re2g.yml"
-	resources:
-		mem_mb=determine_mem_mb
-	shell:
-		"""
-		python {params.scripts_dir}/model_application/process_model_output.py \
-			--predictions_file {input.thresholded} \
-			--score_column {params.score_col} \
-			--bedpe_output {output.bedpe}
-		"""
-	
\ No newline at end of file
+# with fused_postprocessing, thresholding, BEDPE and stats are written by postprocess_e2g_predictions (qc.smk)
+if not config.get("fused_postprocessing", False):
+	if not config.get("shard_by_chromosome", False):
+		rule filter_e2g_predictions:
+			input:
+				prediction_file = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions.tsv.gz")
+			params:
+				threshold = lambda wildcards: get_model_threshold(wildcards.biosample, wildcards.model_name),
+				include_self_promoter = config["include_self_promoter"],
+				score_col = config["final_score_col"],
+				scripts_dir = SCRIPTS_DIR
+			conda:
+				"../envs/encode_re2g.yml"
+			resources:
+				mem_mb=determine_mem_mb
+			output:
+				thresholded = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions_threshold{threshold}.tsv.gz")
+			shell:
+				"""
+				python {params.scripts_dir}/model_application/threshold_e2g_predictions.py \
+					--all_predictions_file {input.prediction_file} \
+					--threshold {params.threshold} \
+					--score_column {params.score_col} \
+					--include_self_promoter {params.include_self_promoter} \
+					--output_file {output.thresholded}
+				"""
+
+	rule write_predictions_bedpe:
+		input:
+			thresholded = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions_threshold{threshold}.tsv.gz")
+		params:
+			score_col = config["final_score_col"],
+			scripts_dir = SCRIPTS_DIR
+		output:
+			bedpe = os.path.join(IGV_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions_threshold{threshold}.bedpe")
+		conda:
+			"../envs/encode_re2g.yml"
+		resources:
+			mem_mb=determine_mem_mb
+		shell:
+			"""
+			python {params.scripts_dir}/model_application/process_model_output.py \
+				--predictions_file {input.thresholded} \
+				--score_column {params.score_col} \
+				--bedpe_output {output.bedpe}
+			"""
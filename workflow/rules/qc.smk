@@ -4,22 +4,57 @@ def get_accessibility_files(wildcards):
 	files = biosample[biosample["default_accessibility_feature"]]
 	return files.split(",")
 
-rule get_stats:
-	input:
-		thresholded = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions_threshold{threshold}.tsv.gz"),
-		accessibility = get_accessibility_files
-	params:
-		scripts_dir = SCRIPTS_DIR
-	conda:
-		"../envs/encode_re2g.yml"
-	resources:
-		mem_mb=4*1000
-	output:
-		stats = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions_threshold{threshold}_stats.tsv")
-	shell:
-		"""
-		python {params.scripts_dir}/model_application/get_stats.py --predictions {input.thresholded} --accessibility "{input.accessibility}" --output_file {output.stats}
-		"""
+if not config.get("fused_postprocessing", False):
+	rule get_stats:
+		input:
+			thresholded = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions_threshold{threshold}.tsv.gz"),
+			accessibility = get_accessibility_files
+		params:
+			scripts_dir = SCRIPTS_DIR
+		conda:
+			"../envs/encode_re2g.yml"
+		resources:
+			mem_mb=4*1000
+		output:
+			stats = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions_threshold{threshold}_stats.tsv")
+		shell:
+			"""
+			python {params.scripts_dir}/model_application/get_stats.py --predictions {input.thresholded} --accessibility "{input.accessibility}" --output_file {output.stats}
+			"""
+
+else:
+	# read encode_e2g_predictions.tsv.gz once to write the thresholded predictions, BEDPE and stats
+	rule postprocess_e2g_predictions:
+		input:
+			prediction_file = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions.tsv.gz"),
+			accessibility = get_accessibility_files
+		params:
+			threshold = lambda wildcards: get_model_threshold(wildcards.biosample, wildcards.model_name),
+			include_self_promoter = config["include_self_promoter"],
+			score_col = config["final_score_col"],
+			chunksize = config.get("scoring_chunksize", 0),
+			scripts_dir = SCRIPTS_DIR
+		conda:
+			"../envs/encode_re2g.yml"
+		resources:
+			mem_mb=determine_streaming_mem_mb if config.get("scoring_chunksize", 0) else determine_mem_mb
+		output:
+			thresholded = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions_threshold{threshold}.tsv.gz"),
+			bedpe = os.path.join(IGV_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions_threshold{threshold}.bedpe"),
+			stats = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions_threshold{threshold}_stats.tsv")
+		shell:
+			"""
+			python {params.scripts_dir}/model_application/postprocess_e2g_predictions.py \
+				--all_predictions_file {input.prediction_file} \
+				--threshold {params.threshold} \
+				--score_column {params.score_col} \
+				--include_self_promoter {params.include_self_promoter} \
+				--accessibility "{input.accessibility}" \
+				--chunksize {params.chunksize} \
+				--thresholded_output {output.thresholded} \
+				--bedpe_output {output.bedpe} \
+				--stats_output {output.stats}
+			"""
 
 rule generate_plots:
 	input:
@@ -0,0 +1,207 @@
+# Optional per-chromosome sharding of the application workflow (config: shard_by_chromosome).
+# ABC predictions are split by chromosome, features are computed and scored per shard, and the
+# gather rules concatenate the shards into the usual per-biosample prediction files.
+
+SPLIT_DIR = os.path.join(RESULTS_DIR, "{biosample}", "chromosome_split")
+SHARD_DIR = os.path.join(RESULTS_DIR, "{biosample}", "shards", "{chrom}")
+
+def get_shard_chromosomes(biosample):
+	# chromosomes in gather order (sorted, as in the unsharded feature table); evaluated once the split checkpoint has run
+	split_dir = checkpoints.split_by_chromosome.get(biosample=biosample).output.split_dir
+	with open(os.path.join(split_dir, "chromosomes.txt")) as f:
+		return f.read().split()
+
+def get_split_file(wildcards, file_name):
+	split_dir = checkpoints.split_by_chromosome.get(biosample=wildcards.biosample).output.split_dir
+	return os.path.join(split_dir, wildcards.chrom, file_name)
+
+def get_shard_files(wildcards, file_name):
+	return [
+		os.path.join(SHARD_DIR.format(biosample=wildcards.biosample, chrom=chrom), file_name)
+		for chrom in get_shard_chromosomes(wildcards.biosample)
+	]
+
+checkpoint split_by_chromosome:
+	input:
+		abc_predictions = lambda wildcards: os.path.join(ABC_BIOSAMPLES_DIR[wildcards.biosample], "Predictions", "EnhancerPredictionsAllPutative.tsv.gz"),
+		enhancer_list = lambda wildcards: os.path.join(ABC_BIOSAMPLES_DIR[wildcards.biosample], "Neighborhoods", "EnhancerList.txt"),
+	params:
+		scripts_dir = SCRIPTS_DIR
+	conda:
+		"../envs/encode_re2g.yml"
+	resources:
+		mem_mb=4*1000
+	output:
+		split_dir = directory(SPLIT_DIR)
+	shell:
+		"""
+		python {params.scripts_dir}/feature_tables/split_by_chromosome.py \
+			--abc_predictions {input.abc_predictions} \
+			--enhancer_list {input.enhancer_list} \
+			--output_dir {output.split_dir}
+		"""
+
+rule gen_new_features_shard:
+	input:
+		abc_predictions = partial(get_split_file, file_name="EnhancerPredictionsAllPutative.tsv.gz"),
+		enhancer_list = partial(get_split_file, file_name="EnhancerList.txt"),
+	params:
+		gene_TSS500 = config['gene_TSS500'],
+		chr_sizes = config['chr_sizes'],
+		nearby_radii = " ".join(f"--nearby_radii {radius}" for radius in NEARBY_RADII),
+		results_dir = lambda wildcards, output: os.path.dirname(output.NumCandidateEnhGene),
+		scripts_dir = SCRIPTS_DIR
+	conda:
+		"../envs/encode_re2g.yml"
+	resources:
+		mem_mb=determine_mem_mb
+	output:
+		NumCandidateEnhGene = os.path.join(SHARD_DIR, "NumCandidateEnhGene.tsv"),
+		NumTSSEnhGene = os.path.join(SHARD_DIR, "NumTSSEnhGene.tsv"),
+		NumEnhancersEG5kb = os.path.join(SHARD_DIR, "NumEnhancersEG5kb.txt"),
+		SumEnhancersEG5kb = os.path.join(SHARD_DIR, "SumEnhancersEG5kb.txt"),
+		NumEnhancersEG_extra = [os.path.join(SHARD_DIR, f"NumEnhancersEG{label}.txt") for label in EXTRA_NEARBY_LABELS],
+		SumEnhancersEG_extra = [os.path.join(SHARD_DIR, f"SumEnhancersEG{label}.txt") for label in EXTRA_NEARBY_LABELS],
+	shell:
+		"""
+		python {params.scripts_dir}/feature_tables/gen_new_features.py \
+			--enhancer_list {input.enhancer_list} \
+			--abc_predictions {input.abc_predictions} \
+			--ref_gene_tss {params.gene_TSS500} \
+			--chr_sizes {params.chr_sizes} \
+			--results_dir {params.results_dir} \
+			--allow_no_enhancers \
+			{params.nearby_radii}
+		"""
+
+use rule activity_only_features as activity_only_features_shard with:
+	input:
+		feature_table_file = os.path.join(RESULTS_DIR, "{biosample}", "feature_table.tsv"),
+		abc = partial(get_split_file, file_name="EnhancerPredictionsAllPutative.tsv.gz"),
+		NumCandidateEnhGene = os.path.join(SHARD_DIR, "NumCandidateEnhGene.tsv"),
+		NumTSSEnhGene = os.path.join(SHARD_DIR, "NumTSSEnhGene.tsv"),
+		NumEnhancersEG5kb = os.path.join(SHARD_DIR, "NumEnhancersEG5kb.txt"),
+		SumEnhancersEG5kb = os.path.join(SHARD_DIR, "SumEnhancersEG5kb.txt"),
+		geneClasses = config["gene_classes"]
+	output:
+		predictions_extended = os.path.join(SHARD_DIR, f"ActivityOnly_features.{INTERMEDIATE_EXT}")
+
+use rule add_external_features as add_external_features_shard with:
+	input:
+		predictions_extended = os.path.join(SHARD_DIR, f"ActivityOnly_features.{INTERMEDIATE_EXT}"),
+		feature_table_file = os.path.join(RESULTS_DIR, "{biosample}", "feature_table.tsv"),
+		external_features_config = os.path.join(RESULTS_DIR, "{biosample}", "external_features_config.tsv"),
+	output:
+		plus_external_features = os.path.join(SHARD_DIR, f"ActivityOnly_plus_external_features.{INTERMEDIATE_EXT}")
+
+# mean fill values have to be computed over all shards, as in the unsharded workflow
+rule compute_fill_values:
+	input:
+		plus_external_features = partial(get_shard_files, file_name=f"ActivityOnly_plus_external_features.{INTERMEDIATE_EXT}"),
+		feature_table_file = os.path.join(RESULTS_DIR, "{biosample}", "feature_table.tsv")
+	conda:
+		"../envs/encode_re2g.yml"
+	resources:
+		mem_mb=determine_mem_mb
+	output:
+		fill_values = os.path.join(RESULTS_DIR, "{biosample}", "fill_values.rds")
+	script:
+		"../scripts/feature_tables/compute_fill_values.R"
+
+use rule gen_final_features as gen_final_features_shard with:
+	input:
+		plus_external_features = os.path.join(SHARD_DIR, f"ActivityOnly_plus_external_features.{INTERMEDIATE_EXT}"),
+		feature_table_file = os.path.join(RESULTS_DIR, "{biosample}", "feature_table.tsv"),
+		fill_values = os.path.join(RESULTS_DIR, "{biosample}", "fill_values.rds")
+	output:
+		final_features = os.path.join(SHARD_DIR, f"genomewide_features.{INTERMEDIATE_EXT}")
+
+rule generate_e2g_predictions_shard:
+	input:
+		final_features = os.path.join(SHARD_DIR, f"genomewide_features.{INTERMEDIATE_EXT}"),
+	params:
+		epsilon = config["epsilon"],
+		feature_table_file = lambda wildcards: get_feature_table_file(wildcards.biosample, wildcards.model_name),
+		trained_model = lambda wildcards: get_trained_model(wildcards.biosample, wildcards.model_name),
+		scorer = config.get("scorer", "sklearn"),
+		dtype = config.get("scoring_dtype", "float64"),
+		scripts_dir = SCRIPTS_DIR
+	conda:
+		"../envs/encode_re2g.yml"
+	resources:
+		mem_mb=determine_mem_mb
+	output:
+		prediction_file = os.path.join(SHARD_DIR, "{model_name}", "encode_e2g_predictions.tsv.gz")
+	shell:
+		"""
+		python {params.scripts_dir}/model_application/run_e2g.py \
+			--predictions {input.final_features} \
+			--feature_table_file {params.feature_table_file} \
+			--epsilon {params.epsilon} \
+			--trained_model {params.trained_model} \
+			--scorer {params.scorer} \
+			--dtype {params.dtype} \
+			--output_file {output.prediction_file}
+		"""
+
+rule gather_e2g_predictions:
+	input:
+		shards = lambda wildcards: get_shard_files(wildcards, os.path.join(wildcards.model_name, "encode_e2g_predictions.tsv.gz"))
+	params:
+		scripts_dir = SCRIPTS_DIR
+	conda:
+		"../envs/encode_re2g.yml"
+	resources:
+		mem_mb=4*1000
+	output:
+		prediction_file = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions.tsv.gz")
+	shell:
+		"""
+		python {params.scripts_dir}/model_application/gather_shards.py \
+			--output_file {output.prediction_file} \
+			{input.shards}
+		"""
+
+# with fused_postprocessing, the gathered predictions are thresholded by postprocess_e2g_predictions
+if not config.get("fused_postprocessing", False):
+	rule filter_e2g_predictions_shard:
+		input:
+			prediction_file = os.path.join(SHARD_DIR, "{model_name}", "encode_e2g_predictions.tsv.gz")
+		params:
+			threshold = lambda wildcards: get_model_threshold(wildcards.biosample, wildcards.model_name),
+			include_self_promoter = config["include_self_promoter"],
+			score_col = config["final_score_col"],
+			scripts_dir = SCRIPTS_DIR
+		conda:
+			"../envs/encode_re2g.yml"
+		resources:
+			mem_mb=determine_mem_mb
+		output:
+			thresholded = os.path.join(SHARD_DIR, "{model_name}", "encode_e2g_predictions_threshold{threshold}.tsv.gz")
+		shell:
+			"""
+			python {params.scripts_dir}/model_application/threshold_e2g_predictions.py \
+				--all_predictions_file {input.prediction_file} \
+				--threshold {params.threshold} \
+				--score_column {params.score_col} \
+				--include_self_promoter {params.include_self_promoter} \
+				--output_file {output.thresholded}
+			"""
+
+	rule gather_thresholded_e2g_predictions:
+		input:
+			shards = lambda wildcards: get_shard_files(wildcards, os.path.join(wildcards.model_name, f"encode_e2g_predictions_threshold{wildcards.threshold}.tsv.gz"))
+		params:
+			scripts_dir = SCRIPTS_DIR
+		conda:
+			"../envs/encode_re2g.yml"
+		resources:
+			mem_mb=4*1000
+		output:
+			thresholded = os.path.join(RESULTS_DIR, "{biosample}", "{model_name}", "encode_e2g_predictions_threshold{threshold}.tsv.gz")
+		shell:
+			"""
+			python {params.scripts_dir}/model_application/gather_shards.py \
+				--output_file {output.thresholded} \
+				{input.shards}
+			"""
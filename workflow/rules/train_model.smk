@@ -18,8 +18,9 @@ rule generate_model_params:
 			--output_file {output.final_params} 
 		"""
 
-# generate trained model and cross-validated predictions on CRISPR data
-rule train_model:
+# rank the param_grid combinations (merged into the model's params) by chromosome-held-out CV
+# with successive halving; param_sweep/training_params.pkl holds the winning params
+rule sweep_model_params:
 	input:
 		crispr_features_processed = os.path.join(RESULTS_DIR, "{dataset}", "for_training.EPCrisprBenchmark_ensemble_data_GRCh38.K562_features_NAfilled.tsv.gz"),
 		feature_table = lambda wildcards: model_config.loc[wildcards.model, 'feature_table'],
@@ -28,23 +29,93 @@ rule train_model:
 		epsilon = config["epsilon"],
 		scripts_dir = SCRIPTS_DIR,
 		polynomial = lambda wildcards: model_config.loc[wildcards.model, 'polynomial'],
-		out_dir = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "model")
+		param_grid = config.get("param_grid"),
+		eta = config.get("param_sweep_eta", 3)
 	output:
-		trained_model = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "model", "model_full.pkl"),
-		pred = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "model", "training_predictions.tsv"),
-		#in_order = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "model", "training_data_in_order.tsv"),
-		#shap = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "model", "shap_scores.tsv")
+		sweep_table = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "param_sweep", "param_sweep.tsv"),
+		best_params = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "param_sweep", "training_params.pkl")
+	threads: config.get("cv_workers", 1)
 	conda:
-		"../envs/encode_re2g.yml" 
+		"../envs/encode_re2g.yml"
 	resources:
 		mem_mb=64*1000
-	shell: 
-		""" 
-		python {params.scripts_dir}/model_training/train_model.py \
+	shell:
+		"""
+		python {params.scripts_dir}/model_training/sweep_params.py \
 			--crispr_features_file {input.crispr_features_processed} \
 			--feature_table_file {input.feature_table} \
-			--out_dir {params.out_dir} \
 			--polynomial {params.polynomial} \
 			--epsilon {params.epsilon} \
-			--params_file {input.model_params}
+			--params_file {input.model_params} \
+			--param_grid "{params.param_grid}" \
+			--eta {params.eta} \
+			--n_workers {threads} \
+			--output_table {output.sweep_table} \
+			--output_params {output.best_params}
 		"""
+
+# generate trained model and cross-validated predictions on CRISPR data
+# with batch_training, all models of a dataset are trained by one job that reads its CRISPR features once
+if not config.get("batch_training", False):
+	rule train_model:
+		input:
+			crispr_features_processed = os.path.join(RESULTS_DIR, "{dataset}", "for_training.EPCrisprBenchmark_ensemble_data_GRCh38.K562_features_NAfilled.tsv.gz"),
+			feature_table = lambda wildcards: model_config.loc[wildcards.model, 'feature_table'],
+			model_params = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "model", "training_params.pkl")
+		params:
+			epsilon = config["epsilon"],
+			scripts_dir = SCRIPTS_DIR,
+			polynomial = lambda wildcards: model_config.loc[wildcards.model, 'polynomial'],
+			out_dir = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "model")
+		output:
+			trained_model = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "model", "model_full.pkl"),
+			pred = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "model", "training_predictions.tsv"),
+			#in_order = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "model", "training_data_in_order.tsv"),
+			#shap = os.path.join(RESULTS_DIR, "{dataset}", "{model}", "model", "shap_scores.tsv")
+		conda:
+			"../envs/encode_re2g.yml" 
+		resources:
+			mem_mb=64*1000
+		shell: 
+			""" 
+			python {params.scripts_dir}/model_training/train_model.py \
+				--crispr_features_file {input.crispr_features_processed} \
+				--feature_table_file {input.feature_table} \
+				--out_dir {params.out_dir} \
+				--polynomial {params.polynomial} \
+				--epsilon {params.epsilon} \
+				--params_file {input.model_params}
+			"""
+
+else:
+	for dataset, dataset_models in model_config.groupby("dataset"):
+		model_dirs = [os.path.join(RESULTS_DIR, dataset, model, "model") for model in dataset_models["model"]]
+		rule:
+			name: "train_models_" + re.sub(r"\W", "_", dataset)
+			input:
+				crispr_features_processed = os.path.join(RESULTS_DIR, dataset, "for_training.EPCrisprBenchmark_ensemble_data_GRCh38.K562_features_NAfilled.tsv.gz"),
+				feature_tables = list(dataset_models["feature_table"]),
+				model_params = [os.path.join(model_dir, "training_params.pkl") for model_dir in model_dirs]
+			params:
+				epsilon = config["epsilon"],
+				scripts_dir = SCRIPTS_DIR,
+				models = " ".join(
+					f"--out_dir {model_dir} --feature_table_file {feature_table} --params_file {os.path.join(model_dir, 'training_params.pkl')} --polynomial {polynomial}"
+					for model_dir, feature_table, polynomial in zip(model_dirs, dataset_models["feature_table"], dataset_models["polynomial"])
+				)
+			output:
+				trained_models = [os.path.join(model_dir, "model_full.pkl") for model_dir in model_dirs],
+				pred = [os.path.join(model_dir, "training_predictions.tsv") for model_dir in model_dirs]
+			threads: config.get("cv_workers", 1)
+			conda:
+				"../envs/encode_re2g.yml"
+			resources:
+				mem_mb=64*1000
+			shell:
+				"""
+				python {params.scripts_dir}/model_training/train_models.py \
+					--crispr_features_file {input.crispr_features_processed} \
+					{params.models} \
+					--epsilon {params.epsilon} \
+					--n_workers {threads}
+				"""
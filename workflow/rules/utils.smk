@@ -28,6 +28,12 @@ def determine_mem_mb(wildcards, input, attempt, min_gb=8):
 	mem_to_use_mb = attempt_multiplier *  max(4 * input_size_mb, min_gb * 1000)
 	return min(mem_to_use_mb, MAX_MEM_MB)
 
+def determine_streaming_mem_mb(wildcards, attempt, min_gb=8):
+	# Memory resource calculator for rules that read their input in bounded chunks,
+	# so memory does not scale with input size
+	attempt_multiplier = 2 ** (attempt - 1)  # Double memory for each retry
+	return min(attempt_multiplier * min_gb * 1000, MAX_MEM_MB)
+
 def expand_biosample_df(biosample_df):
 	# add new columns
 	if "model_dir" not in biosample_df.columns:
@@ -1,19 +1,9 @@
 import os
-import shutil
 
 import click
+import numpy as np
 import pandas as pd
-
-
-def create_intermediate_dir(results_dir):
-    intermediate_dir = os.path.join(results_dir, "intermediate_files")
-    if not os.path.exists(intermediate_dir):
-        os.makedirs(intermediate_dir)
-    return intermediate_dir
-
-
-def delete_intermediate_dir(intermediate_dir):
-    shutil.rmtree(intermediate_dir)
+from genomic_intervals import GenomicIntervalIndex, read_bed, read_chr_sizes, slop
 
 
 def add_midpoint(df):
@@ -26,36 +16,78 @@ def add_midpoint(df):
 @click.option("--ref_gene_tss")
 @click.option("--chr_sizes")
 @click.option("--results_dir")
-def main(enhancer_list, abc_predictions, ref_gene_tss, chr_sizes, results_dir):
-    intermediate_dir = create_intermediate_dir(results_dir)
-
-    ##
+@click.option(
+    "--nearby_radii",
+    type=int,
+    multiple=True,
+    default=[5000],
+    help="Radius (bp) around the enhancer midpoint for numNearbyEnhancers/sumNearbyEnhancers. Can be given multiple times",
+)
+@click.option(
+    "--allow_no_enhancers",
+    is_flag=True,
+    help="Write empty feature files instead of failing if there are only promoters (e.g. for a chromosome shard)",
+)
+def main(
+    enhancer_list,
+    abc_predictions,
+    ref_gene_tss,
+    chr_sizes,
+    results_dir,
+    nearby_radii,
+    allow_no_enhancers,
+):
     pred_df = pd.read_csv(abc_predictions, sep="\t")
     pred_df = pred_df[pred_df["class"] != "promoter"]
-    if len(pred_df) == 0:
+    if len(pred_df) == 0 and not allow_no_enhancers:
         raise Exception("Did not find any enhancers in the Predictions file")
     add_midpoint(pred_df)
 
     determine_num_candidate_enh_gene(pred_df, results_dir)
-    determine_num_tss_enh_gene(pred_df, ref_gene_tss, results_dir, intermediate_dir)
+    determine_num_tss_enh_gene(pred_df, ref_gene_tss, results_dir)
     generate_num_sum_enhancers(
-        abc_predictions, enhancer_list, chr_sizes, results_dir, intermediate_dir
-    )
-
-    # Intermediate directory takes up a lot of space. Delete after usage
-    delete_intermediate_dir(intermediate_dir)
-
-
-def _populate_enhancer_count_from_tss(df, enhancers, is_upstream):
-    enh_indexes = enhancers.index
-    if is_upstream:
-        # start counting from the enhancer closest to TSS
-        enh_indexes = reversed(enh_indexes)
-
-    count_from_tss = 0
-    for enh_idx in enh_indexes:
-        count_from_tss += 1
-        df.loc[enh_idx, "NumCandidateEnhGene"] = count_from_tss
+        abc_predictions, enhancer_list, chr_sizes, results_dir, nearby_radii
+    )
+
+
+def _cumcount(group_ids):
+    # position of each element within its group, preserving the input order
+    order = np.argsort(group_ids, kind="stable")
+    sorted_ids = group_ids[order]
+    is_group_start = np.empty(len(sorted_ids), dtype=bool)
+    is_group_start[:1] = True
+    is_group_start[1:] = sorted_ids[1:] != sorted_ids[:-1]
+    group_starts = np.flatnonzero(is_group_start)
+    group_sizes = np.diff(np.append(group_starts, len(sorted_ids)))
+    counts = np.empty(len(sorted_ids), dtype=np.int64)
+    counts[order] = np.arange(len(sorted_ids)) - np.repeat(group_starts, group_sizes)
+    return counts
+
+
+def rank_enhancers_from_tss(df):
+    """
+    Number each enhancer by its position relative to the TSS of its target gene,
+    counting outwards from the TSS in both directions (closest enhancer = 1).
+    Enhancers whose midpoint falls on the TSS get 0.
+
+    df must be sorted by midpoint within each chromosome
+    """
+    group_ids = (
+        df.groupby(["TargetGene", "TargetGeneTSS"], sort=False)
+        .ngroup()
+        .to_numpy(dtype=np.float64)
+    )
+    midpoint = df["midpoint"].to_numpy()
+    tss = df["TargetGeneTSS"].to_numpy()
+    has_gene = ~np.isnan(group_ids)
+
+    ranks = np.zeros(len(df), dtype=np.int64)
+    downstream = has_gene & (midpoint > tss)
+    ranks[downstream] = _cumcount(group_ids[downstream]) + 1
+    # start counting from the enhancer closest to TSS
+    upstream = np.flatnonzero(has_gene & (midpoint < tss))[::-1]
+    ranks[upstream] = _cumcount(group_ids[upstream]) + 1
+    return ranks
 
 
 def determine_num_candidate_enh_gene(pred_df, results_dir):
@@ -63,17 +95,7 @@ def determine_num_candidate_enh_gene(pred_df, results_dir):
     df = pred_df.sort_values(by=["chr", "midpoint"], ascending=True).reset_index(
         drop=True
     )
-
-    gene_groups = df.groupby(["TargetGene", "TargetGeneTSS"])
-    for (gene, tss), indexes in gene_groups.groups.items():
-        enhancers = df.loc[indexes]
-        upstream_enh = enhancers[enhancers["midpoint"] < tss]
-        downstream_enh = enhancers[enhancers["midpoint"] > tss]
-        _populate_enhancer_count_from_tss(df, upstream_enh, is_upstream=True)
-        _populate_enhancer_count_from_tss(df, downstream_enh, is_upstream=False)
-
-    df = df.fillna(value=0)
-    df["NumCandidateEnhGene"] = df["NumCandidateEnhGene"].astype("int")
+    df["NumCandidateEnhGene"] = rank_enhancers_from_tss(df)
     df[["name", "TargetGene", "NumCandidateEnhGene"]].to_csv(
         os.path.join(results_dir, "NumCandidateEnhGene.tsv"),
         sep="\t",
@@ -82,42 +104,35 @@ def determine_num_candidate_enh_gene(pred_df, results_dir):
     print("Saved num candidate enhancers")
 
 
-def determine_num_tss_enh_gene(pred_df, ref_gene_tss, results_dir, intermediate_dir):
+def determine_num_tss_enh_gene(pred_df, ref_gene_tss, results_dir):
     ##### Make the end be midpoint of enhancer + distance (This gives you the end coordinate of distance range)
-    pred_df["new_end"] = (pred_df["midpoint"] + pred_df["distance"]).astype("int")
+    region_start = pred_df["start"].to_numpy()
+    region_end = (pred_df["midpoint"] + pred_df["distance"]).astype("int").to_numpy()
 
     ## If gene is located upstream of enhancer, modify the start to be the beginning of the TargetGeneTSS and the end be the midpoint of the enhancer
-    downstream_enh = pred_df[pred_df["TargetGeneTSS"] < pred_df["midpoint"]]
-    pred_df.loc[downstream_enh.index, "new_end"] = pred_df.loc[
-        downstream_enh.index, "end"
-    ]
-    pred_df.loc[downstream_enh.index, "start"] = pred_df.loc[
-        downstream_enh.index, "TargetGeneTSS"
-    ]
+    downstream_enh = (pred_df["TargetGeneTSS"] < pred_df["midpoint"]).to_numpy()
+    region_end = np.where(downstream_enh, pred_df["end"], region_end)
+    region_start = np.where(downstream_enh, pred_df["TargetGeneTSS"], region_start)
 
-    # This file will be used to intersect gene annotations to count How many protein-coding TSSs away is the enhancer from the promoter?  (i.e., how many protein-coding gene TSSs are located between the enhancer and promoter?  0 = closest TSS)
-    # Intersect this file with gene TSS
-    extended_enhregions = os.path.join(intermediate_dir, "EnhancerRegions_extended.txt")
-    pred_df[["chr", "start", "new_end", "name", "TargetGene"]].to_csv(
-        extended_enhregions, sep="\t", index=False
-    )
-    ## Intersect midpoint of enhancer to target gene regions with GeneTSS
+    # Count How many protein-coding TSSs away is the enhancer from the promoter?  (i.e., how many protein-coding gene TSSs are located between the enhancer and promoter?  0 = closest TSS)
+    ## Overlap the enhancer to target gene regions with GeneTSS
     ## This will include overlaps with the TargetGene
-    filename = os.path.join(
-        intermediate_dir, "EnhancerRegions_extended_RefSeq.intersected.tsv.gz"
+    gene_tss = read_bed(ref_gene_tss)
+    tss_index = GenomicIntervalIndex(
+        gene_tss["chr"], gene_tss["start"], gene_tss["end"]
     )
-    os.system(
-        "sed '1d' {} | bedtools intersect -a stdin -b {} -wa -wb | cut -f4,5 | pigz > {}".format(
-            extended_enhregions, ref_gene_tss, filename
-        )
-    )
-    print("Reading in {}".format(filename))
-    ## Read in intersected midpoint of enhancer to target gene regions with GeneTSS file
-    predictions = pd.read_csv(filename, sep="\t", names=["class", "gene"])
+    num_tss = tss_index.count_overlaps(pred_df["chr"], region_start, region_end)
+
     # Calculate the number of TSS regions that fall within the enhancer to target gene regions.
     num_tss_between_enh_and_gene = (
-        predictions.groupby(["class", "gene"]).size().reset_index()
-    )
+        pd.Series(num_tss)
+        .groupby([pred_df["name"].to_numpy(), pred_df["TargetGene"].to_numpy()])
+        .sum()
+        .rename_axis(["class", "gene"])
+    )
+    num_tss_between_enh_and_gene = num_tss_between_enh_and_gene[
+        num_tss_between_enh_and_gene > 0
+    ].reset_index()
     num_tss_between_enh_and_gene.to_csv(
         os.path.join(results_dir, "NumTSSEnhGene.tsv"),
         sep="\t",
@@ -126,97 +141,88 @@ def determine_num_tss_enh_gene(pred_df, ref_gene_tss, results_dir, intermediate_
     print("Saved num TSS between enh and gene")
 
 
+def radius_label(radius):
+    # 5000 -> "5kb", 2500 -> "2500bp"
+    if radius % 1000 == 0:
+        return f"{radius // 1000}kb"
+    return f"{radius}bp"
+
+
+def count_nearby_enhancers(enh_list_df, pred_slim_df, pred_index, chr_sizes, radius):
+    ##### Extend the enhancer midpoint by radius on both sides and overlap with all putative predictions
+    window_start, window_end = slop(
+        enh_list_df["chr"],
+        enh_list_df["midpoint"],
+        enh_list_df["midpoint"],
+        radius,
+        chr_sizes,
+    )
+    count = pred_index.count_overlaps(enh_list_df["chr"], window_start, window_end)
+    activity_sum = pred_index.sum_overlaps(enh_list_df["chr"], window_start, window_end)
+
+    # Remove the enhancer's own rows from its neighbors
+    windows = pd.DataFrame(
+        {
+            "name": enh_list_df["name"],
+            "window_start": window_start,
+            "window_end": window_end,
+            "row": np.arange(len(enh_list_df)),
+        }
+    )
+    self_overlaps = windows.merge(pred_slim_df, on="name")
+    self_overlaps = self_overlaps[
+        (self_overlaps["start"] < self_overlaps["window_end"])
+        & (self_overlaps["end"] > self_overlaps["window_start"])
+    ]
+    self_rows = self_overlaps.groupby("row")["activity_base"].agg(["size", "sum"])
+    count[self_rows.index] -= self_rows["size"].to_numpy()
+    activity_sum[self_rows.index] -= self_rows["sum"].to_numpy()
+
+    nearby = pd.DataFrame(
+        {"name": enh_list_df["name"], "count": count, "sum": activity_sum}
+    )
+    nearby = nearby.groupby("name")[["count", "sum"]].sum()
+    return nearby[nearby["count"] > 0].reset_index()
+
+
 def generate_num_sum_enhancers(
-    pred_file, enhancer_list, chr_sizes, results_dir, intermediate_dir
+    pred_file, enhancer_list, chr_sizes, results_dir, radii=(5000,)
 ):
     enh_list_df = pd.read_csv(
         enhancer_list, sep="\t", usecols=["chr", "start", "end", "name"]
     )
     add_midpoint(enh_list_df)
-
-    ############ Generate Num/Sum Enhancers within 5kb/10kb ############
-    ##### Make the end be midpoint of enhancer + distance (This gives you the end coordinate of distance range)
-    enh_list_midpoint_file = os.path.join(intermediate_dir, "EnhancerList_midpoint.bed")
-    enh_list_df[["chr", "midpoint", "midpoint", "name"]].to_csv(
-        enh_list_midpoint_file,
-        sep="\t",
-        index=False,
-        header=False,
-    )
-    slop_5kb_file = os.path.join(intermediate_dir, "EnhancerRegions.slop_5kb.bed")
-    os.system(
-        "bedtools slop -b 5000 -i {} -g {} > {}".format(
-            enh_list_midpoint_file, chr_sizes, slop_5kb_file
+    pred_slim_df = pd.read_csv(
+        pred_file, sep="\t", usecols=["chr", "start", "end", "name", "activity_base"]
+    )
+    chr_sizes = read_chr_sizes(chr_sizes)
+
+    ############ Generate Num/Sum Enhancers within each radius ############
+    # The index is built once and shared by all radii
+    pred_index = GenomicIntervalIndex(
+        pred_slim_df["chr"],
+        pred_slim_df["start"],
+        pred_slim_df["end"],
+        weights=pred_slim_df["activity_base"],
+    )
+    for radius in radii:
+        nearby = count_nearby_enhancers(
+            enh_list_df, pred_slim_df, pred_index, chr_sizes, radius
         )
-    )
-    # slop_10kb_file = os.path.join(intermediate_dir, "EnhancerRegions.slop_10kb.bed")
-    # os.system(
-    #     "bedtools slop -b 10000 -i {} -g {} > {}".format(
-    #         enh_list_midpoint_file, chr_sizes, slop_10kb_file
-    #     )
-    # )
-    prediction_slim_file = os.path.join(
-        intermediate_dir, "EnhancerPredictionsAllPutative.slim.bed"
-    )
-    os.system(
-        "zcat {} | csvtk cut -t -f chr,start,end,name,activity_base | sed '1d' > {}".format(
-            pred_file, prediction_slim_file
+        label = radius_label(radius)
+        nearby[["name", "count"]].to_csv(
+            os.path.join(results_dir, f"NumEnhancersEG{label}.txt"),
+            sep="\t",
+            header=False,
+            index=False,
         )
-    )
-    os.system(
-        "bedtools intersect -a {} -b {} -wa -wb > {} | sort -u ".format(
-            slop_5kb_file,
-            prediction_slim_file,
-            os.path.join(intermediate_dir, "NumEnhancers5kb.txt"),
+        nearby[["name", "sum"]].to_csv(
+            os.path.join(results_dir, f"SumEnhancersEG{label}.txt"),
+            sep="\t",
+            header=False,
+            index=False,
         )
-    )
-    # os.system(
-    #     "bedtools intersect -a {} -b {} -wa -wb | sort -u > {}".format(
-    #         slop_10kb_file,
-    #         prediction_slim_file,
-    #         os.path.join(intermediate_dir, "NumEnhancers10kb.txt"),
-    #     )
-    # )
-    data = pd.read_csv(
-        os.path.join(intermediate_dir, "NumEnhancers5kb.txt"),
-        sep="\t",
-        header=None,
-    )
-    data1 = data[data[3] != data[7]]
-    data2 = data1.groupby([3]).size().reset_index(name="count")
-    data3 = data1.groupby([3])[8].sum().reset_index(name="sum")
-    data2.to_csv(
-        os.path.join(results_dir, "NumEnhancersEG5kb.txt"),
-        sep="\t",
-        header=False,
-        index=False,
-    )
-    data3.to_csv(
-        os.path.join(results_dir, "SumEnhancersEG5kb.txt"),
-        sep="\t",
-        header=False,
-        index=False,
-    )
-    # data = pd.read_csv(
-    #     os.path.join(intermediate_dir, "NumEnhancers10kb.txt"),
-    #     sep="\t",
-    #     header=None,
-    # )
-    # data1 = data[data[3] != data[7]]
-    # data2 = data1.groupby([3]).size().reset_index(name="count")
-    # data3 = data1.groupby([3])[8].sum().reset_index(name="sum")
-    # data2.to_csv(
-    #     os.path.join(results_dir, "NumEnhancersEG10kb.txt"),
-    #     sep="\t",
-    #     header=False,
-    #     index=False,
-    # )
-    # data3.to_csv(
-    #     os.path.join(results_dir, "SumEnhancersEG10kb.txt"),
-    #     sep="\t",
-    #     header=False,
-    #     index=False,
-    # )
+        print(f"Saved num/sum enhancers within {label}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,93 @@
+import contextlib
+import gzip
+import os
+
+import click
+
+PREDICTIONS_FILE = "EnhancerPredictionsAllPutative.tsv.gz"
+ENHANCER_LIST_FILE = "EnhancerList.txt"
+MANIFEST_FILE = "chromosomes.txt"
+
+
+def open_text(path, mode="rt"):
+    if path.endswith(".gz"):
+        # shards are short-lived intermediates, so favor speed over compression
+        return gzip.open(path, mode, compresslevel=1)
+    return open(path, mode)
+
+
+def split_table(table_file, output_dir, file_name, chromosomes=None):
+    """
+    Copy the rows of a TSV file with a header and a chr column to
+    output_dir/{chr}/file_name. Rows are copied as text, in input order, so each
+    shard is exactly the input's rows for that chromosome. If chromosomes is given,
+    rows on other chromosomes are dropped and chromosomes without rows get a
+    header-only file. Returns the chromosomes in order of first appearance, and
+    whether any row is not a promoter (if the table has a class column).
+    """
+    shards = {}
+    has_enhancers = False
+    keep = set(chromosomes) if chromosomes is not None else None
+    with open_text(table_file) as f, contextlib.ExitStack() as stack:
+
+        def open_shard(chrom):
+            os.makedirs(os.path.join(output_dir, chrom), exist_ok=True)
+            shard = stack.enter_context(
+                open_text(os.path.join(output_dir, chrom, file_name), "wt")
+            )
+            shard.write(header)
+            return shard
+
+        header = f.readline()
+        columns = header.rstrip("\n").split("\t")
+        chr_idx = columns.index("chr")
+        class_idx = columns.index("class") if "class" in columns else None
+        for line in f:
+            fields = line.split("\t")
+            chrom = fields[chr_idx]
+            if keep is not None and chrom not in keep:
+                continue
+            if chrom not in shards:
+                shards[chrom] = open_shard(chrom)
+            shards[chrom].write(line)
+            if class_idx is not None and fields[class_idx].rstrip("\n") != "promoter":
+                has_enhancers = True
+        for chrom in chromosomes or []:
+            if chrom not in shards:
+                shards[chrom] = open_shard(chrom)
+    return list(shards), has_enhancers
+
+
+def split_by_chromosome(abc_predictions, enhancer_list, output_dir):
+    """
+    Split the ABC predictions and EnhancerList into output_dir/{chr}/ and write
+    the chromosomes, in gather order, to output_dir/chromosomes.txt. The unsharded
+    feature table is sorted by chr, start, end and TargetGene
+    (merge_external_features.R), and data.table sorts chr in C-locale order, so
+    the shards are gathered in sorted chromosome order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    chromosomes, has_enhancers = split_table(
+        abc_predictions, output_dir, PREDICTIONS_FILE
+    )
+    if not has_enhancers:
+        raise Exception("Did not find any enhancers in the Predictions file")
+    split_table(enhancer_list, output_dir, ENHANCER_LIST_FILE, chromosomes)
+
+    chromosomes = sorted(chromosomes)
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as f:
+        f.writelines(chrom + "\n" for chrom in chromosomes)
+    print(f"Split predictions into {len(chromosomes)} chromosome shards")
+    return chromosomes
+
+
+@click.command()
+@click.option("--abc_predictions", required=True)
+@click.option("--enhancer_list", required=True)
+@click.option("--output_dir", required=True)
+def main(abc_predictions, enhancer_list, output_dir):
+    split_by_chromosome(abc_predictions, enhancer_list, output_dir)
+
+
+if __name__ == "__main__":
+    main()
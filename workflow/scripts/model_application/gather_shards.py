@@ -0,0 +1,49 @@
+import gzip
+
+import click
+import pandas as pd
+from table_io import iter_table
+
+
+def gather_shards(shard_files, output_file, chunksize=500000):
+    """
+    Concatenate gzip TSV shards with identical columns into one gzip TSV, in the
+    given order, in one pass. Each shard was written with its own inferred dtypes
+    (e.g. an integer column is float only in the shards where it has missing
+    values), so every chunk is conformed to the dtypes of the first non-empty one
+    (table_io.conform_dtypes) and a column is written the same way in all shards.
+    """
+    columns = None
+    for shard_file in shard_files:
+        shard_columns = list(pd.read_csv(shard_file, sep="\t", nrows=0).columns)
+        if columns is None:
+            columns = shard_columns
+        elif shard_columns != columns:
+            raise Exception(
+                f"{shard_file} does not have the same columns as {shard_files[0]}"
+            )
+    dtypes = None
+    with gzip.open(output_file, "wt") as out:
+        out.write("\t".join(columns) + "\n")
+        for shard_file in shard_files:
+            for df in iter_table(shard_file, chunksize, dtypes=dtypes):
+                if dtypes is None and not df.empty:
+                    dtypes = df.dtypes.to_dict()
+                df.to_csv(out, sep="\t", index=False, header=False)
+
+
+@click.command()
+@click.option("--output_file", required=True)
+@click.option(
+    "--chunksize",
+    type=int,
+    default=500000,
+    help="Read the shards in chunks of this many rows",
+)
+@click.argument("shard_files", nargs=-1, required=True)
+def main(output_file, chunksize, shard_files):
+    gather_shards(shard_files, output_file, chunksize)
+
+
+if __name__ == "__main__":
+    main()
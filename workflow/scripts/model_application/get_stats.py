@@ -3,8 +3,11 @@ import subprocess
 from io import StringIO
 import click
 import pandas as pd
+from table_io import read_table
 
 NORMAL_CHROMOSOMES = set(["chr" + str(x) for x in range(1, 23)] + ["chrX"] + ["chrY"])
+# only these columns of the predictions are parsed
+STATS_COLUMNS = ["chr", "start", "end", "TargetGene", "class", "distanceToTSS"]
 
 
 def count_bam_total(bam_file: str) -> int:
@@ -76,13 +79,7 @@ def get_mean_enh_region_size(df):
     return sizes.mean()
 
 
-@click.command()
-@click.option("--predictions", type=str, required=True)
-@click.option("--accessibility", type=str, required=True)
-@click.option("--output_file", type=str, default="stats.tsv")
-def main(predictions, accessibility, output_file):
-    df = pd.read_csv(predictions, sep="\t")
-    accessibility_files = [f.strip() for f in accessibility.split(" ")]
+def compute_stats(df, accessibility_files):
     stats = [
         ("num_sequencing_reads", get_num_reads(accessibility_files)),
         ("num_enh", get_num_enh(df)),
@@ -97,8 +94,17 @@ def main(predictions, accessibility, output_file):
     ]
     metric = [stat[0] for stat in stats]
     values = [stat[1] for stat in stats]
-    df = pd.DataFrame({"Metric": metric, "Value": values})
-    df.to_csv(output_file, sep="\t", index=False)
+    return pd.DataFrame({"Metric": metric, "Value": values})
+
+
+@click.command()
+@click.option("--predictions", type=str, required=True)
+@click.option("--accessibility", type=str, required=True)
+@click.option("--output_file", type=str, default="stats.tsv")
+def main(predictions, accessibility, output_file):
+    df = read_table(predictions, columns=STATS_COLUMNS)
+    accessibility_files = [f.strip() for f in accessibility.split(" ")]
+    compute_stats(df, accessibility_files).to_csv(output_file, sep="\t", index=False)
 
 
 if __name__ == "__main__":
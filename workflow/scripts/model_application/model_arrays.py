@@ -0,0 +1,149 @@
+"""
+Plain NumPy export of a trained logistic regression (coefficients, intercept,
+feature order and epsilon) so predictions can be computed as
+sigmoid(log(|X| + epsilon) @ coef + intercept) without importing sklearn or
+unpickling the model. The export records a digest of model.pkl, so arrays
+left over from an earlier model.pkl are not used.
+"""
+
+import hashlib
+import os
+import pickle
+from collections import namedtuple
+
+import click
+import numpy as np
+import pandas as pd
+
+MODEL_ARRAYS_VERSION = 2
+
+ModelArrays = namedtuple("ModelArrays", ["coef", "intercept", "features", "epsilon"])
+
+
+def model_arrays_file(trained_model):
+    # model.pkl -> model.npz
+    return os.path.splitext(trained_model)[0] + ".npz"
+
+
+def model_digest(trained_model):
+    """sha256 of the model.pkl file"""
+    digest = hashlib.sha256()
+    with open(trained_model, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def model_arrays_from_model(model, feature_list, epsilon):
+    if not hasattr(model, "coef_"):
+        raise Exception(
+            f"{type(model).__name__} has no coefficients, score it with --scorer sklearn"
+        )
+    if model.coef_.shape != (1, len(feature_list)):
+        raise Exception(
+            f"Expected a binary linear model with {len(feature_list)} coefficients, got shape {model.coef_.shape}"
+        )
+    feature_names = getattr(model, "feature_names_in_", None)
+    if feature_names is not None and list(feature_names) != list(feature_list):
+        raise Exception(
+            f"Model was trained on features {list(feature_names)}, not {list(feature_list)}"
+        )
+    return ModelArrays(
+        coef=np.asarray(model.coef_[0], dtype=np.float64),
+        intercept=float(model.intercept_[0]),
+        features=list(feature_list),
+        epsilon=float(epsilon),
+    )
+
+
+def write_model_arrays(arrays, output_file, digest):
+    with open(output_file, "wb") as f:
+        np.savez(
+            f,
+            version=np.array(MODEL_ARRAYS_VERSION),
+            model_digest=np.array(digest),
+            coef=arrays.coef,
+            intercept=np.array(arrays.intercept),
+            features=np.array(arrays.features, dtype=str),
+            epsilon=np.array(arrays.epsilon),
+        )
+
+
+def read_model_arrays(arrays_file):
+    with np.load(arrays_file, allow_pickle=False) as data:
+        version = int(data["version"])
+        if version != MODEL_ARRAYS_VERSION:
+            raise Exception(
+                f"{arrays_file} has model array version {version}, expected {MODEL_ARRAYS_VERSION}. Please re-export it"
+            )
+        return ModelArrays(
+            coef=data["coef"],
+            intercept=float(data["intercept"]),
+            features=data["features"].tolist(),
+            epsilon=float(data["epsilon"]),
+        )
+
+
+def read_model_arrays_digest(arrays_file):
+    """Digest of the model.pkl the arrays were exported from, None if unknown"""
+    with np.load(arrays_file, allow_pickle=False) as data:
+        if "model_digest" not in data or int(data["version"]) != MODEL_ARRAYS_VERSION:
+            return None
+        return str(data["model_digest"])
+
+
+def log_transform_inplace(X, epsilon):
+    # X <- log(|X| + epsilon), without allocating new blocks
+    np.abs(X, out=X)
+    X += epsilon
+    np.log(X, out=X)
+    return X
+
+
+def sigmoid(z):
+    # numerically stable 1 / (1 + exp(-z))
+    return np.exp(-np.logaddexp(0, -z))
+
+
+def linear_predict_proba(X_transformed, arrays):
+    """Probability of the positive class for already log-transformed features"""
+    z = X_transformed @ arrays.coef.astype(X_transformed.dtype, copy=False)
+    return sigmoid(z + arrays.intercept)
+
+
+def predict_proba_arrays(X, arrays, dtype=np.float64):
+    """
+    Probability of the positive class for raw feature values X (rows x features,
+    columns in arrays.features order). X is copied into a dtype block once and
+    transformed in place.
+    """
+    X = np.array(X, dtype=dtype)
+    return linear_predict_proba(log_transform_inplace(X, arrays.epsilon), arrays)
+
+
+@click.command()
+@click.option(
+    "--model_dir",
+    "model_dirs",
+    multiple=True,
+    required=True,
+    help="Directory with model.pkl and feature_table.tsv. Can be given multiple times",
+)
+@click.option("--epsilon", type=float, default=0.01)
+def main(model_dirs, epsilon):
+    for model_dir in model_dirs:
+        trained_model = os.path.join(model_dir, "model.pkl")
+        feature_table = pd.read_csv(
+            os.path.join(model_dir, "feature_table.tsv"), sep="\t"
+        )
+        with open(trained_model, "rb") as f:
+            model = pickle.load(f)
+        arrays = model_arrays_from_model(model, feature_table["feature"], epsilon)
+        write_model_arrays(
+            arrays, model_arrays_file(trained_model), model_digest(trained_model)
+        )
+        print(f"Saved {model_arrays_file(trained_model)}")
+
+
+if __name__ == "__main__":
+    main()
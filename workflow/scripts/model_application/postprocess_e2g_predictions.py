@@ -0,0 +1,83 @@
+import gzip
+
+import click
+import pandas as pd
+from get_stats import STATS_COLUMNS, compute_stats
+from process_model_output import BEDPE_COLUMNS, write_connections_bedpe_format
+from table_io import iter_table
+from threshold_e2g_predictions import threshold_predictions
+
+
+def threshold_predictions_file(
+    all_predictions_file,
+    threshold,
+    score_column,
+    include_self_promoter,
+    thresholded_file,
+    keep_columns,
+    chunksize=0,
+):
+    """
+    Stream the all-putative predictions once, appending the predictions that pass
+    the threshold to thresholded_file. Returns keep_columns of the thresholded
+    predictions, so the BEDPE and stats don't have to re-read the gzip output.
+    """
+    kept = []
+    with gzip.open(thresholded_file, "wt") as out:
+        for i, df in enumerate(iter_table(all_predictions_file, chunksize)):
+            filtered = threshold_predictions(
+                df, threshold, score_column, include_self_promoter
+            )
+            filtered.to_csv(out, sep="\t", index=False, header=i == 0)
+            kept.append(filtered[keep_columns])
+    return pd.concat(kept, ignore_index=True)
+
+
+@click.command()
+@click.option("--all_predictions_file", required=True)
+@click.option("--threshold", type=float, required=True)
+@click.option("--score_column", required=True)
+@click.option("--include_self_promoter", type=bool, default=True)
+@click.option("--accessibility", type=str, required=True)
+@click.option(
+    "--chunksize",
+    type=int,
+    default=0,
+    help="Read the predictions in chunks of this many rows. 0 loads the whole table",
+)
+@click.option("--thresholded_output", required=True)
+@click.option("--bedpe_output", required=True)
+@click.option("--stats_output", required=True)
+def main(
+    all_predictions_file,
+    threshold,
+    score_column,
+    include_self_promoter,
+    accessibility,
+    chunksize,
+    thresholded_output,
+    bedpe_output,
+    stats_output,
+):
+    bedpe_columns = BEDPE_COLUMNS + ["TargetGeneIsExpressed", score_column]
+    keep_columns = list(dict.fromkeys(bedpe_columns + STATS_COLUMNS))
+    thresholded = threshold_predictions_file(
+        all_predictions_file,
+        threshold,
+        score_column,
+        include_self_promoter,
+        thresholded_output,
+        keep_columns,
+        chunksize,
+    )
+
+    expressed = thresholded.loc[thresholded.TargetGeneIsExpressed, bedpe_columns]
+    write_connections_bedpe_format(expressed, bedpe_output, score_column)
+
+    accessibility_files = [f.strip() for f in accessibility.split(" ")]
+    stats = compute_stats(thresholded[STATS_COLUMNS], accessibility_files)
+    stats.to_csv(stats_output, sep="\t", index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import click
 import pandas as pd
 import os
+from table_io import read_table
+
+BEDPE_COLUMNS = ["chr", "start", "end", "name", "TargetGene", "TargetGeneTSS"]
 
 
 def write_connections_bedpe_format(pred, outfile, score_column):
@@ -28,7 +31,10 @@ def write_connections_bedpe_format(pred, outfile, score_column):
 @click.option("--score_column", required=True)
 @click.option("--bedpe_output", required=True)
 def main(predictions_file, score_column, bedpe_output):
-    pred_thresh = pd.read_csv(predictions_file, sep="\t")
+    pred_thresh = read_table(
+        predictions_file,
+        columns=BEDPE_COLUMNS + ["TargetGeneIsExpressed", score_column],
+    )
     pred_thresh = pred_thresh.loc[pred_thresh.TargetGeneIsExpressed]
     write_connections_bedpe_format(pred_thresh, bedpe_output, score_column)
 
@@ -1,42 +1,198 @@
+import contextlib
+import gzip
+import os
 import pickle
 
 import click
 import numpy as np
 import pandas as pd
+from model_arrays import (
+    ModelArrays,
+    linear_predict_proba,
+    log_transform_inplace,
+    model_arrays_file,
+    model_arrays_from_model,
+    model_digest,
+    read_model_arrays,
+    read_model_arrays_digest,
+)
+from table_io import iter_table
 
 MODEL = "ENCODE-rE2G"
 
 
-def make_e2g_predictions(df_enhancers, feature_list, trained_model, epsilon):
-    # transform the features
+def load_model(trained_model):
+    with open(trained_model, "rb") as f:
+        return pickle.load(f)
+
+
+def read_feature_list(feature_table_file):
+    feature_table = pd.read_csv(feature_table_file, sep="\t")
+    return feature_table["feature"]
+
+
+def fill_missing_values(df_enhancers):
+    df_enhancers = df_enhancers.replace([np.inf, -np.inf], np.nan)
+    return df_enhancers.fillna(0)
+
+
+def transform_features(df_enhancers, feature_list, epsilon):
     X = df_enhancers.loc[:, feature_list]
-    X = np.log(np.abs(X) + epsilon)
+    return np.log(np.abs(X) + epsilon)
 
-    with open(trained_model, "rb") as f:
-        model = pickle.load(f)
+
+def score_e2g_predictions(df_enhancers, feature_list, model, epsilon):
+    X = transform_features(df_enhancers, feature_list, epsilon)
     probs = model.predict_proba(X)
     df_enhancers[MODEL + ".Score"] = probs[:, 1]
     return df_enhancers
 
 
+def make_e2g_predictions(df_enhancers, feature_list, trained_model, epsilon):
+    model = load_model(trained_model)
+    return score_e2g_predictions(df_enhancers, feature_list, model, epsilon)
+
+
+def model_features(models):
+    """Union of the features of (feature_list, model) in models, in order"""
+    return list(
+        pd.unique(pd.concat([pd.Series(feature_list) for feature_list, _ in models]))
+    )
+
+
+def predict_models(df_enhancers, models, epsilon, dtype=np.float64):
+    """
+    Yield the positive class probabilities of each (feature_list, model) in models.
+    The union of the models' features is log-transformed once. If every model is
+    a ModelArrays, the features are copied into a single dtype block, transformed
+    in place and scored in closed form; otherwise sklearn's predict_proba is used.
+    """
+    all_features = model_features(models)
+    if all(isinstance(model, ModelArrays) for _, model in models):
+        X = df_enhancers.loc[:, all_features].to_numpy(dtype=dtype, copy=True)
+        log_transform_inplace(X, epsilon)
+        feature_idx = {feature: i for i, feature in enumerate(all_features)}
+        for feature_list, arrays in models:
+            if arrays.epsilon != epsilon:
+                raise Exception(
+                    f"Model was exported with epsilon={arrays.epsilon}, but epsilon={epsilon} was requested"
+                )
+            # scatter the coefficients into the union so no column subset is copied
+            coef = np.zeros(len(all_features))
+            coef[[feature_idx[feature] for feature in feature_list]] = arrays.coef
+            yield linear_predict_proba(X, arrays._replace(coef=coef))
+    else:
+        X = transform_features(df_enhancers, all_features, epsilon)
+        for feature_list, model in models:
+            yield model.predict_proba(X.loc[:, feature_list])[:, 1]
+
+
+def write_e2g_predictions(
+    predictions, models, epsilon, output_files, chunksize=0, dtype=np.float64
+):
+    """
+    Score the feature table with every (feature_list, model) in models and write
+    one prediction file per model. The table is parsed and NA-filled once. With
+    chunksize > 0 each scored chunk is appended to the gzip outputs, so peak
+    memory is bounded by the chunk size rather than the size of the genome-wide
+    table. Chunks are conformed to the dtypes of the first one (see table_io), so
+    the values are the same as with chunksize=0; only integer columns with
+    missing values are written without decimals.
+    """
+    with contextlib.ExitStack() as stack:
+        outs = [stack.enter_context(gzip.open(f, "wt")) for f in output_files]
+        for i, df_enhancers in enumerate(iter_table(predictions, chunksize)):
+            df_enhancers = fill_missing_values(df_enhancers)
+            probs = predict_models(df_enhancers, models, epsilon, dtype)
+            for model_probs, out in zip(probs, outs):
+                df_enhancers[MODEL + ".Score"] = model_probs
+                df_enhancers.to_csv(out, sep="\t", index=False, header=i == 0)
+
+
+def load_model_arrays(trained_model, feature_list, epsilon):
+    arrays_file = model_arrays_file(trained_model)
+    if not os.path.exists(arrays_file):
+        print(f"{arrays_file} not found, reading coefficients from {trained_model}")
+    elif read_model_arrays_digest(arrays_file) != model_digest(trained_model):
+        print(
+            f"{arrays_file} was not exported from the current {trained_model}, reading coefficients from {trained_model}"
+        )
+    else:
+        return read_model_arrays(arrays_file)
+    return model_arrays_from_model(load_model(trained_model), feature_list, epsilon)
+
+
 @click.command()
-@click.option("--predictions", required=True)
-@click.option("--feature_table_file", required=True)
-@click.option("--trained_model", required=True)
+@click.option(
+    "--predictions", required=True, help="Feature table (.tsv.gz or .parquet)"
+)
+@click.option("--feature_table_file")
+@click.option("--trained_model")
+@click.option(
+    "--model_dir",
+    "model_dirs",
+    multiple=True,
+    help="Model directory with feature_table.tsv and model.pkl. Can be given multiple times to score several models in one pass, with one --output_file per model",
+)
 @click.option("--epsilon", type=float, default=0.01)
-@click.option("--output_file", required=True)
-def main(predictions, feature_table_file, trained_model, epsilon, output_file):
-    feature_table = pd.read_csv(feature_table_file, sep="\t")
-    feature_list = feature_table["feature"]
-
-    df_enhancers = pd.read_csv(predictions, sep="\t")
-    df_enhancers = df_enhancers.replace([np.inf, -np.inf], np.nan)
-    df_enhancers = df_enhancers.fillna(0)
+@click.option("--output_file", "output_files", multiple=True, required=True)
+@click.option(
+    "--chunksize",
+    type=int,
+    default=0,
+    help="Score the feature table in chunks of this many rows. 0 loads the whole table",
+)
+@click.option(
+    "--scorer",
+    type=click.Choice(["sklearn", "numpy"]),
+    default="sklearn",
+    help="numpy scores linear models in closed form from model.npz (see model_arrays.py) instead of unpickling model.pkl",
+)
+@click.option(
+    "--dtype",
+    type=click.Choice(["float64", "float32"]),
+    default="float64",
+    help="Feature block precision for --scorer numpy",
+)
+def main(
+    predictions,
+    feature_table_file,
+    trained_model,
+    model_dirs,
+    epsilon,
+    output_files,
+    chunksize,
+    scorer,
+    dtype,
+):
+    if model_dirs:
+        feature_table_files = [
+            os.path.join(model_dir, "feature_table.tsv") for model_dir in model_dirs
+        ]
+        trained_models = [
+            os.path.join(model_dir, "model.pkl") for model_dir in model_dirs
+        ]
+    elif feature_table_file and trained_model:
+        feature_table_files = [feature_table_file]
+        trained_models = [trained_model]
+    else:
+        raise click.UsageError(
+            "Provide either --model_dir or both --feature_table_file and --trained_model"
+        )
+    if len(output_files) != len(trained_models):
+        raise click.UsageError("Provide one --output_file per model")
 
-    df_enhancers = make_e2g_predictions(
-        df_enhancers, feature_list, trained_model, epsilon
+    models = []
+    for feature_table, model in zip(feature_table_files, trained_models):
+        feature_list = read_feature_list(feature_table)
+        if scorer == "numpy":
+            arrays = load_model_arrays(model, feature_list, epsilon)
+            models.append((arrays.features, arrays))
+        else:
+            models.append((feature_list, load_model(model)))
+    write_e2g_predictions(
+        predictions, models, epsilon, output_files, chunksize, np.dtype(dtype)
     )
-    df_enhancers.to_csv(output_file, compression="gzip", sep="\t", index=False)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,104 @@
+"""
+Readers for feature and prediction tables stored as (gzip) TSV or Parquet,
+chosen by file extension. columns restricts parsing to the listed columns; for
+Parquet only those column chunks are decoded.
+
+Chunked reads are single-pass. TSV chunks are type-inferred by pandas and then
+cast back to the dtypes of the first chunk wherever the difference comes only
+from the values in that chunk (see conform_dtypes). For example, a float column
+whose values in one chunk are all whole numbers stays float. An integer column
+with missing values in some chunks becomes nullable Int64 in those chunks, so it
+is written as integers in every chunk. Parquet batches are cast with the dtypes
+of the whole file, found from its metadata.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+def is_parquet(path):
+    return str(path).endswith(".parquet")
+
+
+def read_table(path, columns=None):
+    if is_parquet(path):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, sep="\t", usecols=columns)
+
+
+def parquet_null_count(parquet_file, name):
+    """Number of nulls in column name, from the row group statistics if written"""
+    metadata = parquet_file.metadata
+    j = metadata.schema.names.index(name)
+    null_count = 0
+    for i in range(metadata.num_row_groups):
+        statistics = metadata.row_group(i).column(j).statistics
+        if statistics is None or not statistics.has_null_count:
+            return parquet_file.read(columns=[name]).column(name).null_count
+        null_count += statistics.null_count
+    return null_count
+
+
+def parquet_dtypes(path, columns=None):
+    """
+    dtypes of the columns read as NumPy integer or bool that have nulls, which
+    pyarrow converts to float and object only in the batches that have nulls
+    """
+    parquet_file = pq.ParquetFile(path)
+    empty = parquet_file.schema_arrow.empty_table().to_pandas()
+    dtypes = {}
+    for name in columns if columns is not None else empty.columns:
+        dtype = empty[name].dtype
+        if not (isinstance(dtype, np.dtype) and dtype.kind in "iub"):
+            continue
+        if parquet_null_count(parquet_file, name) > 0:
+            dtypes[name] = object if dtype.kind == "b" else np.float64
+    return dtypes
+
+
+def conform_dtypes(df, dtypes):
+    """
+    Cast the columns of a chunk to dtypes (those of the first chunk) where pandas
+    inferred another dtype only from the values in this chunk, without changing
+    any value: whole-number floats in an integer column (as nullable Int64, which
+    keeps the missing values), integers in a float column, and text columns with
+    no values. Anything else, e.g. decimals in an integer column, is left as
+    inferred.
+    """
+    for name, dtype in dtypes.items():
+        if name not in df or df[name].dtype == dtype:
+            continue
+        values = df[name]
+        if dtype.kind in "iu" and values.dtype.kind == "f":
+            if (values.dropna() % 1 == 0).all():
+                df[name] = values.astype("Int64")
+        elif dtype.kind == "f" and values.dtype.kind in "iu":
+            df[name] = values.astype(dtype)
+        elif dtype.kind == "O" and values.isna().all():
+            df[name] = values.astype(dtype)
+    return df
+
+
+def iter_table(path, chunksize=0, columns=None, dtypes=None):
+    """
+    Yield the whole table at once, or chunksize rows at a time. Chunks are cast
+    with dtypes: for Parquet, by default those of the whole file
+    (parquet_dtypes); for TSV, by default those of the first chunk, to which
+    later chunks are conformed (conform_dtypes).
+    """
+    if chunksize <= 0:
+        yield read_table(path, columns)
+        return
+    if is_parquet(path):
+        if dtypes is None:
+            dtypes = parquet_dtypes(path, columns)
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas().astype(dtypes)
+        return
+    with pd.read_csv(path, sep="\t", usecols=columns, chunksize=chunksize) as reader:
+        for df in reader:
+            if dtypes is None:
+                dtypes = df.dtypes.to_dict()
+            yield conform_dtypes(df, dtypes)
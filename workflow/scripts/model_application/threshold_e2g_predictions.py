@@ -1,5 +1,6 @@
 import click
 import pandas as pd
+from table_io import read_table
 
 
 def threshold_predictions(all_putative, threshold, score_column, include_self_promoter):
@@ -25,7 +26,7 @@ def threshold_predictions(all_putative, threshold, score_column, include_self_pr
 def main(
     all_predictions_file, threshold, score_column, include_self_promoter, output_file
 ):
-    all_predictions = pd.read_csv(all_predictions_file, sep="\t")
+    all_predictions = read_table(all_predictions_file)
     filtered_predictions = threshold_predictions(
         all_predictions, threshold, score_column, include_self_promoter
     )
@@ -1,68 +1,160 @@
+import os
 import pickle
 import click
 import numpy as np
 import pandas as pd
-import scipy
+from joblib import delayed
 from training_functions import (
-    statistic_aupr,
-    statistic_precision,
-    train_and_predict_once,
-    bootstrap_pvalue,
-    statistic_delta_aupr,
-    statistic_delta_precision,
+    ChromosomeFolds,
+    CheckpointJournal,
+    PRCurve,
+    bootstrap_aupr,
+    fit_folds,
+    run_journaled,
 )
 
 
-def compare_feature_sets(df_dataset, feature_table, epsilon, params, n_boot):
-    feature_list = feature_table["feature"]
+def feature_set_membership(n_features):
+    """
+    0/1 matrix (feature sets x features) of every non-empty feature set, in the order
+    of the binary numbers 1 .. 2^n_features - 1 with the first feature as the most
+    significant bit
+    """
+    sets = np.arange(1, 2**n_features, dtype=np.int64)
+    bits = np.arange(n_features - 1, -1, -1, dtype=np.int64)
+    return (sets[:, None] >> bits) & 1
+
+
+# columns of each feature set's results; sets left out by pruning only have AUPRC_point
+RESULT_COLUMNS = ["AUPRC", "AUPRC_95CI_low", "AUPRC_95CI_high", "AUPRC_point"]
+
+
+def point_aupr_feature_set(folds, features, params):
+    scores, _ = fit_folds(folds, features, params)
+    return PRCurve(folds.Y, scores).aupr, scores
+
+
+def bootstrap_scores(Y_true, scores, n_boot):
+    res_aupr = bootstrap_aupr(Y_true, scores, n_resamples=n_boot, confidence_level=0.95)
+    return [
+        np.mean(res_aupr.bootstrap_distribution),
+        res_aupr.confidence_interval[0],
+        res_aupr.confidence_interval[1],
+        PRCurve(Y_true, scores).aupr,
+    ]
+
+
+def bootstrap_feature_set(folds, features, params, n_boot):
+    scores, _ = fit_folds(folds, features, params)
+    return bootstrap_scores(folds.Y, scores, n_boot)
+
+
+# feature sets are evaluated n_workers at a time in parallel processes. completed sets are
+# recorded in checkpoint_file (if given), so a killed run resumes where it stopped.
+# with prune_margin, every set is first scored by its point auPR and only sets within
+# prune_margin of the best one are bootstrapped, reusing the scores of the point fit; the
+# others only have AUPRC_point and are listed after the bootstrapped sets.
+def compare_feature_sets(
+    df_dataset,
+    feature_table,
+    epsilon,
+    params,
+    n_boot,
+    n_workers=1,
+    checkpoint_file=None,
+    prune_margin=None,
+):
+    feature_list = list(feature_table["feature"])
     X = df_dataset.loc[:, feature_list]
     X = np.log(np.abs(X) + epsilon)
     Y_true = df_dataset["Regulated"].values.astype(np.int64)
+    folds = ChromosomeFolds.from_dataset(df_dataset, X, Y_true)
 
     # specify all feature sets
-    n_features = len(feature_list)
-    n_sets_iter = 2**n_features
-    df = pd.DataFrame(columns=feature_list)
-
-    for i in range(1, n_sets_iter):
-        binary_n = str(bin(i).replace("0b", ""))  # convert to binary
-        fill_zeros = list(
-            map(int, [*binary_n.zfill(n_features)])
-        )  # convert to list of ints of length n_features
-        df.loc[len(df)] = fill_zeros
-
-    df["features"] = df.apply(lambda row: list(df.columns[row == 1]), axis=1)
-    df["n_features"] = 0
-    df["AUPRC"] = 0
-    df["AUPRC_95CI_low"] = 0
-    df["AUPRC_95CI_high"] = 0
-
-    for i in range(len(df)):  # iterate through sets
-        model_name = "row_" + str(i)
-        if i % 100 == 0:
-            print(model_name)
-        features = df.loc[i, "features"]
-        df.loc[i, "n_features"] = len(features)
-        df_dataset = train_and_predict_once(
-            df_dataset, X, Y_true, features, model_name, params
+    membership = feature_set_membership(len(feature_list))
+    feature_sets = [
+        [feature_list[j] for j in np.flatnonzero(row)] for row in membership
+    ]
+    print(f"Evaluating {len(feature_sets)} feature sets")
+
+    journal = CheckpointJournal(
+        checkpoint_file,
+        {
+            "data": folds.fingerprint(),
+            "epsilon": epsilon,
+            "params": params,
+            "n_boot": n_boot,
+            "columns": RESULT_COLUMNS,
+        },
+    )
+    boot_sets = range(len(feature_sets))
+    # scores of point fits that may survive pruning, by task key
+    point_scores = {}
+    if prune_margin is not None:
+        best_aupr = -np.inf
+
+        def keep_scores(key, aupr, scores):
+            # scores are dropped once a better set puts them out of prune_margin
+            nonlocal best_aupr
+            best_aupr = max(best_aupr, aupr)
+            point_scores[key] = (aupr, scores)
+            for other in list(point_scores):
+                if point_scores[other][0] < best_aupr - prune_margin:
+                    del point_scores[other]
+
+        point_aupr = run_journaled(
+            [
+                (f"point_{i}", delayed(point_aupr_feature_set)(folds, features, params))
+                for i, features in enumerate(feature_sets)
+            ],
+            journal,
+            n_workers,
+            keep=keep_scores,
         )
-        Y_pred = df_dataset[model_name + ".Score"]
-
-        data = (Y_true, Y_pred)
-        res_aupr = scipy.stats.bootstrap(
-            data,
-            statistic_aupr,
-            n_resamples=n_boot,
-            paired=True,
-            confidence_level=0.95,
-            method="BCa",
+        best_aupr = max(point_aupr.values())
+        boot_sets = [
+            i for i in boot_sets if point_aupr[f"point_{i}"] >= best_aupr - prune_margin
+        ]
+        print(
+            f"Bootstrapping {len(boot_sets)} feature sets within {prune_margin} of the best auPR"
         )
-        df.loc[i, "AUPRC"] = np.mean(res_aupr.bootstrap_distribution)
-        df.loc[i, "AUPRC_95CI_low"] = res_aupr.confidence_interval[0]
-        df.loc[i, "AUPRC_95CI_high"] = res_aupr.confidence_interval[1]
-
-    # sort table by AUPRC
-    df = df.sort_values(by="AUPRC", ascending=False)
+    boot = run_journaled(
+        [
+            (
+                f"bootstrap_{i}",
+                (
+                    delayed(bootstrap_scores)(
+                        folds.Y, point_scores[f"point_{i}"][1], n_boot
+                    )
+                    if f"point_{i}" in point_scores
+                    # point fits read back from the journal are fit again
+                    else delayed(bootstrap_feature_set)(
+                        folds, feature_sets[i], params, n_boot
+                    )
+                ),
+            )
+            for i in boot_sets
+        ],
+        journal,
+        n_workers,
+    )
+
+    results = np.full((len(feature_sets), len(RESULT_COLUMNS)), np.nan)
+    for i in range(len(feature_sets)):
+        if f"bootstrap_{i}" in boot:
+            results[i] = boot[f"bootstrap_{i}"]
+        else:
+            results[i, RESULT_COLUMNS.index("AUPRC_point")] = point_aupr[f"point_{i}"]
+
+    df = pd.DataFrame(membership, columns=feature_list)
+    df["features"] = feature_sets
+    df["n_features"] = membership.sum(axis=1)
+    for j, column in enumerate(RESULT_COLUMNS):
+        df[column] = results[:, j]
+
+    # sort table by AUPRC, then the sets that weren't bootstrapped by AUPRC_point
+    df = df.sort_values(by=["AUPRC", "AUPRC_point"], ascending=False)
+    journal.close()
 
     return df
 
@@ -73,16 +165,55 @@ def compare_feature_sets(df_dataset, feature_table, epsilon, params, n_boot):
 @click.option("--out_dir", required=True)
 @click.option("--epsilon", type=float, default=0.01)
 @click.option("--params_file", required=True)
-def main(crispr_features_file, feature_table_file, out_dir, epsilon, params_file):
+@click.option(
+    "--n_workers",
+    type=int,
+    default=1,
+    help="Number of processes used to evaluate feature sets in parallel",
+)
+@click.option("--n_boot", type=int, default=1000)
+@click.option(
+    "--checkpoint_file",
+    default=None,
+    help="Record completed feature sets here to resume an interrupted run. Deleted once the output is written",
+)
+@click.option(
+    "--prune_margin",
+    type=float,
+    default=None,
+    help="Only bootstrap feature sets whose auPR is within this margin of the best one",
+)
+def main(
+    crispr_features_file,
+    feature_table_file,
+    out_dir,
+    epsilon,
+    params_file,
+    n_workers,
+    n_boot,
+    checkpoint_file,
+    prune_margin,
+):
     df_dataset = pd.read_csv(crispr_features_file, sep="\t")
     feature_table = pd.read_csv(feature_table_file, sep="\t")
 
     with open(params_file, "rb") as handle:
         params = pickle.load(handle)
 
-    res = compare_feature_sets(df_dataset, feature_table, epsilon, params, n_boot=1000)
+    res = compare_feature_sets(
+        df_dataset,
+        feature_table,
+        epsilon,
+        params,
+        n_boot=n_boot,
+        n_workers=n_workers,
+        checkpoint_file=checkpoint_file,
+        prune_margin=prune_margin,
+    )
 
     res.to_csv(out_dir + "/all_feature_sets.tsv", sep="\t", index=False)
+    if checkpoint_file is not None:
+        os.remove(checkpoint_file)
 
 
 if __name__ == "__main__":
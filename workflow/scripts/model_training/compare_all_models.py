@@ -1,19 +1,50 @@
-import pickle
+import hashlib
 import os
 import click
 import numpy as np
 import pandas as pd
-import scipy
+from joblib import delayed
 from training_functions import (
+    BootstrapResult,
+    CheckpointJournal,
+    bootstrap_pvalue,
+    run_journaled,
     statistic_aupr,
-    statistic_precision_at_threshold,
     threshold_70_pct_recall,
+    bootstrap_aupr,
+    bootstrap_precision_at_threshold,
 )
 
 
-def performance_summary(
-    model_id, dataset, model_name, out_dir, crispr_data="", n_boot=1000
+def file_digest(*files):
+    digest = hashlib.sha1()
+    for file in files:
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def predictions_file(out_dir, dataset, model_id):
+    return os.path.join(out_dir, dataset, model_id, "model", "training_predictions.tsv")
+
+
+def missing_file(out_dir, dataset):
+    return os.path.join(
+        out_dir,
+        dataset,
+        "missing.EPCrisprBenchmark_ensemble_data_GRCh38.K562_features_NAfilled.tsv.gz",
+    )
+
+
+def evaluation_data(
+    model_id, dataset, model_name, out_dir, crispr_data="", missing_df=None
 ):
+    """
+    (Y_true, Y_pred, pct_missing) of a model's cross-validated predictions, with CRISPR
+    pairs that aren't in its training data scored 0. Pass the dataset's missing_df to
+    avoid reading it again for every model.
+    """
     # read in predicitons
     if model_id == "distance":
         crispr_data = pd.read_csv(crispr_data, sep="\t")
@@ -26,16 +57,9 @@ def performance_summary(
         Y_pred_all = crispr_data["distance"] * -1
         pct_missing = 0
     else:  # normal models
-        pred_file = os.path.join(
-            out_dir, dataset, model_id, "model", "training_predictions.tsv"
-        )
-        missing_file = os.path.join(
-            out_dir,
-            dataset,
-            "missing.EPCrisprBenchmark_ensemble_data_GRCh38.K562_features_NAfilled.tsv.gz",
-        )
-        pred_df = pd.read_csv(pred_file, sep="\t")
-        missing_df = pd.read_csv(missing_file, sep="\t")
+        pred_df = pd.read_csv(predictions_file(out_dir, dataset, model_id), sep="\t")
+        if missing_df is None:
+            missing_df = pd.read_csv(missing_file(out_dir, dataset), sep="\t")
 
         # extract relevant data from predictions
         Y_true = pred_df["Regulated"].values.astype(np.int64)
@@ -44,59 +68,123 @@ def performance_summary(
         # add rows for crispr pairs not in predictions/training data
         n_missing = len(missing_df)
         if n_missing > 0:
-            missing_df[model_name + ".Score"] = 0
             Y_true_missing = missing_df["Regulated"].values.astype(np.int64)
-            Y_pred_missing = missing_df[model_name + ".Score"]
+            Y_pred_missing = np.zeros(n_missing)
             Y_true_all = np.concatenate((Y_true, Y_true_missing))
             Y_pred_all = np.concatenate((Y_pred, Y_pred_missing))
         else:
             Y_true_all = Y_true
             Y_pred_all = Y_pred
         pct_missing = n_missing / len(Y_true_all)
+    return Y_true_all, Y_pred_all, pct_missing
+
 
-    # evaluate
-    res_aupr = scipy.stats.bootstrap(
-        (Y_true_all, Y_pred_all),
-        statistic_aupr,
+def bootstrap_performance(Y_true_all, Y_pred_all, n_boot=1000, random_state=None):
+    """
+    Bootstrapped auPR and precision at 70% recall, and the auPR bootstrap distribution.
+    Models evaluated on the same pairs with the same random_state share resamples.
+    """
+    res_aupr = bootstrap_aupr(
+        Y_true_all,
+        Y_pred_all,
         n_resamples=n_boot,
-        paired=True,
         confidence_level=0.95,
-        method="BCa",
+        random_state=random_state,
     )
     thresh = threshold_70_pct_recall(
         Y_true_all, Y_pred_all
     )  # will return None if max recall < 70%
     if thresh is not None:
-        res_prec = scipy.stats.bootstrap(
-            (Y_true_all, Y_pred_all),
-            lambda Y_true, Y_pred: statistic_precision_at_threshold(
-                Y_true, Y_pred, thresh
-            ),
+        res_prec = bootstrap_precision_at_threshold(
+            Y_true_all,
+            Y_pred_all,
+            thresh,
             n_resamples=n_boot,
-            paired=True,
             confidence_level=0.95,
-            method="BCa",
+            random_state=random_state,
         )
     prec_mean = 0 if thresh is None else np.mean(res_prec.bootstrap_distribution)
     prec_low = 0 if thresh is None else res_prec.confidence_interval[0]
     prec_high = 0 if thresh is None else res_prec.confidence_interval[1]
 
-    res_row = pd.DataFrame(
-        {
+    metrics = {
+        "AUPRC": np.mean(res_aupr.bootstrap_distribution),
+        "AUPRC_95CI_low": res_aupr.confidence_interval[0],
+        "AUPRC_95CI_high": res_aupr.confidence_interval[1],
+        "precision": prec_mean,
+        "precision_95CI_low": prec_low,
+        "precision_95CI_high": prec_high,
+        "threshold_70_pct_recall": thresh,
+    }
+    return metrics, res_aupr.bootstrap_distribution
+
+
+def evaluate_model(
+    model_id,
+    dataset,
+    model_name,
+    out_dir,
+    crispr_data="",
+    missing_df=None,
+    n_boot=1000,
+    random_state=None,
+):
+    """
+    The model's row of the comparison table, plus its point auPR, auPR bootstrap
+    distribution and a digest of its CRISPR labels for paired comparisons
+    """
+    Y_true_all, Y_pred_all, pct_missing = evaluation_data(
+        model_id, dataset, model_name, out_dir, crispr_data, missing_df
+    )
+    metrics, aupr_boot = bootstrap_performance(
+        Y_true_all, Y_pred_all, n_boot, random_state
+    )
+    return {
+        "row": {
             "model": model_id,
             "dataset": dataset,
-            "AUPRC": np.mean(res_aupr.bootstrap_distribution),
-            "AUPRC_95CI_low": res_aupr.confidence_interval[0],
-            "AUPRC_95CI_high": res_aupr.confidence_interval[1],
-            "precision": prec_mean,
-            "precision_95CI_low": prec_low,
-            "precision_95CI_high": prec_high,
-            "threshold_70_pct_recall": thresh,
+            **metrics,
             "pct_missing_elements": pct_missing,
         },
-        index=[0],
+        "aupr": statistic_aupr(Y_true_all, Y_pred_all),
+        "aupr_boot": aupr_boot,
+        "labels": hashlib.sha1(Y_true_all.tobytes()).hexdigest(),
+    }
+
+
+def paired_comparisons(results):
+    """
+    auPR of each model minus that of the best model of its dataset, on the same
+    bootstrap resamples: mean, 95% CI and p-value of the difference. Models alone in
+    their dataset, or whose CRISPR pairs differ from the best model's, get NaN.
+    """
+    rows = pd.DataFrame([result["row"] for result in results])
+    comparisons = np.full((len(results), 4), np.nan)
+    for _, group in rows.groupby("dataset"):
+        if len(group) < 2:
+            continue
+        best = results[group["AUPRC"].idxmax()]
+        for k in group.index:
+            if results[k]["labels"] != best["labels"]:
+                continue
+            delta_boot = np.asarray(results[k]["aupr_boot"]) - np.asarray(
+                best["aupr_boot"]
+            )
+            delta = results[k]["aupr"] - best["aupr"]
+            comparisons[k] = [
+                np.mean(delta_boot),
+                *np.quantile(delta_boot, [0.025, 0.975]),
+                bootstrap_pvalue(delta, BootstrapResult(None, delta_boot, None)),
+            ]
+    return pd.DataFrame(
+        comparisons,
+        columns=[
+            "delta_AUPRC_vs_best",
+            "delta_AUPRC_95CI_low",
+            "delta_AUPRC_95CI_high",
+            "delta_AUPRC_pvalue",
+        ],
     )
-    return res_row
 
 
 @click.command()
@@ -104,38 +192,87 @@ def performance_summary(
 @click.option("--output_file", required=True)
 @click.option("--crispr_data", required=True)
 @click.option("--out_dir", required=True)
-def main(model_config_file, output_file, crispr_data, out_dir):
+@click.option("--n_boot", type=int, default=1000)
+@click.option(
+    "--seed",
+    type=int,
+    default=0,
+    help="Seed of the bootstrap resamples. Every model of a dataset is evaluated on the same resamples",
+)
+@click.option(
+    "--n_workers",
+    type=int,
+    default=1,
+    help="Number of processes used to evaluate models in parallel",
+)
+@click.option(
+    "--cache_file",
+    default=None,
+    help="Keep each model's results here, so a rerun only evaluates models that are new or whose predictions changed",
+)
+def main(
+    model_config_file,
+    output_file,
+    crispr_data,
+    out_dir,
+    n_boot,
+    seed,
+    n_workers,
+    cache_file,
+):
     model_name = "ENCODE-rE2G"
     model_config = (
         pd.read_table(model_config_file, na_values="")
         .fillna("None")
         .set_index("model", drop=False)
     )
-    # initiate final df
-    df = pd.DataFrame(
-        columns=[
-            "model",
-            "dataset",
-            "AUPRC",
-            "AUPRC_95CI_low",
-            "AUPRC_95CI_high",
-            "precision",
-            "precision_95CI_low",
-            "precision_95CI_high",
-            "threshold_70_pct_recall",
-            "pct_missing_elements",
-        ]
-    )
 
-    # iterate through rows of model config and add results to final df
+    # one task per model of the config and one for distance, keyed by their input files
+    # so cached results are reused until a model's predictions change
+    missing = {}
+    tasks = []
     for row in model_config.itertuples(index=False):
-        res_row = performance_summary(row.model, row.dataset, model_name, out_dir)
-        df = pd.concat([df, res_row])
+        if row.dataset not in missing:
+            missing[row.dataset] = (
+                pd.read_csv(missing_file(out_dir, row.dataset), sep="\t"),
+                file_digest(missing_file(out_dir, row.dataset)),
+            )
+        missing_df, missing_digest = missing[row.dataset]
+        pred_digest = file_digest(predictions_file(out_dir, row.dataset, row.model))
+        tasks.append(
+            (
+                f"{row.dataset}/{row.model}/{pred_digest}/{missing_digest}",
+                delayed(evaluate_model)(
+                    row.model,
+                    row.dataset,
+                    model_name,
+                    out_dir,
+                    "",
+                    missing_df,
+                    n_boot,
+                    seed,
+                ),
+            )
+        )
     # add row for distance
-    res_row = performance_summary(
-        "distance", "baseline", "", out_dir, crispr_data=crispr_data
+    tasks.append(
+        (
+            f"baseline/distance/{file_digest(crispr_data)}",
+            delayed(evaluate_model)(
+                "distance", "baseline", "", out_dir, crispr_data, None, n_boot, seed
+            ),
+        )
     )
-    df = pd.concat([df, res_row])
+
+    journal = CheckpointJournal(cache_file, {"n_boot": n_boot, "seed": seed})
+    results = run_journaled(tasks, journal, n_workers)
+    # forget models that were removed from the config or whose predictions changed
+    journal.compact(key for key, _ in tasks)
+    journal.close()
+    results = [results[key] for key, _ in tasks]
+
+    df = pd.DataFrame([result["row"] for result in results])
+    df = pd.concat([df, paired_comparisons(results)], axis=1)
 
     # sort table by AUPRC
     df = df.sort_values(by="AUPRC", ascending=False)
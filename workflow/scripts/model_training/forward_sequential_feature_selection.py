@@ -1,54 +1,47 @@
+import os
 import pickle
 import click
 import numpy as np
 import pandas as pd
-import scipy
-from sklearn.metrics import precision_recall_curve, auc, log_loss, roc_auc_score
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.linear_model import LogisticRegression
 from training_functions import (
-    statistic_aupr,
-    statistic_precision,
-    train_and_predict_once,
+    training_features,
+    fit_folds,
+    ChromosomeFolds,
+    CheckpointJournal,
+    ScoreStore,
+    extend_coefs,
+    evaluate_candidates,
+    select_best_candidate,
     bootstrap_pvalue,
-    statistic_delta_aupr,
     threshold_70_pct_recall,
-    statistic_precision_at_threshold,
-    statistic_delta_precision_at_threshold,
+    bootstrap_aupr,
+    bootstrap_precision_at_threshold,
+    bootstrap_delta_aupr,
+    bootstrap_delta_precision_at_threshold,
 )
 
 
-def SFFS(df_dataset, feature_table, model_name, epsilon, params, polynomial=False):
-    feature_list_core = feature_table["feature"]
+# folds: ChromosomeFolds of the transformed features, feature_list: their names
+def SFFS(
+    folds,
+    feature_list,
+    model_name,
+    params,
+    n_workers=1,
+    warm_start=False,
+    journal=None,
+):
     model_name_core = model_name
 
-    # add polynomial features
-    if polynomial:
-        X_core = df_dataset.loc[:, feature_list_core]
-        poly = PolynomialFeatures(degree=2)
-        X_2 = poly.fit_transform(X_core)
-        polynomial_names = poly.get_feature_names_out(X_core.columns)
-        X_2 = pd.DataFrame(X_2, columns=polynomial_names)
-        X = X_2
-        feature_list = pd.Series(polynomial_names)
-    else:
-        X = df_dataset.loc[:, feature_list_core]
-        feature_list = feature_list_core
-
-    # # tranforms features
-    X = np.log(np.abs(X) + epsilon)
-    Y_true = df_dataset["Regulated"].values.astype(np.int64)
-
     n_features = len(feature_list)
 
     best_features = []
+    best_coefs = None  # per-fold coefficients of the selected model, to warm-start the next round
     all_auprs = []
     all_precisions = []
 
     for i in range(n_features):  # iterate (# of feature) times
-        best_k = -1
-        best_aupr = 0
-        best_precision = 0
+        candidates = []
         for k in range(
             len(feature_list)
         ):  # iterate through each feature, choose best one
@@ -58,26 +51,22 @@ def SFFS(df_dataset, feature_table, model_name, epsilon, params, polynomial=Fals
             print(features)
             model_name = model_name_core + "_" + str(i + 1) + "_" + str(k + 1)
             print(model_name)
+            candidates.append(features)
 
-            df_dataset = train_and_predict_once(
-                df_dataset, X, Y_true, features, model_name, params
-            )
-
-            # evaluate model once trained
-            Y_pred = df_dataset[model_name + ".Score"]
-            aupr = statistic_aupr(Y_true, Y_pred)
-            thresh = threshold_70_pct_recall(Y_true, Y_pred)
-            precision_at_70_pct_recall = statistic_precision_at_threshold(
-                Y_true, Y_pred, thresh
-            )
-
-            if aupr >= best_aupr:
-                best_aupr = aupr
-                best_k = k
-                best_precision = precision_at_70_pct_recall
+        # fit the candidates of this round in parallel, scores are kept per candidate
+        init_coefs = extend_coefs(best_coefs) if warm_start and best_coefs else None
+        keys = [f"sffs_{i}_{features[-1]}" for features in candidates]
+        results = evaluate_candidates(
+            folds, candidates, params, n_workers, init_coefs, journal, keys
+        )
+        best_k = select_best_candidate(results)
+        best_aupr = results[best_k].aupr
+        best_precision = results[best_k].precision
+        best_candidate_coefs = results[best_k].fold_coefs
 
         # update best feature
         best_features = best_features + [feature_list[best_k]]
+        best_coefs = best_candidate_coefs
         all_auprs = all_auprs + [best_aupr]
         all_precisions = all_precisions + [best_precision]
         feature_list = feature_list.loc[
@@ -91,33 +80,31 @@ def SFFS(df_dataset, feature_table, model_name, epsilon, params, polynomial=Fals
 
 
 def SFFS_significance(
-    df_dataset,
-    feature_table,
+    folds,
+    feature_list,
     model_name,
-    epsilon,
     params,
-    polynomial=False,
     n_boot=1000,
+    n_workers=1,
+    warm_start=False,
+    checkpoint_file=None,
 ):
-    feature_list = SFFS(
-        df_dataset, feature_table, model_name, epsilon, params, polynomial
-    )  # get order of features
-    feature_list_core = feature_table["feature"]
     model_name_core = model_name
+    Y_true = folds.Y
 
-    # calculate polynomial features
-    if polynomial:
-        X_core = df_dataset.loc[:, feature_list_core]
-        poly = PolynomialFeatures(degree=2)
-        X_2 = poly.fit_transform(X_core)
-        polynomial_names = poly.get_feature_names_out(X_core.columns)
-        X_2 = pd.DataFrame(X_2, columns=polynomial_names)
-        X = X_2
-    else:
-        X = df_dataset.loc[:, feature_list_core]
-
-    X = np.log(np.abs(X) + epsilon)
-    Y_true = df_dataset["Regulated"].values.astype(np.int64)
+    # completed selection candidates and significance steps, to resume an interrupted run
+    journal = CheckpointJournal(
+        checkpoint_file,
+        {
+            "data": folds.fingerprint(),
+            "params": params,
+            "warm_start": warm_start,
+            "n_boot": n_boot,
+        },
+    )
+    feature_list = SFFS(
+        folds, feature_list, model_name, params, n_workers, warm_start, journal
+    )  # get order of features
 
     df = pd.DataFrame(
         columns=[
@@ -134,29 +121,20 @@ def SFFS_significance(
             "pval_precision",
         ]
     )
+    # scores of the baseline and every model, kept out of df_dataset
+    score_store = ScoreStore(len(Y_true), capacity=len(feature_list) + 1)
+
     # evaluate baseline model
-    df_dataset["all_true"] = 1
-    Y_new = df_dataset["all_true"]
+    score_store["all_true"] = 1
+    Y_new = score_store["all_true"]
 
     data = (Y_true, Y_new)
-    res_aupr = scipy.stats.bootstrap(
-        data,
-        statistic_aupr,
-        n_resamples=n_boot,
-        paired=True,
-        confidence_level=0.95,
-        method="BCa",
-    )
+    res_aupr = bootstrap_aupr(*data, n_resamples=n_boot, confidence_level=0.95)
     thresh = threshold_70_pct_recall(
         Y_true, Y_new
     )  # will return None if max recall < 70%
-    res_precision = scipy.stats.bootstrap(
-        data,
-        lambda Y_true, Y_pred: statistic_precision_at_threshold(Y_true, Y_pred, thresh),
-        n_resamples=n_boot,
-        paired=True,
-        confidence_level=0.95,
-        method="BCa",
+    res_precision = bootstrap_precision_at_threshold(
+        *data, thresh, n_resamples=n_boot, confidence_level=0.95
     )
 
     aupr = np.mean(res_aupr.bootstrap_distribution)
@@ -182,37 +160,38 @@ def SFFS_significance(
     Y_last = Y_new
 
     features = []
+    last_coefs = None
     # loop through to train next model and compare
     for i in range(0, len(feature_list)):
         feature_added = feature_list[i]
         features = features + [feature_added]
         model_name = model_name_core + "_" + str(i + 1)
         print(model_name)
-        df_dataset = train_and_predict_once(
-            df_dataset, X, Y_true, features, model_name, params
-        )
-        Y_new = df_dataset[model_name + ".Score"]
+        key = f"significance_{i}"
+        if key in journal:
+            record = journal[key]
+            df = pd.concat([df, pd.DataFrame(record["row"], index=[0])])
+            score_store[model_name + ".Score"] = record["scores"]
+            Y_last = score_store[model_name + ".Score"]
+            last_coefs = record["fold_coefs"]
+            continue
+        init_coefs = extend_coefs(last_coefs) if warm_start and last_coefs else None
+        scores, last_coefs = fit_folds(folds, features, params, init_coefs, n_workers)
+        score_store[model_name + ".Score"] = scores
+        Y_new = score_store[model_name + ".Score"]
 
         data_compare = (Y_true, Y_last, Y_new)
         thresh_last = threshold_70_pct_recall(Y_true, Y_last)
         thresh_new = threshold_70_pct_recall(Y_true, Y_new)
-        res_delta_aupr = scipy.stats.bootstrap(
-            data_compare,
-            statistic_delta_aupr,
-            n_resamples=n_boot,
-            paired=True,
-            confidence_level=0.95,
-            method="BCa",
+        res_delta_aupr = bootstrap_delta_aupr(
+            *data_compare, n_resamples=n_boot, confidence_level=0.95
         )
-        res_delta_precision = scipy.stats.bootstrap(
-            data_compare,
-            lambda Y_true, Y_last, Y_new,: statistic_delta_precision_at_threshold(
-                Y_true, Y_last, Y_new, thresh_last, thresh_new
-            ),
+        res_delta_precision = bootstrap_delta_precision_at_threshold(
+            *data_compare,
+            thresh_last,
+            thresh_new,
             n_resamples=n_boot,
-            paired=True,
             confidence_level=0.95,
-            method="BCa",
         )
         delta_aupr = np.mean(
             res_delta_aupr.bootstrap_distribution
@@ -222,49 +201,34 @@ def SFFS_significance(
         pval_precision = bootstrap_pvalue(delta_precision, res_delta_precision)
 
         data = (Y_true, Y_new)
-        res_aupr = scipy.stats.bootstrap(
-            data,
-            statistic_aupr,
-            n_resamples=n_boot,
-            paired=True,
-            confidence_level=0.95,
-            method="BCa",
-        )
+        res_aupr = bootstrap_aupr(*data, n_resamples=n_boot, confidence_level=0.95)
         thresh = threshold_70_pct_recall(
             Y_true, Y_new
         )  # will return None if max recall < 70%
-        res_precision = scipy.stats.bootstrap(
-            data,
-            lambda Y_true, Y_pred: statistic_precision_at_threshold(
-                Y_true, Y_pred, thresh
-            ),
-            n_resamples=n_boot,
-            paired=True,
-            confidence_level=0.95,
-            method="BCa",
+        res_precision = bootstrap_precision_at_threshold(
+            *data, thresh, n_resamples=n_boot, confidence_level=0.95
         )
 
         aupr = np.mean(res_aupr.bootstrap_distribution)
         precision = np.mean(res_precision.bootstrap_distribution)
 
-        df_temp = pd.DataFrame(
-            {
-                "feature_added": feature_added,
-                "aupr": aupr,
-                "delta_aupr": delta_aupr,
-                "delta_aupr_low": res_delta_aupr.confidence_interval[0],
-                "delta_aupr_high": res_delta_aupr.confidence_interval[1],
-                "pval_aupr": pval_aupr,
-                "precision": precision,
-                "delta_precision": delta_precision,
-                "delta_precision_low": res_delta_precision.confidence_interval[0],
-                "delta_precision_high": res_delta_precision.confidence_interval[1],
-                "pval_precision": pval_precision,
-            },
-            index=[0],
-        )
-        df = pd.concat([df, df_temp])
+        row = {
+            "feature_added": feature_added,
+            "aupr": aupr,
+            "delta_aupr": delta_aupr,
+            "delta_aupr_low": res_delta_aupr.confidence_interval[0],
+            "delta_aupr_high": res_delta_aupr.confidence_interval[1],
+            "pval_aupr": pval_aupr,
+            "precision": precision,
+            "delta_precision": delta_precision,
+            "delta_precision_low": res_delta_precision.confidence_interval[0],
+            "delta_precision_high": res_delta_precision.confidence_interval[1],
+            "pval_precision": pval_precision,
+        }
+        df = pd.concat([df, pd.DataFrame(row, index=[0])])
         Y_last = Y_new
+        journal.record([(key, {"row": row, "scores": Y_new, "fold_coefs": last_coefs})])
+    journal.close()
 
     return df
 
@@ -276,8 +240,33 @@ def SFFS_significance(
 @click.option("--polynomial", type=bool, default=False)
 @click.option("--epsilon", type=float, default=0.01)
 @click.option("--params_file", required=True)
+@click.option(
+    "--n_workers",
+    type=int,
+    default=1,
+    help="Number of processes used to fit the candidate models of each selection round, and the chromosome folds of the significance models, in parallel",
+)
+@click.option(
+    "--warm_start",
+    type=bool,
+    default=False,
+    help="Start each candidate fit from the previous round's per-chromosome coefficients (0 for the added feature) instead of from zero",
+)
+@click.option(
+    "--checkpoint_file",
+    default=None,
+    help="Record completed candidates and models here to resume an interrupted run. Deleted once the output is written",
+)
 def main(
-    crispr_features_file, feature_table_file, out_dir, polynomial, epsilon, params_file
+    crispr_features_file,
+    feature_table_file,
+    out_dir,
+    polynomial,
+    epsilon,
+    params_file,
+    n_workers,
+    warm_start,
+    checkpoint_file,
 ):
     model_name = "ENCODE-rE2G"
     df_dataset = pd.read_csv(crispr_features_file, sep="\t")
@@ -286,11 +275,25 @@ def main(
     with open(params_file, "rb") as handle:
         params = pickle.load(handle)
 
+    # log-transformed features, or their polynomial terms, split into folds once
+    X, feature_list = training_features(df_dataset, feature_table, epsilon, polynomial)
+    Y_true = df_dataset["Regulated"].values.astype(np.int64)
+    folds = ChromosomeFolds.from_dataset(df_dataset, X, Y_true)
+
     res = SFFS_significance(
-        df_dataset, feature_table, model_name, epsilon, params, polynomial, n_boot=1000
+        folds,
+        feature_list,
+        model_name,
+        params,
+        n_boot=1000,
+        n_workers=n_workers,
+        warm_start=warm_start,
+        checkpoint_file=checkpoint_file,
     )
 
     res.to_csv(out_dir + "/forward_feature_selection.tsv", sep="\t", index=False)
+    if checkpoint_file is not None:
+        os.remove(checkpoint_file)
 
 
 if __name__ == "__main__":
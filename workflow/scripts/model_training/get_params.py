@@ -2,10 +2,31 @@ import pickle
 import click
 import json
 
+# params that are integers for some model backend, even if given as e.g. "1e8" or 200.0
+INT_PARAMS = [
+    "max_iter",
+    "random_state",
+    "n_jobs",
+    "batch_size",
+    "n_epochs",
+    "max_leaf_nodes",
+    "max_depth",
+    "min_samples_leaf",
+]
+
 
 def get_params(default_params, override_params):
     final_params = default_params
 
+    # default_params are logistic regression settings; another model_backend
+    # (see training_functions.MODEL_BACKENDS) is configured by override_params alone
+    if (
+        isinstance(override_params, dict)
+        and override_params.get("model_backend", "logistic_regression")
+        != "logistic_regression"
+    ):
+        final_params = {}
+
     # replace overriding parameters
     if isinstance(override_params, dict):
         for arg, val in override_params.items():
@@ -20,36 +41,36 @@ def get_params(default_params, override_params):
     for key, val in final_params.items():
         if isinstance(val, str):
             try:
-                if key == "max_iter" or key == "random_state" or key == "n_jobs":
+                if key in INT_PARAMS:
                     final_params[key] = int(float(val))
                 else:
                     final_params[key] = float(val)
             except ValueError:
                 pass
+        elif key in INT_PARAMS and isinstance(val, float) and val.is_integer():
+            final_params[key] = int(val)
     return final_params
 
 
+def parse_params(params):
+    # params as written by snakemake from a yaml dict, e.g. "{'C': 1.0, 'penalty': None}"
+    params_fixed = (
+        params.replace("'", '"')
+        .replace("True", "true")
+        .replace("False", "false")
+        .replace("None", "null")
+    )
+    return json.loads(params_fixed)
+
+
 @click.command()
 @click.option("--default_params", required=True)
 @click.option("--override_params", required=True)
 @click.option("--output_file", required=True)
 def main(default_params, override_params, output_file):
     # read in default and override params as strings and convert to dict
-    default_params_fixed = (
-        default_params.replace("'", '"')
-        .replace("True", "true")
-        .replace("False", "false")
-        .replace("None", "null")
-    )
-    override_params_fixed = (
-        override_params.replace("'", '"')
-        .replace("True", "true")
-        .replace("False", "false")
-        .replace("None", "null")
-    )
-
-    default_params_dict = json.loads(default_params_fixed)
-    override_params_dict = json.loads(override_params_fixed)
+    default_params_dict = parse_params(default_params)
+    override_params_dict = parse_params(override_params)
 
     # generate final params
     final_params = get_params(default_params_dict, override_params_dict)
@@ -1,22 +1,39 @@
+import os
 import pickle
 import click
 import numpy as np
 import pandas as pd
-import scipy
-from sklearn.metrics import precision_recall_curve, auc, log_loss, roc_auc_score
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.linear_model import LogisticRegression
+from joblib import delayed
 from training_functions import (
-    statistic_aupr,
-    statistic_precision,
-    train_and_predict_once,
-    bootstrap_pvalue,
-    statistic_delta_aupr,
-    statistic_delta_precision_at_threshold,
-    threshold_70_pct_recall,
+    training_features,
+    fit_folds,
+    ChromosomeFolds,
+    CheckpointJournal,
+    PRCurve,
+    permuted_scores,
+    run_journaled,
 )
 
 
+def permutation_deltas(
+    folds, params, feature, seed, aupr_full, precision_full, models=None
+):
+    # seed = [seed, feature index, repeat], so each permutation is reproducible on its own
+    rng = np.random.default_rng(seed)
+    permuted = rng.permutation(folds.column(feature))
+    Y_shuffle = permuted_scores(folds, params, feature, permuted, models)
+
+    # same as statistic_delta_aupr / statistic_delta_precision_at_threshold,
+    # with the full model's curve computed once
+    curve_shuffle = PRCurve(folds.Y, Y_shuffle)
+    thresh_shuffle = curve_shuffle.threshold_at_recall(0.7)
+    delta_aupr = curve_shuffle.aupr - aupr_full
+    delta_precision = (
+        curve_shuffle.precision_at_threshold(thresh_shuffle) - precision_full
+    )
+    return [delta_aupr, delta_precision]
+
+
 def permutation_feature_importance(
     df_dataset,
     feature_table,
@@ -25,70 +42,66 @@ def permutation_feature_importance(
     params,
     n_repeats=20,
     polynomial=False,
+    n_workers=1,
+    checkpoint_file=None,
+    mode="refit",
+    seed=0,
 ):
-    feature_list_core = feature_table["feature"]
-    model_name_core = model_name
-
-    # add polynomial features
-    if polynomial:
-        X_core = df_dataset.loc[:, feature_list_core]
-        poly = PolynomialFeatures(degree=2)
-        X_2 = poly.fit_transform(X_core)
-        polynomial_names = poly.get_feature_names_out(X_core.columns)
-        X_2 = pd.DataFrame(X_2, columns=polynomial_names)
-        X = X_2
-        feature_list = pd.Series(polynomial_names)
-    else:
-        X = df_dataset.loc[:, feature_list_core]
-        feature_list = feature_list_core
-
-    # # tranforms features
-    X = np.log(np.abs(X) + epsilon)
+    # log-transformed features, or their polynomial terms
+    X, feature_list = training_features(df_dataset, feature_table, epsilon, polynomial)
     Y_true = df_dataset["Regulated"].values.astype(np.int64)
-
-    # train full model
-    model_name = model_name_core + "_full"
-    df_dataset = train_and_predict_once(
-        df_dataset, X, Y_true, feature_list, model_name, params
+    folds = ChromosomeFolds.from_dataset(df_dataset, X, Y_true)
+    # completed repeats, to resume an interrupted run
+    journal = CheckpointJournal(
+        checkpoint_file,
+        {"data": folds.fingerprint(), "params": params, "mode": mode, "seed": seed},
     )
-    Y_full = df_dataset[model_name + ".Score"]
 
-    df = pd.DataFrame(columns=["feature_permuted", "delta_aupr", "delta_precision"])
+    # train full model; score_only permutes each feature against its per-chromosome
+    # fits instead of refitting them
+    Y_full, _, models = fit_folds(
+        folds, feature_list, params, n_workers=n_workers, return_models=True
+    )
+    curve_full = PRCurve(Y_true, Y_full)
+    aupr_full = curve_full.aupr
+    precision_full = curve_full.precision_at_threshold(
+        curve_full.threshold_at_recall(0.7)
+    )
+    if mode != "score_only":
+        models = None
 
+    # (feature, repeat) pairs are permuted and scored in parallel processes; folds isn't
+    # modified, each one works on a copy of the permuted column
+    keys = []
+    tasks = []
     for i in range(len(feature_list)):  # iterate through features
-        print(feature_list[i])
-        delta_aupr_feature = []
-        delta_precision_feature = []
-        original_values = X[feature_list[i]]
-
         for j in range(n_repeats):
-            X[feature_list[i]] = np.random.permutation(X[feature_list[i]])
-            model_name = model_name_core + "_shuff_" + feature_list[i]
-            df_dataset = train_and_predict_once(
-                df_dataset, X, Y_true, feature_list, model_name, params
-            )
-            Y_shuffle = df_dataset[model_name + ".Score"]
-
-            delta_aupr = statistic_delta_aupr(Y_true, Y_full, Y_shuffle)
-            thresh_full = threshold_70_pct_recall(Y_true, Y_full)
-            thresh_shuffle = threshold_70_pct_recall(Y_true, Y_shuffle)
-            delta_precision = statistic_delta_precision_at_threshold(
-                Y_true, Y_full, Y_shuffle, thresh_full, thresh_shuffle
+            key = f"{feature_list[i]}_{j}"
+            keys.append(key)
+            tasks.append(
+                (
+                    key,
+                    delayed(permutation_deltas)(
+                        folds,
+                        params,
+                        feature_list[i],
+                        [seed, i, j],
+                        aupr_full,
+                        precision_full,
+                        models,
+                    ),
+                )
             )
-
-            delta_aupr_feature = delta_aupr_feature + [delta_aupr]
-            delta_precision_feature = delta_precision_feature + [delta_precision]
-
-        df_temp = pd.DataFrame(
-            {
-                "delta_aupr": delta_aupr_feature,
-                "delta_precision": delta_precision_feature,
-            }
-        )
-        df_temp["feature_permuted"] = feature_list[i]
-        df = pd.concat([df, df_temp])
-
-        X[feature_list[i]] = original_values  # reset feature values
+    results = run_journaled(tasks, journal, n_workers)
+
+    df = pd.DataFrame(
+        {
+            "feature_permuted": np.repeat(list(feature_list), n_repeats),
+            "delta_aupr": [results[key][0] for key in keys],
+            "delta_precision": [results[key][1] for key in keys],
+        }
+    )
+    journal.close()
 
     return df
 
@@ -101,6 +114,29 @@ def permutation_feature_importance(
 @click.option("--epsilon", type=float, default=0.01)
 @click.option("--n_repeats", type=float, default=20)
 @click.option("--params_file", required=True)
+@click.option(
+    "--n_workers",
+    type=int,
+    default=1,
+    help="Number of processes used to score the (feature, repeat) permutations in parallel",
+)
+@click.option(
+    "--mode",
+    type=click.Choice(["refit", "score_only"]),
+    default="refit",
+    help="refit retrains the chromosome-held-out models on each permutation; score_only rescores the full model's per-chromosome fits on the permuted features",
+)
+@click.option(
+    "--seed",
+    type=int,
+    default=0,
+    help="Each permutation is drawn from a generator seeded with (seed, feature index, repeat)",
+)
+@click.option(
+    "--checkpoint_file",
+    default=None,
+    help="Record completed repeats here to resume an interrupted run. Deleted once the output is written",
+)
 def main(
     crispr_features_file,
     feature_table_file,
@@ -109,6 +145,10 @@ def main(
     epsilon,
     n_repeats,
     params_file,
+    n_workers,
+    checkpoint_file,
+    mode,
+    seed,
 ):
     model_name = "ENCODE-rE2G"
     n_repeats = int(n_repeats)
@@ -119,10 +159,22 @@ def main(
         params = pickle.load(handle)
 
     res = permutation_feature_importance(
-        df_dataset, feature_table, model_name, epsilon, params, n_repeats, polynomial
+        df_dataset,
+        feature_table,
+        model_name,
+        epsilon,
+        params,
+        n_repeats,
+        polynomial,
+        n_workers,
+        checkpoint_file,
+        mode,
+        seed,
     )
 
     res.to_csv(out_dir + "/permutation_feature_importance.tsv", sep="\t", index=False)
+    if checkpoint_file is not None:
+        os.remove(checkpoint_file)
 
 
 if __name__ == "__main__":
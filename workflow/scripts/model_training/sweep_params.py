@@ -0,0 +1,124 @@
+import itertools
+import json
+import pickle
+import click
+import numpy as np
+import pandas as pd
+from get_params import get_params, parse_params
+from training_functions import ChromosomeFolds, successive_halving, training_features
+
+
+def param_grid(grid):
+    """Every combination of the grid's values, as override dicts in grid order"""
+    keys = list(grid)
+    values = [grid[key] if isinstance(grid[key], list) else [grid[key]] for key in keys]
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values)]
+
+
+# every grid point is merged into the model's params (as override_params would be) and
+# ranked by successive halving on chromosome-held-out CV; the table has one row per grid
+# point, best first, and the winner's params are saved like get_params.py's output
+def sweep_params(
+    df_dataset,
+    feature_table,
+    epsilon,
+    base_params,
+    grid,
+    polynomial=False,
+    eta=3,
+    min_folds=2,
+    seed=0,
+    n_workers=1,
+):
+    X, _ = training_features(df_dataset, feature_table, epsilon, polynomial)
+    Y = df_dataset["Regulated"].values.astype(np.int64)
+    folds = ChromosomeFolds.from_dataset(df_dataset, X, Y)
+
+    # grid values get the same conversions as override_params ("null" -> None, ...)
+    overrides = [get_params({}, override) for override in param_grid(grid)]
+    configs = [get_params(dict(base_params), override) for override in overrides]
+    print(f"Evaluating {len(configs)} parameter sets on {len(folds)} folds")
+    results = successive_halving(folds, configs, eta, min_folds, seed, n_workers)
+
+    df = pd.DataFrame({key: [override[key] for override in overrides] for key in grid})
+    df["override_params"] = [json.dumps(override) for override in overrides]
+    df["rung"] = [result.rung for result in results]
+    df["n_folds"] = [result.n_folds for result in results]
+    df["AUPRC"] = [result.aupr for result in results]
+    df["config"] = np.arange(len(configs))
+    df = df.sort_values(
+        by=["rung", "AUPRC", "config"], ascending=[False, False, True]
+    ).drop(columns="config")
+    return df, configs[df.index[0]]
+
+
+@click.command()
+@click.option("--crispr_features_file", required=True)
+@click.option("--feature_table_file", required=True)
+@click.option("--polynomial", type=bool, default=False)
+@click.option("--epsilon", type=float, default=0.01)
+@click.option("--params_file", required=True, help="The model's training_params.pkl")
+@click.option(
+    "--param_grid",
+    required=True,
+    help="Values to try per parameter, e.g. \"{'C': [0.1, 1, 10], 'class_weight': [None, 'balanced']}\"",
+)
+@click.option(
+    "--eta",
+    type=int,
+    default=3,
+    help="Each rung keeps the best 1/eta parameter sets and scores them on eta times as many held-out chromosomes",
+)
+@click.option(
+    "--min_folds",
+    type=int,
+    default=2,
+    help="Number of held-out chromosomes in the first rung",
+)
+@click.option("--seed", type=int, default=0)
+@click.option(
+    "--n_workers",
+    type=int,
+    default=1,
+    help="Number of processes used to evaluate parameter sets in parallel",
+)
+@click.option("--output_table", required=True)
+@click.option("--output_params", required=True)
+def main(
+    crispr_features_file,
+    feature_table_file,
+    polynomial,
+    epsilon,
+    params_file,
+    param_grid,
+    eta,
+    min_folds,
+    seed,
+    n_workers,
+    output_table,
+    output_params,
+):
+    df_dataset = pd.read_csv(crispr_features_file, sep="\t")
+    feature_table = pd.read_csv(feature_table_file, sep="\t")
+    with open(params_file, "rb") as handle:
+        base_params = pickle.load(handle)
+
+    df, best_params = sweep_params(
+        df_dataset,
+        feature_table,
+        epsilon,
+        base_params,
+        parse_params(param_grid),
+        polynomial,
+        eta,
+        min_folds,
+        seed,
+        n_workers,
+    )
+    df.to_csv(output_table, sep="\t", index=False)
+    with open(output_params, "wb") as f:
+        pickle.dump(best_params, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,28 +4,43 @@ import numpy as np
 import pandas as pd
 import shap
 from sklearn.metrics import precision_recall_curve, auc, log_loss, roc_auc_score
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.linear_model import LogisticRegression
-from training_functions import statistic_aupr
+from training_functions import (
+    statistic_aupr,
+    ChromosomeFolds,
+    ScoreStore,
+    fit_model,
+    model_coefs,
+    feature_frame,
+    training_features,
+)
+
+
+def coefficient_table(model, columns, test_chr):
+    # backends without coefficients (e.g. gradient boosting) get NaN weights
+    fold_coef = model_coefs(model)
+    coefficients = np.full(len(columns), np.nan) if fold_coef is None else fold_coef[0]
+    return pd.DataFrame(
+        {"feature": columns, "coefficient": coefficients, "test_chr": test_chr}
+    )
 
 
+# X: the model's transformed features, if already computed (e.g. by train_models.py);
+# by default they are computed from df_dataset
 def train_and_predict(
-    df_dataset, feature_table, model_name, out_dir, epsilon, params, polynomial=False
+    df_dataset,
+    feature_table,
+    model_name,
+    out_dir,
+    epsilon,
+    params,
+    polynomial=False,
+    X=None,
 ):
-    # specify feature list
-    feature_list_core = feature_table["feature"]
-    if polynomial:
-        X_core = df_dataset.loc[:, feature_list_core]
-        poly = PolynomialFeatures(degree=2)
-        X_2 = poly.fit_transform(X_core)
-        polynomial_names = poly.get_feature_names_out(X_core.columns)
-        X_2 = pd.DataFrame(X_2, columns=polynomial_names)
-        X = X_2
-    else:
-        X = df_dataset.loc[:, feature_list_core]
-
-    # transform features
-    X = np.log(np.abs(X) + epsilon)
+    # log-transformed features, or a provider of their polynomial terms
+    if X is None:
+        X, _ = training_features(df_dataset, feature_table, epsilon, polynomial)
+    features = X
+    X = feature_frame(features)
     Y = df_dataset["Regulated"].values.astype(np.int64)
 
     # initialize df for feature weights & metrics
@@ -52,38 +67,37 @@ def train_and_predict(
     # X_test_all = pd.DataFrame()
 
     # train aggregate model across all chromosomes, calc weights and performance metrics, save full model
-    model_full = LogisticRegression(**params).fit(X, Y)
+    # the learner is picked by params["model_backend"] (logistic regression by default)
+    model_full = fit_model(X, Y, params)
     probs_full = model_full.predict_proba(X)
-    df_dataset[model_name + ".Score_full"] = probs_full[:, 1]
-    coefficients = model_full.coef_[0]
-    df_temp = pd.DataFrame(
-        {"feature": X.columns, "coefficient": coefficients, "test_chr": "none"}
-    )
-    df_coef = pd.concat([df_coef, df_temp])
+    # prediction columns are added to df_dataset once, when it is saved
+    score_store = ScoreStore(len(df_dataset), capacity=2)
+    score_store[model_name + ".Score_full"] = probs_full[:, 1]
+    df_coef = pd.concat([df_coef, coefficient_table(model_full, X.columns, "none")])
     with open(out_dir + f"/model_full.pkl", "wb") as f:
         pickle.dump(model_full, f)
 
     # logistic regression predictions on chromosome-wise cross validation
-    idx = np.arange(len(Y))
-    chr_list = np.unique(df_dataset["chr"])
-    if len(chr_list) > 1:
-        for chr in chr_list:
-            idx_test = df_dataset[df_dataset["chr"] == chr].index.values
+    # with polynomial features, each fold's block is built when it is fit
+    folds = ChromosomeFolds.from_dataset(df_dataset, features, Y)
+    if folds.cross_validated:
+        for i, chr in enumerate(folds.chr_list):
+            idx_test = folds.idx_test[i]
 
             if len(idx_test) > 0:
-                idx_train = np.delete(idx, idx_test)
-                X_test = X.loc[idx_test, :]
-                X_train = X.loc[idx_train, :]
+                # wrap the fold's blocks without copying so the saved models keep feature names
+                X_train, Y_train, X_test = folds.fold(i)
+                X_train = pd.DataFrame(X_train, columns=X.columns, copy=False)
+                X_test = pd.DataFrame(X_test, columns=X.columns, copy=False)
                 Y_test = Y[idx_test]
-                Y_train = Y[idx_train]
 
-                model = LogisticRegression(**params).fit(X_train, Y_train)
+                model = fit_model(X_train, Y_train, params)
 
                 with open(out_dir + f"/model_test_{chr}.pkl", "wb") as f:
                     pickle.dump(model, f)
 
                 probs = model.predict_proba(X_test)
-                df_dataset.loc[idx_test, model_name + ".Score"] = probs[:, 1]
+                score_store.column(model_name + ".Score")[idx_test] = probs[:, 1]
 
                 # performance metrics
                 n_train_pos = np.sum(Y_train)
@@ -140,11 +154,7 @@ def train_and_predict(
                 df_metrics = pd.concat([df_metrics, df_temp])
 
                 # save model weights
-                coefficients = model.coef_[0]
-                df_temp = pd.DataFrame(
-                    {"feature": X.columns, "coefficient": coefficients, "test_chr": chr}
-                )
-                df_coef = pd.concat([df_coef, df_temp])
+                df_coef = pd.concat([df_coef, coefficient_table(model, X.columns, chr)])
 
                 # shap scores
                 # background = shap.kmeans(X_train, 10)  # use 10 kmeans samples from train samples as background
@@ -156,11 +166,11 @@ def train_and_predict(
                 # X_test_all = pd.concat([X_test_all, X_test])
 
         # calc performance metrics across chromosomes
-        total_ll_test = log_loss(Y, df_dataset[model_name + ".Score"])
+        total_ll_test = log_loss(Y, score_store[model_name + ".Score"])
         total_ll_test_full = log_loss(Y, probs_full[:, 1])
-        total_auroc_test = roc_auc_score(Y, df_dataset[model_name + ".Score"])
+        total_auroc_test = roc_auc_score(Y, score_store[model_name + ".Score"])
         total_auroc_test_full = log_loss(Y, probs_full[:, 1])
-        total_auprc_test = statistic_aupr(Y, df_dataset[model_name + ".Score"])
+        total_auprc_test = statistic_aupr(Y, score_store[model_name + ".Score"])
         total_auprc_test_full = statistic_aupr(Y, probs_full[:, 1])
         n_pos = np.sum(Y)
         n_neg = len(Y) - n_pos
@@ -186,6 +196,8 @@ def train_and_predict(
         df_metrics = pd.concat([df_metrics, df_temp])
 
     # save dfs
+    df_scores = score_store.to_frame(index=df_dataset.index)
+    df_dataset = df_dataset.assign(**df_scores)
     df_dataset.to_csv(out_dir + "/training_predictions.tsv", sep="\t", index=False)
     df_coef.to_csv(out_dir + "/model_coefficients.tsv", sep="\t", index=False)
     df_metrics.to_csv(out_dir + "/performance_metrics.tsv", sep="\t", index=False)
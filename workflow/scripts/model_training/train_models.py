@@ -0,0 +1,110 @@
+import pickle
+import click
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from training_functions import PolynomialFeatureProvider
+from train_model import train_and_predict
+
+
+def shared_training_features(df_dataset, feature_tables, polynomial, epsilon):
+    """
+    Transformed features of each model, as train_model.py computes them. The union of
+    the models' core features is log-transformed once and sliced per model; models
+    with polynomial features share a PolynomialFeatureProvider per core feature list,
+    which computes their terms when train_and_predict uses them.
+    """
+    linear_features = list(
+        dict.fromkeys(
+            feature
+            for feature_table, poly in zip(feature_tables, polynomial)
+            if not poly
+            for feature in feature_table["feature"]
+        )
+    )
+    X_union = np.log(np.abs(df_dataset.loc[:, linear_features]) + epsilon)
+    providers = {}
+    for feature_table, poly in zip(feature_tables, polynomial):
+        feature_list_core = list(feature_table["feature"])
+        if poly:
+            key = tuple(feature_list_core)
+            if key not in providers:
+                providers[key] = PolynomialFeatureProvider(
+                    df_dataset, feature_list_core, epsilon
+                )
+            yield providers[key]
+        else:
+            yield X_union.loc[:, feature_list_core]
+
+
+# trains every model on one CRISPR dataset, reading and transforming it once. models
+# are (feature_table, params, polynomial, out_dir) and are trained n_workers at a time
+# in parallel processes; each writes the same outputs as train_model.py to its out_dir
+def train_models(df_dataset, models, model_name, epsilon, n_workers=1):
+    feature_tables = [feature_table for feature_table, _, _, _ in models]
+    polynomial = [poly for _, _, poly, _ in models]
+    features = shared_training_features(df_dataset, feature_tables, polynomial, epsilon)
+    Parallel(n_jobs=n_workers)(
+        delayed(train_and_predict)(
+            df_dataset,
+            feature_table,
+            model_name,
+            out_dir,
+            epsilon,
+            params,
+            poly,
+            X=X,
+        )
+        for (feature_table, params, poly, out_dir), X in zip(models, features)
+    )
+
+
+@click.command()
+@click.option("--crispr_features_file", required=True)
+@click.option(
+    "--out_dir",
+    "out_dirs",
+    multiple=True,
+    required=True,
+    help="Output directory of a model. Given once per model, in the same order as --feature_table_file, --params_file and --polynomial",
+)
+@click.option("--feature_table_file", "feature_table_files", multiple=True)
+@click.option("--params_file", "params_files", multiple=True)
+@click.option("--polynomial", type=bool, multiple=True)
+@click.option("--epsilon", type=float, default=0.01)
+@click.option(
+    "--n_workers",
+    type=int,
+    default=1,
+    help="Number of processes used to train models in parallel",
+)
+def main(
+    crispr_features_file,
+    out_dirs,
+    feature_table_files,
+    params_files,
+    polynomial,
+    epsilon,
+    n_workers,
+):
+    n_models = {len(out_dirs), len(feature_table_files), len(params_files)}
+    if n_models != {len(polynomial)}:
+        raise click.UsageError(
+            "Provide one --feature_table_file, --params_file and --polynomial per --out_dir"
+        )
+    model_name = "ENCODE-rE2G"
+    df_dataset = pd.read_csv(crispr_features_file, sep="\t")
+    models = []
+    for out_dir, feature_table_file, params_file, poly in zip(
+        out_dirs, feature_table_files, params_files, polynomial
+    ):
+        feature_table = pd.read_csv(feature_table_file, sep="\t")
+        with open(params_file, "rb") as handle:
+            params = pickle.load(handle)
+        models.append((feature_table, params, poly, out_dir))
+
+    train_models(df_dataset, models, model_name, epsilon, n_workers)
+
+
+if __name__ == "__main__":
+    main()
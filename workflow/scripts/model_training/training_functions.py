@@ -1,9 +1,17 @@
+import hashlib
+import json
+import os
+from collections import namedtuple
+from functools import cached_property, partial
+from itertools import combinations_with_replacement
+
 import numpy as np
 import pandas as pd
-from sklearn.metrics import precision_recall_curve, auc
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.linear_model import LogisticRegression
-
+from joblib import Parallel, delayed
+from scipy.special import ndtr, ndtri
+from sklearn.metrics import auc
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 
 ## statistic functions for delta auPR/precision to be used for scipy.stats.bootstrap
 
@@ -18,137 +26,127 @@ def auc_mod(recall, precision):
 
 # the first precision & recall values are precision=class_balance and recall=1, not corresponding to a threshold. we do not want this point to affect our performance.
 def precision_recall_curve_modified(y_true, y_pred):
-    precision_full, recall_full, thresholds_full = precision_recall_curve(
-        y_true, y_pred
-    )
-    return precision_full[1:], recall_full[1:], thresholds_full
+    curve = PRCurve(y_true, y_pred)
+    return curve.precision, curve.recall, curve.thresholds
+
+
+class PRCurve:
+    """
+    precision_recall_curve_modified of one score vector, computed once: the scores are
+    sorted once and the curve is read off cumulative sums at the distinct scores, as in
+    sklearn's precision_recall_curve. Recall is non-increasing and thresholds increasing
+    along the curve, so nearest-value lookups are binary searches; of two equally near
+    values the lowest index wins, as with a stable argsort of the distances.
+    """
+
+    def __init__(self, y_true, y_pred):
+        y_true = np.asarray(y_true, dtype=np.float64)
+        y_pred = np.asarray(y_pred, dtype=np.float64)
+        order = np.argsort(y_pred, kind="mergesort")[::-1]
+        y_pred = y_pred[order]
+        threshold_idxs = np.r_[np.flatnonzero(np.diff(y_pred)), len(y_pred) - 1]
+        tps = np.cumsum(y_true[order])[threshold_idxs]
+        precision = tps / (1 + threshold_idxs)
+        # as sklearn, recall is 1 when there are no positives
+        recall = tps / tps[-1] if tps[-1] > 0 else np.ones_like(tps)
+        # ascending thresholds; the lowest one (everything predicted positive) is
+        # dropped from precision and recall, which end with the precision=1, recall=0 point
+        self.precision = np.r_[precision[-2::-1], 1.0]
+        self.recall = np.r_[recall[-2::-1], 0.0]
+        self.thresholds = y_pred[threshold_idxs][::-1]
+
+    @cached_property
+    def aupr(self):
+        return auc_mod(self.recall, self.precision)
+
+    def nearest_recall_idx(self, recall):
+        # recall[:j] >= recall > recall[j:]; the nearest value is recall[j - 1] or recall[j],
+        # each taken at the first index of its run of equal values
+        neg_recall = -self.recall
+        j = np.searchsorted(neg_recall, -recall, side="right")
+        if j == 0:
+            return 0
+        above = np.searchsorted(neg_recall, neg_recall[j - 1], side="left")
+        if j == len(self.recall) or np.abs(self.recall[above] - recall) <= np.abs(
+            self.recall[j] - recall
+        ):
+            return above
+        return j
+
+    def precision_at_recall(self, recall=0.7):
+        return self.precision[self.nearest_recall_idx(recall)]
+
+    # return threshold for recall (None if the curve never exceeds it)
+    def threshold_at_recall(self, recall=0.7):
+        if np.max(self.recall) > recall:
+            # adjust for removing first row of rec + prec
+            return self.thresholds[self.nearest_recall_idx(recall) + 1]
+        return None
+
+    def precision_at_threshold(self, threshold):
+        if threshold is None:
+            return 0
+        j = np.searchsorted(self.thresholds, threshold)
+        idx_threshold = j
+        if j == len(self.thresholds) or (
+            j > 0
+            and np.abs(self.thresholds[j - 1] - threshold)
+            <= np.abs(self.thresholds[j] - threshold)
+        ):
+            idx_threshold = j - 1
+        return self.precision[idx_threshold - 1]  # precision at corresponding index
 
 
 def statistic_delta_aupr(
     y_true, y_pred_full, y_pred_ablated
 ):  # return aupr_ablated-aupr_full
-    precision_full, recall_full, thresholds_full = precision_recall_curve_modified(
-        y_true, y_pred_full
-    )
-    aupr_full = auc_mod(recall_full, precision_full)
-
-    (
-        precision_ablated,
-        recall_ablated,
-        thresholds_ablated,
-    ) = precision_recall_curve_modified(y_true, y_pred_ablated)
-    aupr_ablated = auc_mod(recall_ablated, precision_ablated)
-    delta_aupr = aupr_ablated - aupr_full
-
-    return delta_aupr
+    return PRCurve(y_true, y_pred_ablated).aupr - PRCurve(y_true, y_pred_full).aupr
 
 
 def statistic_aupr(y_true, y_pred_full):
-    precision_full, recall_full, thresholds_full = precision_recall_curve_modified(
-        y_true, y_pred_full
-    )
-    aupr_full = auc_mod(recall_full, precision_full)
-
-    return aupr_full
+    return PRCurve(y_true, y_pred_full).aupr
 
 
 # note: precision at 70% recall (vs precision at constant threshold chosen for 70% recall)
 def statistic_delta_precision(
     y_true, y_pred_full, y_pred_ablated
 ):  # return precision_ablated-precision_full
-    precision_full, recall_full, thresholds_full = precision_recall_curve_modified(
-        y_true, y_pred_full
-    )
-    idx_recall_full_70_pct = np.argsort(np.abs(recall_full - 0.7))[0]
-    precision_full_at_70_pct_recall = precision_full[idx_recall_full_70_pct]
-
-    (
-        precision_ablated,
-        recall_ablated,
-        thresholds_ablated,
-    ) = precision_recall_curve_modified(y_true, y_pred_ablated)
-    idx_recall_ablated_70_pct = np.argsort(np.abs(recall_ablated - 0.7))[0]
-    precision_ablated_at_70_pct_recall = precision_ablated[idx_recall_ablated_70_pct]
-    delta_precision = (
-        precision_ablated_at_70_pct_recall - precision_full_at_70_pct_recall
+    precision_full_at_70_pct_recall = PRCurve(y_true, y_pred_full).precision_at_recall(
+        0.7
     )
-
-    return delta_precision
+    precision_ablated_at_70_pct_recall = PRCurve(
+        y_true, y_pred_ablated
+    ).precision_at_recall(0.7)
+    return precision_ablated_at_70_pct_recall - precision_full_at_70_pct_recall
 
 
 def statistic_delta_precision_at_threshold(
     y_true, y_pred_full, y_pred_ablated, thresh_full, thresh_ablated
 ):  # return precision_ablated-precision_full
-    precision_full, recall_full, thresholds_full = precision_recall_curve_modified(
-        y_true, y_pred_full
+    precision_at_threshold = statistic_precision_at_threshold(
+        y_true, y_pred_full, thresh_full
     )
-    if thresh_full != None:
-        idx_threshold = np.argsort(np.abs(thresholds_full - thresh_full))[0]
-        precision_at_threshold = precision_full[idx_threshold - 1]
-    else:
-        precision_at_threshold = 0
-
-    (
-        precision_ablated,
-        recall_ablated,
-        thresholds_ablated,
-    ) = precision_recall_curve_modified(y_true, y_pred_ablated)
-    if thresh_ablated != None:
-        idx_threshold_ablated = np.argsort(np.abs(thresholds_ablated - thresh_ablated))[
-            0
-        ]
-        precision_ablated_at_threshold = precision_ablated[idx_threshold_ablated - 1]
-    else:
-        precision_ablated_at_threshold = 0
-
-    delta_precision = precision_ablated_at_threshold - precision_at_threshold
-
-    return delta_precision
+    precision_ablated_at_threshold = statistic_precision_at_threshold(
+        y_true, y_pred_ablated, thresh_ablated
+    )
+    return precision_ablated_at_threshold - precision_at_threshold
 
 
 # note: precision at 70% recall (vs precision at constant threshold chosen for 70% recall)
 def statistic_precision(y_true, y_pred_full):
-    precision_full, recall_full, thresholds_full = precision_recall_curve_modified(
-        y_true, y_pred_full
-    )
-    idx_recall_full_70_pct = np.argsort(np.abs(recall_full - 0.7))[0]
-    precision_full_at_70_pct_recall = precision_full[idx_recall_full_70_pct]
-    return precision_full_at_70_pct_recall
+    return PRCurve(y_true, y_pred_full).precision_at_recall(0.7)
 
 
 # return threshold for 70% recall
 def threshold_70_pct_recall(y_true, y_pred_full):
-    precision_full, recall_full, thresholds_full = precision_recall_curve_modified(
-        y_true, y_pred_full
-    )
-    if np.max(recall_full) > 0.7:
-        idx_recall_full_70_pct = np.argsort(np.abs(recall_full - 0.7))[
-            0
-        ]  # find index of recall closest to 0.7
-        thresh = thresholds_full[
-            idx_recall_full_70_pct + 1
-        ]  # adjust for removing first row of rec + prec
-    else:
-        thresh = None
-    return thresh
+    return PRCurve(y_true, y_pred_full).threshold_at_recall(0.7)
 
 
 # note: precision at constant threshold chosen for 70% recall (vs precision at 70% recall)
 def statistic_precision_at_threshold(y_true, y_pred_full, threshold):
-    if threshold != None:
-        precision_full, recall_full, thresholds_full = precision_recall_curve_modified(
-            y_true, y_pred_full
-        )
-        idx_threshold = np.argsort(np.abs(thresholds_full - threshold))[
-            0
-        ]  # index of thresholds_full for value closest threshold
-        precision_at_threshold = precision_full[
-            idx_threshold - 1
-        ]  # precision at corresponding index
-    else:
-        precision_at_threshold = 0
-
-    return precision_at_threshold
+    if threshold is None:
+        return 0
+    return PRCurve(y_true, y_pred_full).precision_at_threshold(threshold)
 
 
 # bootstrap p-values for delta (aupr/precision)
@@ -164,26 +162,888 @@ def bootstrap_pvalue(delta, res_delta):
     return pval
 
 
+## batched bootstrap: every resample is a row of observation weights (how often the
+## resample drew each observation), so all resamples are scored with a few array operations
+
+BootstrapResult = namedtuple(
+    "BootstrapResult",
+    ["confidence_interval", "bootstrap_distribution", "standard_error"],
+)
+
+
+class WeightedPRCurve:
+    """
+    precision_recall_curve_modified of y_pred for many weightings of the observations
+    at once. Each row of W (rows x observations) is one weighting; a row of ones is the
+    original data. Scores are sorted once, and each row's curve is a cumulative sum
+    over the distinct scores, so observations with weight 0 drop out of the curve.
+    """
+
+    def __init__(self, y_true, y_pred):
+        y_pred = np.asarray(y_pred, dtype=np.float64)
+        self.order = np.argsort(-y_pred, kind="stable")
+        y_pred = y_pred[self.order]
+        self.y_true = np.asarray(y_true, dtype=np.float64)[self.order]
+        self.group_starts = np.flatnonzero(np.r_[True, y_pred[1:] != y_pred[:-1]])
+        self.scores = y_pred[self.group_starts]  # distinct scores, descending
+
+    def curve(self, W):
+        """
+        Precision, recall and number of predicted positives at each distinct score
+        (descending) for each row of W. Scores absent from a row repeat the previous point.
+        """
+        W = W[:, self.order]
+        tp = np.cumsum(
+            np.add.reduceat(W * self.y_true, self.group_starts, axis=1), axis=1
+        )
+        n_pred = np.cumsum(np.add.reduceat(W, self.group_starts, axis=1), axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            precision = np.where(n_pred > 0, tp / n_pred, 1.0)
+            # as precision_recall_curve, recall is 1 when there are no positives
+            recall = np.where(
+                tp[:, -1:] > 0, tp / tp[:, -1:], (n_pred > 0).astype(np.float64)
+            )
+        return precision, recall, n_pred
+
+    def aupr(self, W):
+        precision, recall, n_pred = self.curve(W)
+        precision_prev = np.hstack([np.ones((len(W), 1)), precision[:, :-1]])
+        recall_prev = np.hstack([np.zeros((len(W), 1)), recall[:, :-1]])
+        # the lowest present score (everything predicted positive) is not on the modified curve
+        on_curve = n_pred < n_pred[:, -1:]
+        area = (recall - recall_prev) * (precision + precision_prev) / 2
+        return np.sum(area, axis=1, where=on_curve)
+
+    def precision_at_threshold(self, W, threshold):
+        if threshold is None:
+            return np.zeros(len(W))
+        precision, _, n_pred = self.curve(W)
+        present = np.diff(n_pred, axis=1, prepend=0) > 0
+        rows = np.arange(len(W))
+        # nearest present score to threshold, the lower one on ties: the last present
+        # score >= threshold (above) or the first present score < threshold (below)
+        n_scores = len(self.scores)
+        k = np.searchsorted(-self.scores, -threshold, side="right")
+        above = np.max(np.where(present[:, :k], np.arange(k), -1), axis=1, initial=-1)
+        below = np.min(
+            np.where(present[:, k:], np.arange(k, n_scores), n_scores),
+            axis=1,
+            initial=n_scores,
+        )
+        scores = np.r_[self.scores, np.nan]  # index -1 / n_scores: no such score
+        d_above = np.where(above >= 0, scores[above] - threshold, np.inf)
+        d_below = np.where(below < n_scores, threshold - scores[below], np.inf)
+        nearest = np.where(d_below <= d_above, below, above)
+        # as statistic_precision_at_threshold, the lowest present score gives precision[-1] = 1
+        lowest = n_pred[rows, nearest] == n_pred[:, -1]
+        return np.where(lowest, 1.0, precision[rows, nearest])
+
+
+def bootstrap_weights(n, n_resamples, batch_size, rng):
+    # all resample indices are drawn up front as one matrix, then counted in batches
+    indices = rng.integers(0, n, size=(n_resamples, n))
+    for start in range(0, n_resamples, batch_size):
+        batch = indices[start : start + batch_size]
+        offsets = np.arange(len(batch))[:, None] * n
+        counts = np.bincount((batch + offsets).ravel(), minlength=len(batch) * n)
+        yield counts.reshape(len(batch), n).astype(np.float64)
+
+
+def jackknife_weights(n, batch_size):
+    for start in range(0, n, batch_size):
+        W = np.ones((min(batch_size, n - start), n))
+        W[np.arange(len(W)), start + np.arange(len(W))] = 0
+        yield W
+
+
+def batched_bootstrap(
+    statistic,
+    n,
+    n_resamples=1000,
+    confidence_level=0.95,
+    method="BCa",
+    random_state=None,
+    batch_size=None,
+):
+    """
+    Paired bootstrap of statistic, which maps a (rows x n) matrix of observation
+    weights to one value per row. Returns the same fields as scipy.stats.bootstrap;
+    BCa intervals follow scipy (jackknife acceleration, linear quantiles).
+    """
+    rng = np.random.default_rng(random_state)
+    if batch_size is None:
+        batch_size = max(1, 2**21 // n)
+    theta_hat_b = np.concatenate(
+        [statistic(W) for W in bootstrap_weights(n, n_resamples, batch_size, rng)]
+    )
+
+    alpha = (1 - confidence_level) / 2
+    if method == "BCa":
+        theta_hat = statistic(np.ones((1, n)))[0]
+        percentile = (
+            np.count_nonzero(theta_hat_b < theta_hat)
+            + np.count_nonzero(theta_hat_b <= theta_hat)
+        ) / (2 * n_resamples)
+        z0_hat = ndtri(percentile)
+
+        theta_hat_i = np.concatenate(
+            [statistic(W) for W in jackknife_weights(n, batch_size)]
+        )
+        U = (n - 1) * (theta_hat_i.mean() - theta_hat_i)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            a_hat = 1 / 6 * (np.sum(U**3) / n**3) / (np.sum(U**2) / n**2) ** (3 / 2)
+            z_alpha = ndtri(alpha)
+            num1 = z0_hat + z_alpha
+            num2 = z0_hat - z_alpha
+            interval = (
+                ndtr(z0_hat + num1 / (1 - a_hat * num1)),
+                ndtr(z0_hat + num2 / (1 - a_hat * num2)),
+            )
+    elif method == "percentile":
+        interval = (alpha, 1 - alpha)
+    else:
+        raise ValueError(f"Unsupported bootstrap method: {method}")
+
+    if np.isnan(interval).any():
+        # degenerate bootstrap distribution, as scipy
+        ci = (np.nan, np.nan)
+    else:
+        ci = tuple(np.quantile(theta_hat_b, interval))
+    return BootstrapResult(
+        confidence_interval=ci,
+        bootstrap_distribution=theta_hat_b,
+        standard_error=np.std(theta_hat_b, ddof=1),
+    )
+
+
+def bootstrap_aupr(y_true, y_pred, **kwargs):
+    curve = WeightedPRCurve(y_true, y_pred)
+    return batched_bootstrap(curve.aupr, len(curve.y_true), **kwargs)
+
+
+def bootstrap_precision_at_threshold(y_true, y_pred, threshold, **kwargs):
+    curve = WeightedPRCurve(y_true, y_pred)
+    return batched_bootstrap(
+        lambda W: curve.precision_at_threshold(W, threshold),
+        len(curve.y_true),
+        **kwargs,
+    )
+
+
+def bootstrap_delta_aupr(y_true, y_pred_full, y_pred_ablated, **kwargs):
+    # aupr_ablated - aupr_full on the same resamples
+    full = WeightedPRCurve(y_true, y_pred_full)
+    ablated = WeightedPRCurve(y_true, y_pred_ablated)
+    return batched_bootstrap(
+        lambda W: ablated.aupr(W) - full.aupr(W), len(full.y_true), **kwargs
+    )
+
+
+def bootstrap_delta_precision_at_threshold(
+    y_true, y_pred_full, y_pred_ablated, thresh_full, thresh_ablated, **kwargs
+):
+    # precision_ablated - precision_full on the same resamples
+    full = WeightedPRCurve(y_true, y_pred_full)
+    ablated = WeightedPRCurve(y_true, y_pred_ablated)
+    return batched_bootstrap(
+        lambda W: ablated.precision_at_threshold(W, thresh_ablated)
+        - full.precision_at_threshold(W, thresh_full),
+        len(full.y_true),
+        **kwargs,
+    )
+
+
+class ScoreStore:
+    """
+    Scores of the models fit on one dataset, as rows of a preallocated float64 matrix
+    keyed by column name (e.g. model_name + ".Score"), so fitting many models doesn't
+    add a DataFrame column (and a consolidation) each. The matrix doubles when full.
+    Scores are materialized into a DataFrame once, when the output is written.
+    """
+
+    def __init__(self, n_rows, capacity=8):
+        self._scores = np.full((max(capacity, 1), n_rows), np.nan)
+        self._rows = {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    def __getitem__(self, name):
+        return self._scores[self._rows[name]]
+
+    def __setitem__(self, name, values):
+        self.column(name)[:] = values
+
+    def column(self, name):
+        """Writable scores of name, added as NaN if new, e.g. to fill one fold at a time"""
+        if name not in self._rows:
+            if len(self._rows) == len(self._scores):
+                grown = np.full((2 * len(self._scores), self._scores.shape[1]), np.nan)
+                grown[: len(self._scores)] = self._scores
+                self._scores = grown
+            self._rows[name] = len(self._rows)
+        return self._scores[self._rows[name]]
+
+    def to_frame(self, index=None):
+        return pd.DataFrame({name: self[name] for name in self._rows}, index=index)
+
+
+class PolynomialFeatureProvider:
+    """
+    Log-transformed degree 2 polynomial terms of the core features, named as by
+    sklearn's PolynomialFeatures(degree=2).get_feature_names_out ("1", "a", "a^2",
+    "a b", in the same order). A term is only computed when a feature list asks for
+    it, and is then cached, so memory and transform time scale with the terms used
+    rather than with all (n + 1)(n + 2) / 2 of them. Products are taken in float64;
+    dtype only sets how the transformed terms are stored.
+    """
+
+    def __init__(self, df_dataset, feature_list_core, epsilon, dtype=np.float64):
+        self.core = df_dataset.loc[:, feature_list_core].to_numpy(dtype=np.float64)
+        self.epsilon = epsilon
+        self.dtype = np.dtype(dtype)
+        core_names = list(feature_list_core)
+        self._factors = {"1": ()}
+        for i, name in enumerate(core_names):
+            self._factors[name] = (i,)
+        for i, j in combinations_with_replacement(range(len(core_names)), 2):
+            name = (
+                f"{core_names[i]}^2" if i == j else f"{core_names[i]} {core_names[j]}"
+            )
+            self._factors[name] = (i, j)
+        self.names = list(self._factors)
+        self._columns = {}
+
+    def _compute(self, name, out):
+        values = np.ones(len(self.core))
+        for i in self._factors[name]:
+            values *= self.core[:, i]
+        out[:] = np.log(np.abs(values) + self.epsilon)
+        self._columns[name] = out
+        return out
+
+    def column(self, name):
+        if name in self._columns:
+            return self._columns[name]
+        return self._compute(name, np.empty(len(self.core), dtype=self.dtype))
+
+    def frame(self, feature_list=None):
+        """
+        Transformed terms of feature_list (default all), as one block. New terms are
+        computed into the block and cached as views of it, so they aren't held twice.
+        """
+        if feature_list is None:
+            feature_list = self.names
+        X = np.empty((len(self.core), len(feature_list)), dtype=self.dtype)
+        for k, name in enumerate(feature_list):
+            if name in self._columns:
+                X[:, k] = self._columns[name]
+            else:
+                self._compute(name, X[:, k])
+        return pd.DataFrame(X, columns=list(feature_list), copy=False)
+
+
+def training_features(df_dataset, feature_table, epsilon, polynomial=False):
+    """
+    (X, feature_list): the log-transformed features of feature_table, or with polynomial
+    a PolynomialFeatureProvider of their log-transformed degree 2 polynomial terms, so
+    terms are only computed when they are used (see LazyChromosomeFolds)
+    """
+    feature_list_core = feature_table["feature"]
+    if polynomial:
+        provider = PolynomialFeatureProvider(df_dataset, feature_list_core, epsilon)
+        return provider, pd.Series(provider.names)
+    X = df_dataset.loc[:, feature_list_core]
+    return np.log(np.abs(X) + epsilon), feature_list_core
+
+
+def feature_frame(X):
+    """X from training_features as a DataFrame (computing every polynomial term)"""
+    if isinstance(X, PolynomialFeatureProvider):
+        return X.frame()
+    return X
+
+
+class ChromosomeFolds:
+    """
+    Leave-one-chromosome-out folds over a transformed feature matrix, built once per
+    dataset and reused across fits. Holds the integer train/test row indices of each
+    held-out chromosome and contiguous float64 copies of X and Y sliced to each fold,
+    so fitting a feature subset only takes its columns from the cached blocks.
+    Rows are positional, so df_dataset is expected to have a default RangeIndex.
+    """
+
+    def __init__(self, chromosomes, X, Y):
+        self.features = list(X.columns)
+        self.X = np.ascontiguousarray(X.to_numpy(dtype=np.float64))
+        self._column_idx = {feature: i for i, feature in enumerate(self.features)}
+        self._split(chromosomes, Y)
+        self.X_train = [self.X[idx_train] for idx_train in self.idx_train]
+        self.X_test = [self.X[idx_test] for idx_test in self.idx_test]
+
+    def _split(self, chromosomes, Y):
+        self.Y = np.asarray(Y)
+        self.chr_list, chr_codes = np.unique(
+            np.asarray(chromosomes), return_inverse=True
+        )
+        idx = np.arange(len(self.Y))
+        self.idx_train = []
+        self.idx_test = []
+        self.Y_train = []
+        if self.cross_validated:
+            for i in range(len(self.chr_list)):
+                self.idx_train.append(idx[chr_codes != i])
+                self.idx_test.append(idx[chr_codes == i])
+                self.Y_train.append(self.Y[self.idx_train[i]])
+
+    @classmethod
+    def from_dataset(cls, df_dataset, X, Y):
+        """Folds over X from training_features, lazy for polynomial terms"""
+        if isinstance(X, PolynomialFeatureProvider):
+            return LazyChromosomeFolds(df_dataset["chr"], X, Y)
+        return cls(df_dataset["chr"], X, Y)
+
+    @property
+    def cross_validated(self):
+        # a single chromosome is fit and scored on itself
+        return len(self.chr_list) > 1
+
+    def __len__(self):
+        return len(self.idx_test)
+
+    def columns(self, feature_list):
+        """Column positions of feature_list, or None if it is every column in order"""
+        cols = np.array([self._column_idx[feature] for feature in feature_list])
+        if np.array_equal(cols, np.arange(len(self.features))):
+            return None
+        return cols
+
+    def fold(self, i, feature_list=None):
+        """(X_train, Y_train, X_test) of fold i, restricted to feature_list"""
+        cols = None if feature_list is None else self.columns(feature_list)
+        if cols is None:
+            return self.X_train[i], self.Y_train[i], self.X_test[i]
+        return self.X_train[i][:, cols], self.Y_train[i], self.X_test[i][:, cols]
+
+    def rows(self, feature_list=None):
+        """X of all rows, restricted to feature_list"""
+        cols = None if feature_list is None else self.columns(feature_list)
+        return self.X if cols is None else self.X[:, cols]
+
+    def column(self, feature):
+        return self.X[:, self._column_idx[feature]]
+
+    def fingerprint(self):
+        """Hash of the features, X, Y and chromosome assignment, to key cached results"""
+        digest = hashlib.sha1()
+        digest.update(json.dumps(self.features).encode())
+        digest.update(np.ascontiguousarray(self.X).tobytes())
+        self._update_split_digest(digest)
+        return digest.hexdigest()
+
+    def _update_split_digest(self, digest):
+        digest.update(np.ascontiguousarray(self.Y, dtype=np.float64).tobytes())
+        for idx_test in self.idx_test:
+            digest.update(idx_test.tobytes())
+
+
+class LazyChromosomeFolds(ChromosomeFolds):
+    """
+    ChromosomeFolds over the terms of a PolynomialFeatureProvider. A term is only
+    computed (and cached by the provider, once for all rows) when a feature list asks
+    for it, and the requested columns are sliced to a fold's rows when the fold is fit,
+    so no per-fold copies of the terms are held.
+    """
+
+    def __init__(self, chromosomes, provider, Y):
+        self.provider = provider
+        self.features = list(provider.names)
+        self._column_idx = {feature: i for i, feature in enumerate(self.features)}
+        self._split(chromosomes, Y)
+
+    def _block(self, feature_list, idx=None):
+        feature_list = self.features if feature_list is None else list(feature_list)
+        X = np.empty((len(self.Y) if idx is None else len(idx), len(feature_list)))
+        for k, feature in enumerate(feature_list):
+            values = self.provider.column(feature)
+            X[:, k] = values if idx is None else values[idx]
+        return X
+
+    def fold(self, i, feature_list=None):
+        return (
+            self._block(feature_list, self.idx_train[i]),
+            self.Y_train[i],
+            self._block(feature_list, self.idx_test[i]),
+        )
+
+    def rows(self, feature_list=None):
+        return self._block(feature_list)
+
+    def column(self, feature):
+        return np.asarray(self.provider.column(feature), dtype=np.float64)
+
+    def fingerprint(self):
+        """Hash of the terms' definition (core features, epsilon), Y and chromosomes"""
+        digest = hashlib.sha1()
+        digest.update(json.dumps(self.features).encode())
+        digest.update(np.ascontiguousarray(self.provider.core).tobytes())
+        digest.update(f"{self.provider.epsilon!r} {self.provider.dtype}".encode())
+        self._update_split_digest(digest)
+        return digest.hexdigest()
+
+
+def _fit(model, X, Y):
+    return model.fit(X, Y)
+
+
+def _fit_mini_batches(model, X, Y, batch_size=1024, n_epochs=5):
+    # n_epochs passes of partial_fit over shuffled mini-batches of batch_size rows
+    rng = np.random.default_rng(model.random_state)
+    rows = X.iloc if isinstance(X, pd.DataFrame) else X
+    batch_size = int(batch_size)
+    for _ in range(int(n_epochs)):
+        order = rng.permutation(len(Y))
+        for start in range(0, len(Y), batch_size):
+            idx = order[start : start + batch_size]
+            model.partial_fit(rows[idx], Y[idx], classes=np.array([0, 1]))
+    return model
+
+
+# estimator: builds the unfitted sklearn model from the training params
+# fit: fit(model, X, Y, **fit_params) with the fit_params popped from the training params
+# linear: has coef_/intercept_, which can warm-start a fit and are reported as coefficients
+ModelBackend = namedtuple("ModelBackend", ["estimator", "fit", "fit_params", "linear"])
+
+# selected by the "model_backend" training param (e.g. in a model's override_params).
+# fitted models are plain sklearn estimators, so they pickle and score without this module
+MODEL_BACKENDS = {
+    "logistic_regression": ModelBackend(LogisticRegression, _fit, (), True),
+    "sgd_logistic": ModelBackend(
+        # a small constant step: the default "optimal" schedule is unstable on log features
+        partial(SGDClassifier, loss="log_loss", learning_rate="constant", eta0=0.01),
+        _fit_mini_batches,
+        ("batch_size", "n_epochs"),
+        True,
+    ),
+    "hist_gradient_boosting": ModelBackend(
+        HistGradientBoostingClassifier, _fit, (), False
+    ),
+}
+DEFAULT_MODEL_BACKEND = "logistic_regression"
+
+
+def model_backend(params):
+    name = params.get("model_backend", DEFAULT_MODEL_BACKEND)
+    if name not in MODEL_BACKENDS:
+        raise ValueError(
+            f"Unknown model_backend {name!r}, expected one of {list(MODEL_BACKENDS)}"
+        )
+    return MODEL_BACKENDS[name]
+
+
+def fit_model(X_train, Y_train, params, init=None):
+    # init = (coef, intercept) starts the solver from a previous fit instead of zero;
+    # it is ignored by backends without coefficients
+    backend = model_backend(params)
+    params = {key: val for key, val in params.items() if key != "model_backend"}
+    fit_params = {key: params.pop(key) for key in backend.fit_params if key in params}
+    model = backend.estimator(**params)
+    if init is not None and backend.linear:
+        if isinstance(model, LogisticRegression):
+            model.set_params(warm_start=True)
+        model.coef_ = np.asarray(init[0], dtype=np.float64).reshape(1, -1)
+        model.intercept_ = np.atleast_1d(np.asarray(init[1], dtype=np.float64))
+    return backend.fit(model, X_train, Y_train, **fit_params)
+
+
+def model_coefs(model):
+    """(coef, intercept) of a fitted linear model, None for other backends"""
+    if not hasattr(model, "coef_"):
+        return None
+    return model.coef_[0], model.intercept_[0]
+
+
+def fit_and_predict_fold(
+    X_train, Y_train, X_test, params, init=None, return_model=False
+):
+    model = fit_model(X_train, Y_train, params, init)
+    probs = model.predict_proba(X_test)[:, 1]  # calculate scores
+    if return_model:
+        return probs, model_coefs(model), model
+    return probs, model_coefs(model)
+
+
+def extend_coefs(fold_coefs, n_new=1):
+    """Warm start for a model with n_new more features: the new coefficients start at 0"""
+    return [
+        (
+            None
+            if fold_coef is None
+            else (np.append(fold_coef[0], np.zeros(n_new)), fold_coef[1])
+        )
+        for fold_coef in fold_coefs
+    ]
+
+
+def fit_folds(
+    folds, feature_list, params, init_coefs=None, n_workers=1, return_models=False
+):
+    """
+    Chromosome-held-out scores of feature_list (fit and scored on all rows if folds
+    has a single chromosome) and the fitted (coef, intercept) of each fold (None
+    for backends without coefficients). With return_models the fitted models are
+    returned too, as fit_fold_models would fit them if feature_list is every feature.
+    """
+    if folds.cross_validated:
+        if init_coefs is None:
+            init_coefs = [None] * len(folds)
+        results = Parallel(n_jobs=n_workers)(
+            delayed(fit_and_predict_fold)(
+                *folds.fold(i, feature_list), params, init, return_models
+            )
+            for i, init in enumerate(init_coefs)
+        )
+        scores = np.empty(len(folds.Y))
+        for idx_test, result in zip(folds.idx_test, results):
+            scores[idx_test] = result[0]
+    else:
+        X_all = folds.rows(feature_list)
+        init = None if init_coefs is None else init_coefs[0]
+        results = [
+            fit_and_predict_fold(X_all, folds.Y, X_all, params, init, return_models)
+        ]
+        scores = results[0][0]
+    fold_coefs = [result[1] for result in results]
+    if return_models:
+        return scores, fold_coefs, [result[2] for result in results]
+    return scores, fold_coefs
+
+
+def _n_held_out(folds):
+    return len(folds) if folds.cross_validated else 1
+
+
+def _held_out_block(folds, i):
+    # (X_train, Y_train, X_test, idx_train, idx_test) of fold i, or of all rows
+    # if folds isn't cross-validated
+    if folds.cross_validated:
+        return (*folds.fold(i), folds.idx_train[i], folds.idx_test[i])
+    X = folds.rows()
+    idx_all = np.arange(len(folds.Y))
+    return X, folds.Y, X, idx_all, idx_all
+
+
+def _held_out_blocks(folds):
+    # blocks are made one at a time, so lazy folds only hold one at once
+    return (_held_out_block(folds, i) for i in range(_n_held_out(folds)))
+
+
+def fit_fold_models(folds, params, n_workers=1):
+    """Models fit on every feature of folds, one per held-out chromosome"""
+    return Parallel(n_jobs=n_workers)(
+        delayed(fit_model)(X_train, Y_train, params)
+        for X_train, Y_train, _, _, _ in _held_out_blocks(folds)
+    )
+
+
+def permuted_scores(folds, params, feature, values, models=None):
+    """
+    Chromosome-held-out scores of all features of folds with feature replaced by
+    values (one per row, e.g. a permutation of its column). The cached blocks aren't
+    modified: each fold works on a copy with the replaced column. Every fold is refit
+    unless models (from fit_fold_models) are given, which then only rescore their
+    held-out rows.
+    """
+    j = folds.features.index(feature)
+    values = np.asarray(values, dtype=np.float64)
+    scores = np.empty(len(folds.Y))
+    blocks = _held_out_blocks(folds)
+    for i, (X_train, Y_train, X_test, idx_train, idx_test) in enumerate(blocks):
+        X_test = X_test.copy()
+        X_test[:, j] = values[idx_test]
+        if models is None:
+            X_train = X_train.copy()
+            X_train[:, j] = values[idx_train]
+            scores[idx_test], _ = fit_and_predict_fold(X_train, Y_train, X_test, params)
+        else:
+            scores[idx_test] = models[i].predict_proba(X_test)[:, 1]
+    return scores
+
+
+def held_out_scores(folds, params, i):
+    """Scores of the held-out rows of fold i, fit on its training rows"""
+    X_train, Y_train, X_test, _, _ = _held_out_block(folds, i)
+    return fit_model(X_train, Y_train, params).predict_proba(X_test)[:, 1]
+
+
+SweepResult = namedtuple("SweepResult", ["rung", "n_folds", "aupr"])
+
+
+def successive_halving(folds, configs, eta=3, min_folds=2, seed=0, n_workers=1):
+    """
+    Successive halving over configs (training params): every config is scored on
+    min_folds held-out chromosomes, the best 1/eta of them on eta times as many, and
+    so on until the survivors are scored with full chromosome-held-out CV. Folds are
+    added in a seeded random order, chromosomes with positives first. The held-out
+    scores of each (config, fold) pair are kept across rungs, so a rung only fits the
+    folds it adds. Returns one SweepResult per config, for the last rung it reached.
+    """
+    n_folds = _n_held_out(folds)
+    order = np.random.default_rng(seed).permutation(n_folds)
+    if folds.cross_validated:
+        has_pos = np.array([folds.Y[idx].any() for idx in folds.idx_test])[order]
+        order = np.concatenate([order[has_pos], order[~has_pos]])
+        labels = [folds.Y[folds.idx_test[i]] for i in order]
+    else:
+        labels = [folds.Y]
+
+    results = [None] * len(configs)
+    fold_scores = {}  # (config, fold) -> held-out scores
+    alive = list(range(len(configs)))
+    n_used = min(min_folds, n_folds)
+    rung = 0
+    with Parallel(n_jobs=n_workers) as parallel:
+        while True:
+            pairs = [
+                (k, i)
+                for k in alive
+                for i in order[:n_used]
+                if (k, i) not in fold_scores
+            ]
+            new_scores = parallel(
+                delayed(held_out_scores)(folds, configs[k], i) for k, i in pairs
+            )
+            fold_scores.update(zip(pairs, new_scores))
+            y_true = np.concatenate(labels[:n_used])
+            for k in alive:
+                scores = np.concatenate([fold_scores[k, i] for i in order[:n_used]])
+                results[k] = SweepResult(rung, n_used, PRCurve(y_true, scores).aupr)
+            if n_used == n_folds:
+                return results
+            # ties go to the earlier config
+            ranked = sorted(alive, key=lambda k: -results[k].aupr)
+            alive = sorted(ranked[: int(np.ceil(len(alive) / eta))])
+            fold_scores = {
+                (k, i): scores for (k, i), scores in fold_scores.items() if k in alive
+            }
+            n_used = n_folds if len(alive) == 1 else min(n_used * eta, n_folds)
+            rung += 1
+
+
 # assumes necessary features are present in X and Y, features are already transformed
-def train_and_predict_once(df_dataset, X, Y, feature_list, model_name, params):
-    X = X.loc[:, feature_list]
-    idx = np.arange(len(Y))  # number of elements
-
-    chr_list = np.unique(df_dataset["chr"])
-    if len(chr_list) > 1:
-        for chr in chr_list:
-            idx_test = df_dataset[df_dataset["chr"] == chr].index.values
-            if len(idx_test) > 0:
-                idx_train = np.delete(idx, idx_test)
-                X_test = X.loc[idx_test, :]
-                X_train = X.loc[idx_train, :]
-                Y_train = Y[idx_train]
-                model = LogisticRegression(**params).fit(X_train, Y_train)
-                probs = model.predict_proba(X_test)  # calculate scores
-                df_dataset.loc[idx_test, model_name + ".Score"] = probs[:, 1]
+# with n_workers > 1 the held-out chromosome folds are fit in parallel processes; each fold's
+# fit doesn't depend on the others, so scores are the same for any n_workers.
+# pass folds (a ChromosomeFolds over X) to reuse the fold blocks across calls.
+# init_coefs (one (coef, intercept) per fold, in feature_list order) warm-starts each fold's fit;
+# with return_coefs the fitted per-fold coefficients are returned too, e.g. to warm-start the next call.
+# with a score_store (ScoreStore) the scores are stored there instead of as a df_dataset column
+def train_and_predict_once(
+    df_dataset,
+    X,
+    Y,
+    feature_list,
+    model_name,
+    params,
+    n_workers=1,
+    folds=None,
+    init_coefs=None,
+    return_coefs=False,
+    score_store=None,
+):
+    if folds is None:
+        if not isinstance(X, PolynomialFeatureProvider):
+            X = X.loc[:, feature_list]
+        folds = ChromosomeFolds.from_dataset(df_dataset, X, Y)
+
+    scores, fold_coefs = fit_folds(folds, feature_list, params, init_coefs, n_workers)
+    if score_store is None:
+        df_dataset[model_name + ".Score"] = scores
     else:
-        model = LogisticRegression(**params).fit(X, Y)
-        probs = model.predict_proba(X)  # calculate scores
-        df_dataset.loc[:, model_name + ".Score"] = probs[:, 1]
+        score_store[model_name + ".Score"] = scores
 
+    if return_coefs:
+        return df_dataset, fold_coefs
     return df_dataset
+
+
+CandidateResult = namedtuple(
+    "CandidateResult", ["scores", "aupr", "precision", "fold_coefs"]
+)
+
+
+def evaluate_candidate(folds, feature_list, params, init_coefs=None, keep_scores=True):
+    scores, fold_coefs = fit_folds(folds, feature_list, params, init_coefs)
+    curve = PRCurve(folds.Y, scores)
+    return CandidateResult(
+        scores=scores if keep_scores else None,
+        aupr=curve.aupr,
+        precision=curve.precision_at_threshold(curve.threshold_at_recall(0.7)),
+        fold_coefs=fold_coefs,
+    )
+
+
+def evaluate_candidates(
+    folds, candidates, params, n_workers=1, init_coefs=None, journal=None, keys=None
+):
+    """
+    Score every candidate feature list of a selection round with chromosome-held-out
+    CV, n_workers candidates at a time in parallel processes. Returns one
+    CandidateResult per candidate, in order, with the scores kept as arrays.
+    With a CheckpointJournal, candidates already recorded under their key are not
+    refit and new results are recorded as they complete; scores are then not kept.
+    """
+    if journal is None:
+        return Parallel(n_jobs=n_workers)(
+            delayed(evaluate_candidate)(folds, feature_list, params, init_coefs)
+            for feature_list in candidates
+        )
+    results = run_journaled(
+        [
+            (
+                key,
+                delayed(evaluate_candidate)(
+                    folds, feature_list, params, init_coefs, keep_scores=False
+                ),
+            )
+            for key, feature_list in zip(keys, candidates)
+        ],
+        journal,
+        n_workers,
+    )
+    return [CandidateResult(*results[key]) for key in keys]
+
+
+def select_best_candidate(results):
+    # ties go to the last candidate, as in the serial SFFS/SBFS loops
+    best_k = -1
+    best_aupr = 0
+    for k, result in enumerate(results):
+        if result.aupr >= best_aupr:
+            best_aupr = result.aupr
+            best_k = k
+    return best_k
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class CheckpointJournal:
+    """
+    Append-only JSON-lines record of completed work items, so a killed job resumes
+    where it stopped. The first line holds the run's config (inputs, parameters); an
+    existing journal written with a different config is discarded. Each further line
+    is one {"key": ..., "value": ...} record, written and flushed as work completes.
+    A truncated last line from an interrupted write is ignored. With path=None
+    nothing is written and the journal only lives in memory.
+    """
+
+    def __init__(self, path, config=None):
+        self.path = path
+        self.config = json.loads(json.dumps(config, default=_to_json))
+        self._records = {}
+        if path is None:
+            return
+        if os.path.exists(path):
+            self._load()
+        if self._records:
+            print(f"Resuming from {path}: {len(self._records)} completed")
+            self._file = open(path, "a")
+            if not self._complete_last_line:
+                self._file.write("\n")
+        else:
+            self._file = open(path, "w")
+            self._write({"config": self.config})
+
+    def _load(self):
+        with open(self.path) as f:
+            content = f.read()
+        self._complete_last_line = content.endswith("\n")
+        lines = content.split("\n")
+        try:
+            header = json.loads(lines[0])
+        except json.JSONDecodeError:
+            return
+        if header.get("config") != self.config:
+            print(f"{self.path} was written for a different run, starting over")
+            return
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self._records[record["key"]] = record["value"]
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, default=_to_json) + "\n")
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def __getitem__(self, key):
+        return self._records[key]
+
+    def __len__(self):
+        return len(self._records)
+
+    def record(self, items):
+        """Store (key, value) pairs and flush them to disk"""
+        for key, value in items:
+            value = json.loads(json.dumps(value, default=_to_json))
+            self._records[key] = value
+            if self.path is not None:
+                self._write({"key": key, "value": value})
+        if self.path is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def compact(self, keys):
+        """Drop the records of every key not in keys, rewriting the journal without them"""
+        keys = set(keys)
+        self._records = {k: v for k, v in self._records.items() if k in keys}
+        if self.path is None:
+            return
+        self._file.close()
+        self._file = open(self.path + ".tmp", "w")
+        self._write({"config": self.config})
+        for key, value in self._records.items():
+            self._write({"key": key, "value": value})
+        self._file.close()
+        os.replace(self.path + ".tmp", self.path)
+        self._file = open(self.path, "a")
+
+    def close(self):
+        if self.path is not None:
+            self._file.close()
+
+
+def run_journaled(tasks, journal, n_workers=1, chunk_size=None, keep=None):
+    """
+    Run the (key, joblib.delayed call) tasks whose key is not yet in journal, n_workers
+    at a time in parallel processes, recording the results every chunk_size tasks
+    (default 4 per worker). Results must be JSON-serializable (numpy scalars and arrays
+    become floats and lists). Returns {key: result} for every task. With keep, tasks
+    return (result, extra): only result is recorded, and keep(key, result, extra) is
+    called for each task run here, e.g. to hold on to arrays too large to record.
+    """
+    pending = [(key, task) for key, task in tasks if key not in journal]
+    if chunk_size is None:
+        chunk_size = 4 * max(n_workers, 1)
+    with Parallel(n_jobs=n_workers) as parallel:
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start : start + chunk_size]
+            keys = [key for key, _ in chunk]
+            results = parallel(task for _, task in chunk)
+            if keep is not None:
+                for key, (result, extra) in zip(keys, results):
+                    keep(key, result, extra)
+                results = [result for result, _ in results]
+            journal.record(zip(keys, results))
+    return {key: journal[key] for key, _ in tasks}